@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from accounts.cache import user_cache
+from accounts.revocation import revocation_store
+
+User = get_user_model()
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+        The claims are signed, the only query left on an authenticated
+        request is the lookup of the user. The user is resolved through
+        the in-process cache, every save of a user bumps its version
+        which drops the cached copy in all the processes sharing the
+        `default` cache. Tokens revoked on logout are rejected without
+        touching the database either
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+
+        if revocation_store.is_revoked(validated_token[api_settings.JTI_CLAIM]):
+            raise InvalidToken(_('Token has been revoked'))
+
+        return validated_token
+
+    def get_user(self, validated_token) -> User:
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = user_cache.get(user_id, lambda: self.load_user(user_id))
+
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return user
+
+    def load_user(self, user_id) -> User:
+        # a missing user is cached as well, a deleted user keeps
+        # failing without hitting the database on every request
+        return User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
@@ -0,0 +1,104 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+def user_version_key(user_id : int) -> str:
+    return 'user:%s:version' % user_id
+
+def get_user_version(user_id : int) -> int:
+    """
+        Version of the user row, it lives in the `default` cache. Only
+        a cache shared by the processes, e.g. memcached or redis set
+        with `CACHE_URL`, has a change made by one process seen by every
+        other one, with the default `locmemcache` each process keeps
+        serving its copy up to `AUTH_USER_CACHE_TIMEOUT`. Seeded from the
+        clock like the quiz version
+    """
+    key = user_version_key(user_id)
+
+    if (version := cache.get(key)) is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+
+    return version
+
+def bump_user_version(user_id : int) -> None:
+    try:
+        cache.incr(user_version_key(user_id))
+    except ValueError:
+        cache.add(user_version_key(user_id), time.time_ns(), None)
+
+# cached in place of a user which does not exist
+MISSING = object()
+
+class UserCache:
+    """
+        Bounded in-process LRU of the users resolved from a token,
+        an entry is served only while it is younger than `timeout`
+        seconds & was stored under the current version of the user
+    """
+
+    def __init__(self, size : int, timeout : float) -> None:
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id : int, loader : Callable):
+        version = get_user_version(user_id)
+
+        if (user := self.lookup(user_id, version)) is None:
+            user = loader()
+            self.store(user_id, version, MISSING if user is None else user)
+
+        if user is None or user is MISSING:
+            return None
+
+        return self.detach(user)
+
+    def detach(self, user):
+        """
+            A fresh instance for every request, a copy would share the
+            relations cached on the `_state` of the cached instance
+        """
+        fields = user._meta.concrete_fields
+
+        return type(user).from_db(
+            user._state.db,
+            [field.attname for field in fields],
+            [getattr(user, field.attname) for field in fields]
+        )
+
+    def lookup(self, user_id : int, version : int) -> Optional[object]:
+        with self.lock:
+            entry = self.entries.get(user_id)
+
+            if entry is None:
+                return None
+
+            entry_version, expires_at, user = entry
+
+            if entry_version != version or expires_at < time.monotonic():
+                del self.entries[user_id]
+                return None
+
+            self.entries.move_to_end(user_id)
+            return user
+
+    def store(self, user_id : int, version : int, user) -> None:
+        with self.lock:
+            self.entries[user_id] = (version, time.monotonic() + self.timeout, user)
+            self.entries.move_to_end(user_id)
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+user_cache = UserCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TIMEOUT)
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import check_password, make_password
+
+from helper.executor import release_connections
+
+class HashingPoolFull(Exception):
+    pass
+
+class HashingPool:
+    """
+        Bounded pool running the password hashers off the event loop.
+        hashlib releases the GIL while it derives a key, so threads
+        are enough to hash in parallel. Once `queue_depth` hashes are
+        waiting or running new ones are refused instead of piling up
+        behind a login storm
+    """
+
+    def __init__(self, workers : int, queue_depth : int) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hashing')
+        self.slots = threading.BoundedSemaphore(queue_depth)
+
+    async def run(self, function : Callable, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HashingPoolFull
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, function, *args)
+        finally:
+            self.slots.release()
+
+    async def check_password(self, password : str, encoded : str) -> bool:
+        return await self.run(check_password, password, encoded)
+
+    async def make_password(self, password : str) -> str:
+        return await self.run(make_password, password)
+
+    async def authenticate(self, request, credentials : Dict):
+        """
+            `authenticate` through the configured backends, which look
+            the user up, hash, upgrade an outdated hash & send the
+            `user_login_failed` signal exactly like a sync login
+        """
+        return await self.run(authenticate_in_thread, request, credentials)
+
+def authenticate_in_thread(request, credentials : Dict):
+    try:
+        return authenticate(request, **credentials)
+    finally:
+        # the hashing threads keep their connection, like the database ones
+        release_connections()
+
+hashing_pool = HashingPool(settings.AUTH_HASHING_WORKERS, settings.AUTH_HASHING_QUEUE_DEPTH)
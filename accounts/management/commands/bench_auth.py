@@ -0,0 +1,84 @@
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+
+ENDPOINTS = {
+    'sync': '/api/v1/auth/login/',
+    'async': '/api/v1/auth/async/login/',
+}
+
+def percentile(samples : List[float], fraction : float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+class Command(BaseCommand):
+    help = 'measure the login latency & the latency of the requests served during a login storm'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument(
+            '--logins', type=int, default=20,
+            help='number of concurrent logins of the storm'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='number of `auth/async/check` requests sent during the storm'
+        )
+        parser.add_argument(
+            '--mode', choices=['sync', 'async', 'both'], default='both',
+            help='login endpoint used for the storm'
+        )
+
+    def handle(self, *args, **options):
+        # the requests are served in process, like the test client does
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+
+        modes = ['sync', 'async'] if options['mode'] == 'both' else [options['mode']]
+        results = {mode: asyncio.run(self.storm(ENDPOINTS[mode], options)) for mode in modes}
+
+        self.stdout.write('%-6s %14s %14s %14s %14s' % (
+            'mode', 'login p50 ms', 'login p99 ms', 'other p50 ms', 'other p99 ms'
+        ))
+
+        for mode, result in results.items():
+            self.stdout.write('%-6s %14.1f %14.1f %14.1f %14.1f' % (
+                mode,
+                percentile(result['login'], 0.5) * 1000, percentile(result['login'], 0.99) * 1000,
+                percentile(result['other'], 0.5) * 1000, percentile(result['other'], 0.99) * 1000,
+            ))
+
+    async def storm(self, login_url : str, options : Dict) -> Dict[str, List[float]]:
+        credentials = json.dumps({'username': options['username'], 'password': options['password']})
+        client = AsyncClient()
+
+        response = await client.post(ENDPOINTS['async'], credentials, content_type='application/json')
+        if response.status_code != 200:
+            raise CommandError('Unable to log in with the given credentials')
+
+        authorization = 'Bearer %s' % response.json()['access']
+        latencies = {'login': [], 'other': []}
+
+        async def timed(kind : str, request) -> None:
+            started = time.perf_counter()
+            await request
+            latencies[kind].append(time.perf_counter() - started)
+
+        async def other_requests() -> None:
+            # a steady stream of cheap requests for the duration of the storm
+            for _ in range(options['requests']):
+                await timed('other', AsyncClient().post(
+                    '/api/v1/auth/async/check/', authorization=authorization
+                ))
+
+        await asyncio.gather(other_requests(), *[
+            timed('login', AsyncClient().post(login_url, credentials, content_type='application/json'))
+            for _ in range(options['logins'])
+        ])
+
+        return latencies
@@ -1,16 +1,16 @@
 from rest_framework.request import Request
 
-class JWTCookieApply:
-    def __init__(self, get_response):
-        self.get_response = get_response
+from helper.middleware import HybridMiddleware
 
-    def __call__(self, request : Request):
+class JWTCookieApply(HybridMiddleware):
+    """
+        Copies the `jwt` cookie into the `Authorization` header, there is
+        nothing to do once the response is ready
+    """
+    def process_request(self, request : Request) -> None:
         # A Simple work around to avoid making anymore changes
-        # to the djangorestsimple_jwt. Take the jwt token from the 
+        # to the djangorestsimple_jwt. Take the jwt token from the
         # cookie & append it in the header
 
         if httpCookie := request.COOKIES.get('jwt', False):
             request.META['HTTP_AUTHORIZATION'] = "Bearer {}".format(httpCookie)
-
-        response = self.get_response(request)
-        return response
\ No newline at end of file
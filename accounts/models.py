@@ -1,12 +1,41 @@
 from uuid import uuid4
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import ugettext_lazy as _
 
+from accounts.cache import bump_user_version
+
 # Create your models here.
 
 class User(AbstractUser):
-    slug = models.UUIDField(default=uuid4, editable=False)
+    slug = models.UUIDField(default=uuid4, editable=False, unique=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # keyset pagination of the user list
+            models.Index(fields=['date_joined', 'id']),
+        ]
+
+    def save(self, *args, **kwargs) -> None:
+        super().save(*args, **kwargs)
+        self.invalidate_cache()
+
+    def delete(self, *args, **kwargs):
+        user_id = self.pk
+        result = super().delete(*args, **kwargs)
+        self.invalidate_cache(user_id)
+        return result
+
+    def invalidate_cache(self, user_id : int = None) -> None:
+        """
+            Drop the cached copies used by the token authentication,
+            the profile, the password & the active flag all go through
+            `save`. Bumped again on commit so a request reading the old
+            row before the commit can't keep it cached
+        """
+        user_id = user_id or self.pk
+        bump_user_version(user_id)
+        transaction.on_commit(lambda: bump_user_version(user_id))
 
     def __str__(self):
         return '< %s >' % self.username
@@ -0,0 +1,129 @@
+import os
+import time
+import fcntl
+import struct
+import hashlib
+import threading
+from typing import Dict, Optional
+
+from django.conf import settings
+
+# one record per revoked token, the digest of its `jti` & its expiry
+RECORD = struct.Struct('<16sQ')
+
+def jti_digest(jti : str) -> bytes:
+    return hashlib.blake2b(str(jti).encode(), digest_size=16).digest()
+
+class RevocationStore:
+    """
+        Revoked token ids, kept in memory until the token expires.
+        Revocations are appended to a shared file of fixed size records,
+        every worker picks up the records appended by the others from
+        its last offset, so a check is a `stat` & a dict lookup. The
+        file is rewritten without the expired records once they make
+        up most of it. The file is `TOKEN_REVOCATION_FILE` unless a
+        path is given
+    """
+
+    def __init__(self, path : Optional[str] = None, compact_min : int = 1024) -> None:
+        self.given_path = path
+        self.compact_min = compact_min
+        self.revoked : Dict[bytes, int] = {}
+        self.lock = threading.Lock()
+        self.inode = None
+        self.offset = 0
+
+    @property
+    def path(self) -> str:
+        return self.given_path or settings.TOKEN_REVOCATION_FILE
+
+    def revoke(self, jti : str, exp : int) -> None:
+        if exp <= time.time():
+            return
+
+        digest = jti_digest(jti)
+
+        with self.lock:
+            handle = self.open_locked()
+
+            try:
+                handle.write(RECORD.pack(digest, int(exp)))
+                handle.flush()
+
+                self.revoked[digest] = int(exp)
+                self.sync()
+
+                if self.offset // RECORD.size > max(self.compact_min, 2 * len(self.revoked)):
+                    self.compact()
+            finally:
+                handle.close()
+
+    def open_locked(self):
+        """
+            Open the file for appending under an exclusive lock, the
+            file may have been swapped by a compaction while waiting
+            on the lock, in which case the new file is opened instead
+        """
+        while True:
+            handle = open(self.path, 'ab')
+            fcntl.flock(handle, fcntl.LOCK_EX)
+
+            try:
+                if os.fstat(handle.fileno()).st_ino == os.stat(self.path).st_ino:
+                    return handle
+            except FileNotFoundError:
+                pass
+
+            handle.close()
+
+    def is_revoked(self, jti : str) -> bool:
+        with self.lock:
+            self.sync()
+            exp = self.revoked.get(jti_digest(jti))
+
+        return exp is not None and exp > time.time()
+
+    def sync(self) -> None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.inode, self.offset = None, 0
+            return
+
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            # compacted by another worker, start over
+            self.inode, self.offset = stat.st_ino, 0
+            self.revoked = {}
+
+        if stat.st_size == self.offset:
+            return
+
+        with open(self.path, 'rb') as handle:
+            handle.seek(self.offset)
+            data = handle.read()
+
+        # a partially written record is picked up on the next sync
+        size = len(data) - len(data) % RECORD.size
+        now = time.time()
+
+        for digest, exp in RECORD.iter_unpack(data[:size]):
+            if exp > now:
+                self.revoked[digest] = exp
+
+        self.offset += size
+
+    def compact(self) -> None:
+        now = time.time()
+        self.revoked = {digest: exp for digest, exp in self.revoked.items() if exp > now}
+
+        temp_path = '%s.%s.tmp' % (self.path, os.getpid())
+
+        with open(temp_path, 'wb') as handle:
+            handle.write(b''.join(RECORD.pack(digest, exp) for digest, exp in self.revoked.items()))
+
+        os.replace(temp_path, self.path)
+
+        stat = os.stat(self.path)
+        self.inode, self.offset = stat.st_ino, stat.st_size
+
+revocation_store = RevocationStore()
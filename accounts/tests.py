@@ -1,8 +1,27 @@
-from django.test import TestCase
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from base64 import urlsafe_b64encode
+from asgiref.sync import async_to_sync
+from django.core.handlers.asgi import ASGIHandler
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_login_failed
 from rest_framework import request, status
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.cache import user_cache
+from accounts.hashing import hashing_pool
+from accounts.revocation import RECORD, RevocationStore
+from accounts.views import UserViewSet
+from helper.pagination import KeysetPagination
+from helper.utils import TestEssentials
 
 User = get_user_model()
 
@@ -14,6 +33,10 @@ class JwtAuthTest(TestCase):
         self.user = User.objects.create_user(
             username='test_user', password='password'
         )
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
 
     def test_login(self) -> None:
         response : Response = self.client.post(
@@ -37,3 +60,284 @@ class JwtAuthTest(TestCase):
         response : Response = self.client.post('api/v1/auth/logout/')
         self.assertNotIn('jwt', response.cookies)
         self.assertNotIn('refresh', response.cookies)
+
+    def test_cached_user_resolution(self) -> None:
+        self.client.post(
+            '/api/v1/auth/login/', {
+            'username': 'test_user',
+            'password': 'password'
+        }, format='json')
+
+        with self.assertNumQueries(1):
+            self.client.post('/api/v1/auth/check/')
+
+        with self.assertNumQueries(0):
+            response : Response = self.client.post('/api/v1/auth/check/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.user.first_name = 'Changed'
+        self.user.save()
+
+        with self.assertNumQueries(1):
+            response : Response = self.client.post('/api/v1/auth/check/')
+
+        self.assertEqual(response.data['user']['first_name'], 'Changed')
+
+        self.user.is_active = False
+        self.user.save()
+
+        response : Response = self.client.post('/api/v1/auth/check/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cached_user_is_detached(self) -> None:
+        user_cache.clear()
+        loads = []
+        load = lambda: loads.append(1) or User.objects.get(pk=self.user.pk)
+
+        first = user_cache.get(self.user.pk, load)
+        first._state.fields_cache['relation'] = object()
+        second = user_cache.get(self.user.pk, load)
+
+        # each call gets an instance of its own, nothing cached on one leaks
+        self.assertEqual(len(loads), 1)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.username, 'test_user')
+        self.assertNotIn('relation', second._state.fields_cache)
+
+    def test_missing_user_is_cached(self) -> None:
+        token = RefreshToken.for_user(self.user).access_token
+        self.user.delete()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer %s' % token)
+
+        with self.assertNumQueries(1):
+            response : Response = self.client.post('/api/v1/auth/check/')
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        with self.assertNumQueries(0):
+            response : Response = self.client.post('/api/v1/auth/check/')
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_revokes_tokens(self) -> None:
+        revoked_path = os.path.join(self.directory, 'revoked.bin')
+
+        with override_settings(TOKEN_REVOCATION_FILE=revoked_path):
+            self.client.post(
+                '/api/v1/auth/login/', {
+                'username': 'test_user',
+                'password': 'password'
+            }, format='json')
+
+            cookies = {name: morsel.value for name, morsel in self.client.cookies.items()}
+            self.client.post('/api/v1/auth/check/')
+
+            # the user is cached, revoking is done without a query
+            with self.assertNumQueries(0):
+                response : Response = self.client.post('/api/v1/auth/logout/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            response : Response = self.client.post(
+                '/api/v1/auth/check/', HTTP_AUTHORIZATION='Bearer %s' % cookies['jwt']
+            )
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+            response : Response = self.client.post(
+                '/api/v1/auth/refresh/', {'refresh': cookies['refresh']}, format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # the access & the refresh token, none went to the default file
+        self.assertEqual(os.path.getsize(revoked_path), 2 * RECORD.size)
+
+class AsyncAuthTest(TransactionTestCase):
+    """
+        The backends run on the hashing threads, with connections of
+        their own, the user is committed so they can read it
+    """
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username='test_user', password='password'
+        )
+
+    async def test_async_auth(self) -> None:
+        client = AsyncClient()
+        credentials = {'username': 'test_user', 'password': 'password'}
+
+        response = await client.post('/api/v1/auth/async/login/', credentials, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('jwt', response.cookies)
+        self.assertEqual(response.json()['user']['id'], str(self.user.slug))
+        tokens = response.json()
+
+        response = await client.post('/api/v1/auth/async/check/', authorization='Bearer %s' % tokens['access'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['user']['username'], 'test_user')
+
+        # the token of the cookie, applied by the middleware
+        response = await client.post('/api/v1/auth/async/check/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = await client.post(
+            '/api/v1/auth/async/refresh/', {'refresh': tokens['refresh']},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.json())
+
+        # the configured backends are run, failures are signaled like a sync login
+        failures = []
+        receiver = lambda sender, credentials, **kwargs: failures.append(credentials['username'])
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+
+        response = await client.post(
+            '/api/v1/auth/async/login/', {'username': 'test_user', 'password': 'wrong'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(failures, ['test_user'])
+
+        response = await AsyncClient().post('/api/v1/auth/async/check/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # every hashing slot taken, the login is shed instead of queued
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+
+        with mock.patch.object(hashing_pool, 'slots', slots):
+            response = await client.post('/api/v1/auth/async/login/', credentials, content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
+class RevocationStoreTest(SimpleTestCase):
+
+    def setUp(self) -> None:
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def test_shared_between_workers(self) -> None:
+        first = RevocationStore(self.path, compact_min=4)
+        second = RevocationStore(self.path, compact_min=4)
+        exp = int(time.time()) + 60
+
+        first.revoke('first', exp)
+        first.revoke('expired', int(time.time()) - 1)
+        self.assertTrue(second.is_revoked('first'))
+        self.assertFalse(second.is_revoked('expired'))
+        self.assertFalse(second.is_revoked('other'))
+
+        # the duplicates trigger a compaction, picked up by the other worker
+        for _ in range(10):
+            second.revoke('second', exp)
+
+        self.assertLess(os.path.getsize(self.path), 10 * RECORD.size)
+        self.assertTrue(first.is_revoked('first'))
+        self.assertTrue(first.is_revoked('second'))
+
+class UserListTest(TestCase):
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.admin = User.objects.create_user(
+            username='admin_user', password='password', is_staff=True
+        )
+        self.client.force_authenticate(self.admin)
+
+        for index in range(24):
+            User.objects.create_user(username='user_%d' % index, password='password')
+
+    def test_keyset_pagination(self) -> None:
+        response : Response = self.client.get('/api/v1/users/?cursor=&limit=10&count=true')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 25)
+        self.assertIsNone(response.data['previous'])
+
+        pages = [response.data]
+        while pages[-1]['next']:
+            pages.append(self.client.get(pages[-1]['next']).data)
+
+        usernames = [user['username'] for page in pages for user in page['results']]
+        self.assertEqual(len(pages), 3)
+        self.assertNotIn('count', pages[1])
+        self.assertEqual(len(usernames), 25)
+        self.assertEqual(len(set(usernames)), 25)
+
+        previous : Response = self.client.get(pages[2]['previous'])
+        self.assertEqual(previous.data['results'], pages[1]['results'])
+
+        response : Response = self.client.get('/api/v1/users/?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # well formed cursors carrying keys the columns can't hold
+        for keys in [['yesterday', 1], ['2021-01-01T00:00:00', 'one'], [None, 1], [[], {}]]:
+            cursor = urlsafe_b64encode(json.dumps({'k': keys, 'r': False}).encode()).decode()
+            response = self.client.get('/api/v1/users/?cursor=%s' % cursor)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @mock.patch.object(UserViewSet, 'export_chunk_size', 10)
+    def test_streaming_export(self) -> None:
+        response = self.client.get('/api/v1/users/?all')
+        self.assertTrue(response.streaming)
+        users = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(users), 25)
+        self.assertEqual(users[0]['username'], 'admin_user')
+
+        response = self.client.get('/api/v1/users/?all=ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['username'] for line in lines][1:3], ['user_0', 'user_1'])
+
+class UserExportAsgiTest(TransactionTestCase):
+    """
+        Served by the ASGI handler, which iterates the streamed
+        response on the event loop, the users are committed so the
+        database threads see them
+    """
+
+    def setUp(self) -> None:
+        admin = User.objects.create_user(username='admin_user', password='password', is_staff=True)
+        self.token = str(RefreshToken.for_user(admin).access_token)
+
+        for index in range(24):
+            User.objects.create_user(username='user_%d' % index, password='password')
+
+    async def request(self, path : str) -> tuple:
+        messages = []
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'all',
+            'headers': [(b'host', b'testserver'), (b'authorization', ('Bearer %s' % self.token).encode())],
+        }
+
+        async def receive() -> dict:
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message : dict) -> None:
+            messages.append(message)
+
+        await ASGIHandler()(scope, receive, send)
+        body = b''.join(message.get('body', b'') for message in messages if message['type'] == 'http.response.body')
+        return messages[0]['status'], body
+
+    @mock.patch.object(UserViewSet, 'export_chunk_size', 10)
+    def test_streaming_export(self) -> None:
+        response_status, body = async_to_sync(self.request)('/api/v1/users/')
+
+        self.assertEqual(response_status, status.HTTP_200_OK)
+        self.assertEqual(len(json.loads(body)), 25)
+
+class UserQueryPlanTest(TestCase, TestEssentials):
+
+    def test_user_lookups(self) -> None:
+        user = User.objects.create_user(username='test_user', password='password')
+        self.assertUsesIndex(User.objects.filter(slug=user.slug))
+
+        paginator = KeysetPagination()
+        paginator.keyset_fields = UserViewSet.keyset_fields
+        seek = paginator.get_seek_filter([user.date_joined, user.id], reverse=True)
+        self.assertUsesIndex(User.objects.filter(seek).order_by('-date_joined', '-id')[:10])
+
@@ -12,4 +12,7 @@ urlpatterns = [
     path('auth/logout/', views.JWTLogout.as_view(), name='token_delete'),
     path('auth/login/', views.JWTAuthLogin.as_view(), name='token_obtain_pair'),
     path('auth/refresh/', views.JWTAuthRefresh.as_view(), name='token_refresh'),
+    path('auth/async/check/', views.async_me, name='async_token_verify'),
+    path('auth/async/login/', views.async_login, name='async_token_obtain_pair'),
+    path('auth/async/refresh/', views.async_refresh, name='async_token_refresh'),
 ]
@@ -1,17 +1,32 @@
-from typing import Any, Dict
+import json
+from typing import Dict, Iterator, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import update_last_login
+from django.http import HttpRequest, JsonResponse, StreamingHttpResponse
 
 from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, ParseError, ValidationError
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.serializers import (TokenObtainPairSerializer,TokenRefreshSerializer)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import (TokenObtainPairView,TokenRefreshView)
 
+from accounts.authentication import CachedJWTAuthentication
+from accounts.hashing import HashingPoolFull, hashing_pool
 from accounts.models import User
+from accounts.revocation import revocation_store
+from helper.viewsets import KeysetPaginationMixin
 from accounts.serializer import UserSerializer
+from helper.executor import database_executor
 
 # Create your views here.
 
@@ -22,32 +37,40 @@ class LoginObtainPairSerializer(TokenObtainPairSerializer):
         data['user'] = UserSerializer(instance=self.user).data
         return data
 
+class RevocationAwareRefreshSerializer(TokenRefreshSerializer):
+
+    def validate(self, attrs) -> Dict:
+        try:
+            refresh = RefreshToken(attrs['refresh'])
+        except TokenError as error:
+            raise InvalidToken(error.args[0])
+
+        if revocation_store.is_revoked(refresh[api_settings.JTI_CLAIM]):
+            raise InvalidToken('Token has been revoked')
+
+        return super().validate(attrs)
+
+def set_token_cookies(response, data : Dict) -> None:
+    if accessToken := data.get('access'):
+        response.set_cookie('jwt', accessToken, httponly=True)
+
+    if refreshToken := data.get('refresh'):
+        response.set_cookie('refresh', refreshToken, httponly=True)
+
 class JWTAuthLogin(TokenObtainPairView):
     serializer_class = LoginObtainPairSerializer
 
     def post(self, request, *args, **kwargs) -> Response:
         response = super().post(request, *args, **kwargs)
-
-        if accessToken := response.data['access']:
-            response.set_cookie('jwt', accessToken, httponly=True)
-
-        if refreshToken := response.data['refresh']:
-            response.set_cookie('refresh', refreshToken, httponly=True)
-
+        set_token_cookies(response, response.data)
         return response
 
 class JWTAuthRefresh(TokenRefreshView):
-    serializer_class = TokenRefreshSerializer
+    serializer_class = RevocationAwareRefreshSerializer
 
     def post(self, request, *args, **kwargs) -> Response:
         response = super().post(request, *args, **kwargs)
-
-        if accessToken := response.data['access']:
-            response.set_cookie('jwt', accessToken, httponly=True)
-
-        if refreshToken := response.data['refresh']:
-            response.set_cookie('refresh', refreshToken, httponly=True)
-
+        set_token_cookies(response, response.data)
         return response
 
 class JWTAuthMe(APIView):
@@ -60,12 +83,21 @@ class JWTAuthMe(APIView):
 
 class JWTLogout(APIView):
     """
-        Need to implment a token blacklisting startegy later on
-        to invalidate tokens
+        Revoke the access token of the request & the refresh token,
+        either of them is rejected until it expires
     """
     permission_classes = [IsAuthenticated]
 
     def post(self, request: Request, *args, **kwargs) -> Response:
+        revocation_store.revoke(request.auth[api_settings.JTI_CLAIM], request.auth['exp'])
+
+        if raw_refresh := request.data.get('refresh') or request.COOKIES.get('refresh'):
+            try:
+                refresh = RefreshToken(raw_refresh)
+                revocation_store.revoke(refresh[api_settings.JTI_CLAIM], refresh['exp'])
+            except TokenError:
+                pass
+
         response = Response({
             'detail': 'logged out successfully',
         }, status=status.HTTP_200_OK)
@@ -75,13 +107,155 @@ class JWTLogout(APIView):
 
         return response
 
-class UserViewSet(ModelViewSet):
+class UserViewSet(KeysetPaginationMixin, ModelViewSet):
     queryset = User.objects.all()
     lookup_field = 'slug'
     serializer_class = UserSerializer
     pagination_class = LimitOffsetPagination
+    keyset_fields = ('date_joined', 'id')
     permission_classes = [IsAdminUser]
 
-    def paginate_queryset(self, queryset) -> Any:
-        if 'all' not in self.request.GET:
-            return super().paginate_queryset(queryset)
+    export_chunk_size = 500
+
+    def list(self, request : Request, *args, **kwargs) -> Response:
+        if 'all' not in request.GET:
+            return super().list(request, *args, **kwargs)
+
+        # stream the export instead of loading every user in memory,
+        # `?all=ndjson` yields one json document per line
+        ndjson = request.GET['all'] == 'ndjson'
+        queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+
+        return StreamingHttpResponse(
+            self.export_users(queryset, ndjson),
+            content_type='application/x-ndjson' if ndjson else 'application/json'
+        )
+
+    def export_users(self, queryset, ndjson : bool) -> Iterator[bytes]:
+        encoder = JSONEncoder(separators=(',', ':'))
+        separator, first = ('\n', '') if ndjson else (',', '[')
+        chunk = []
+
+        # under ASGI django 3.1 iterates the response on the event loop,
+        # every chunk is a query of its own run on a database thread
+        while chunk := database_executor.call(self.fetch_chunk, queryset, chunk[-1].id if chunk else None):
+            yield self.encode_chunk(encoder, chunk, first, separator)
+            first = separator
+
+        if ndjson:
+            yield b'\n' if first == separator else b''
+        else:
+            yield b'[]' if first == '[' else b']'
+
+    def fetch_chunk(self, queryset, after : Optional[int]) -> List[User]:
+        if after is not None:
+            queryset = queryset.filter(id__gt=after)
+
+        return list(queryset[:self.export_chunk_size])
+
+    def encode_chunk(self, encoder : JSONEncoder, chunk : List[User], first : str, separator : str) -> bytes:
+        data = self.get_serializer(chunk, many=True).data
+        return (first + separator.join(encoder.encode(user) for user in data)).encode()
+
+# Async versions of the auth endpoints, served without blocking the event
+# loop under ASGI. Plain django views, DRF views are always run in a thread
+
+def async_auth_view(view):
+    """
+        `csrf_exempt` wraps the view in a sync function which would hide
+        the coroutine from django, the flag is set on the view instead
+    """
+    async def wrapped_view(request : HttpRequest) -> JsonResponse:
+        if request.method != 'POST':
+            return JsonResponse(
+                {'detail': 'Method "%s" not allowed.' % request.method},
+                status=status.HTTP_405_METHOD_NOT_ALLOWED
+            )
+
+        try:
+            return await view(request)
+        except APIException as error:
+            detail = error.detail if isinstance(error.detail, dict) else {'detail': error.detail}
+            return JsonResponse(detail, status=error.status_code)
+
+    wrapped_view.csrf_exempt = True
+    return wrapped_view
+
+def request_data(request : HttpRequest) -> Dict:
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        raise ParseError
+
+    if not isinstance(data, dict):
+        raise ParseError
+
+    return data
+
+@async_auth_view
+async def async_login(request : HttpRequest) -> JsonResponse:
+    data = request_data(request)
+    errors = {
+        field: ['This field is required.'] for field in (User.USERNAME_FIELD, 'password')
+        if not data.get(field)
+    }
+
+    if errors:
+        raise ValidationError(errors)
+
+    try:
+        user = await hashing_pool.authenticate(request, {
+            User.USERNAME_FIELD: data[User.USERNAME_FIELD], 'password': data['password'],
+        })
+    except HashingPoolFull:
+        response = JsonResponse(
+            {'detail': 'Too many logins in progress, try again shortly.'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        response['Retry-After'] = '1'
+        return response
+
+    if user is None or not user.is_active:
+        return JsonResponse(
+            {'detail': 'No active account found with the given credentials'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    if api_settings.UPDATE_LAST_LOGIN:
+        await sync_to_async(update_last_login)(None, user)
+
+    refresh = RefreshToken.for_user(user)
+    data = {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+        'user': UserSerializer(instance=user).data,
+    }
+
+    response = JsonResponse(data)
+    set_token_cookies(response, data)
+    return response
+
+@async_auth_view
+async def async_refresh(request : HttpRequest) -> JsonResponse:
+    # signing the tokens is cheap, there is nothing to offload
+    serializer = RevocationAwareRefreshSerializer(data=request_data(request))
+
+    try:
+        serializer.is_valid(raise_exception=True)
+    except TokenError as error:
+        raise InvalidToken(error.args[0])
+
+    response = JsonResponse(serializer.validated_data)
+    set_token_cookies(response, serializer.validated_data)
+    return response
+
+@async_auth_view
+async def async_me(request : HttpRequest) -> JsonResponse:
+    # the user usually comes from the cache, a miss is queried in a thread
+    authenticated = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+
+    if authenticated is None:
+        raise NotAuthenticated
+
+    user, _ = authenticated
+    return JsonResponse({'user': UserSerializer(instance=user).data})
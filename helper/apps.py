@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class HelperConfig(AppConfig):
     name = 'helper'
+
+    def ready(self) -> None:
+        from django.db.backends.signals import connection_created
+        from helper.instrumentation import install_recorder
+
+        connection_created.connect(install_recorder, dispatch_uid='helper.install_recorder')
@@ -0,0 +1,444 @@
+import io
+import csv
+import json
+import math
+import time
+import random
+import tracemalloc
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import AsyncClient, Client, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.cache import user_cache
+from quiz.models import Question, QuestionSolution, Quiz, TakenQuiz
+
+User = get_user_model()
+
+# quizzes : quizzes listed besides the benchmark quiz, each with a few questions
+# questions : questions of the benchmark quiz
+# participants : attempts of the benchmark quiz, each answers every question
+SCALES = {
+    'tiny': {'quizzes': 20, 'questions': 100, 'participants': 20, 'iterations': 3},
+    'small': {'quizzes': 200, 'questions': 100, 'participants': 1000, 'iterations': 20},
+    'full': {'quizzes': 2000, 'questions': 100, 'participants': 10000, 'iterations': 50},
+}
+
+PASSWORD = 'benchmark-password'
+
+# budgets of the endpoints, written by `benchmark --update`
+BASELINE_PATH = settings.BASE_DIR / 'benchmarks' / 'baseline.json'
+
+class BenchmarkError(Exception):
+    """
+        A request of a scenario did not get its expected status, the
+        timings of a failing endpoint mean nothing
+    """
+
+class Fixture:
+    """
+        Data seeded for a benchmark run, `new_user` & `new_quiz` give
+        the writes of every iteration rows of their own
+    """
+
+    def __init__(self, scale : str) -> None:
+        self.scale = scale
+        self.counter = 0
+        self.password_hash = make_password(PASSWORD)
+
+    def next_name(self, prefix : str) -> str:
+        self.counter += 1
+        return 'bench-%s-%d' % (prefix, self.counter)
+
+    def new_user(self) -> User:
+        username = self.next_name('user')
+        return User.objects.create(
+            username=username, email='%s@example.com' % username,
+            first_name='Bench', last_name='User', password=self.password_hash,
+        )
+
+    def new_quiz(self, questions : int = 5) -> Quiz:
+        now = timezone.now()
+        quiz = Quiz.objects.create(
+            name=self.next_name('quiz'), description='benchmark quiz', time_per_question=10,
+            schedule_date=now - timedelta(days=1),
+            end_date=now + timedelta(days=2),
+            created_by=self.admin, updated_by=self.admin,
+        )
+        Question.objects.bulk_create([
+            Question(
+                quiz=quiz, question_text='question %d' % index,
+                question_type='mcq', answer='abc'[index % 3],
+            )
+            for index in range(questions)
+        ])
+        return quiz
+
+    def new_question(self) -> Question:
+        return Question.objects.create(
+            quiz=self.spare_quiz, question_text=self.next_name('question'),
+            question_type='mcq', answer='a',
+        )
+
+    def answers(self) -> List[Dict]:
+        return [
+            {'question': str(slug), 'answer': random.choice('abc')}
+            for slug in self.question_slugs
+        ]
+
+def seed(scale : str, stdout : Optional[io.TextIOBase] = None) -> Fixture:
+    """
+        Seed the database with the volumes of `scale`, the rows are
+        written with `bulk_create` & the denormalised stats & score
+        buckets are rebuilt once from them at the end
+    """
+    sizes = SCALES[scale]
+    fixture = Fixture(scale)
+    rng = random.Random(scale)
+    now = timezone.now()
+
+    fixture.admin = User.objects.create(
+        username='bench-admin', email='bench-admin@example.com', password=fixture.password_hash,
+        is_staff=True, is_superuser=True,
+    )
+
+    statuses = [
+        (now - timedelta(days=1), now + timedelta(days=1)),
+        (now + timedelta(days=1), now + timedelta(days=2)),
+        (now - timedelta(days=2), now - timedelta(days=1)),
+    ]
+    Quiz.objects.bulk_create([
+        Quiz(
+            name='bench-listed-%d' % index, description='listed quiz %d' % index,
+            time_per_question=10, schedule_date=statuses[index % 3][0], end_date=statuses[index % 3][1],
+            created_by=fixture.admin, updated_by=fixture.admin,
+        )
+        for index in range(sizes['quizzes'])
+    ], batch_size=500)
+    Question.objects.bulk_create([
+        Question(quiz=quiz, question_text='question %d' % index, question_type='mcq', answer='abc'[index % 3])
+        for quiz in Quiz.objects.filter(name__startswith='bench-listed-') for index in range(5)
+    ], batch_size=1000)
+
+    fixture.quiz = fixture.new_quiz(sizes['questions'])
+    fixture.spare_quiz = fixture.new_quiz(5)
+    questions = list(fixture.quiz.question_set.order_by('id'))
+    fixture.question_slugs = [question.slug for question in questions]
+
+    User.objects.bulk_create([
+        User(
+            username='bench-participant-%d' % index, email='bench-participant-%d@example.com' % index,
+            first_name='Bench', last_name='Participant', password=fixture.password_hash,
+        )
+        for index in range(sizes['participants'])
+    ], batch_size=500)
+    user_ids = list(User.objects.filter(username__startswith='bench-participant-').values_list('id', flat=True))
+
+    # attempts are written a batch of participants at a time, sqlite
+    # does not return the ids of bulk created rows so they are read back
+    batch = max(1, 5000 // len(questions))
+
+    for start in range(0, len(user_ids), batch):
+        chunk = user_ids[start:start + batch]
+        answers = {user_id: [rng.choice('abc') for _ in questions] for user_id in chunk}
+
+        TakenQuiz.objects.bulk_create([
+            TakenQuiz(
+                quiz=fixture.quiz, user_id=user_id,
+                score=sum(answer == question.answer for answer, question in zip(answers[user_id], questions)),
+            )
+            for user_id in chunk
+        ])
+        attempts = TakenQuiz.objects.filter(quiz=fixture.quiz, user_id__in=chunk).values_list('user_id', 'id')
+
+        QuestionSolution.objects.bulk_create([
+            QuestionSolution(
+                taken_quiz_id=attempt_id, question=question,
+                answer=answer, is_correct=answer == question.answer,
+            )
+            for user_id, attempt_id in attempts
+            for answer, question in zip(answers[user_id], questions)
+        ], batch_size=5000)
+
+    output = stdout or io.StringIO()
+    call_command('rebuild_question_stats', stdout=output)
+    call_command('rebuild_leaderboards', stdout=output)
+
+    fixture.participant = User.objects.get(id=user_ids[0]) if user_ids else fixture.new_user()
+    return fixture
+
+class Scenario:
+    """
+        A request replayed for every iteration, `build` returns the
+        keyword arguments of the request & runs before the clock starts
+    """
+
+    def __init__(self, name : str, method : str, build : Callable, expect : int = 200, asynchronous : bool = False) -> None:
+        self.name = name
+        self.method = method
+        self.build = build
+        self.expect = expect
+        self.asynchronous = asynchronous
+
+def scenarios(fixture : Fixture) -> List[Scenario]:
+    """
+        Every endpoint of `accounts.urls` & `quiz.urls`, the reads run
+        before the writes which may invalidate their caches
+    """
+    quiz = lambda name, **kwargs: reverse('api:quizzes-%s' % name, kwargs={'slug': fixture.quiz.slug}, **kwargs)
+    question = lambda: reverse('api:question-detail', kwargs={'slug': fixture.question_slugs[0]})
+    login = lambda: {'data': {'username': fixture.participant.username, 'password': PASSWORD}}
+    refresh = lambda: {'data': {'refresh': str(RefreshToken.for_user(fixture.participant))}}
+
+    def conditional() -> Dict:
+        response = Client().get(quiz('detail'), **{'HTTP_AUTHORIZATION': bearer(fixture.participant)})
+        return {'path': quiz('detail'), 'user': fixture.participant, 'headers': {'If-None-Match': response['ETag']}}
+
+    def import_file() -> Dict:
+        rows = io.StringIO()
+        writer = csv.writer(rows)
+        writer.writerow(['question_text', 'question_type', 'answer'])
+        writer.writerows(['imported %d' % index, 'mcq', 'abc'[index % 3]] for index in range(100))
+
+        upload = io.BytesIO(rows.getvalue().encode())
+        upload.name = 'questions.csv'
+        return {
+            'path': reverse('api:quizzes-import-questions', kwargs={'slug': fixture.new_quiz(0).slug}),
+            'user': fixture.admin, 'data': {'file': upload}, 'format': 'multipart',
+        }
+
+    def new_quiz() -> Dict:
+        return {'path': reverse('api:quizzes-list'), 'user': fixture.admin, 'data': {
+            'name': fixture.next_name('created'), 'description': 'created quiz', 'time_per_question': 10,
+            'schedule_date': timezone.now().isoformat(), 'end_date': (timezone.now() + timedelta(days=1)).isoformat(),
+            'questions': [
+                {'question_text': 'question %d' % index, 'question_type': 'mcq', 'answer': 'a'}
+                for index in range(10)
+            ],
+        }}
+
+    def new_user() -> Dict:
+        username = fixture.next_name('signup')
+        return {'path': reverse('api:user-list'), 'user': fixture.admin, 'data': {
+            'username': username, 'email': '%s@example.com' % username,
+            'first_name': 'Bench', 'last_name': 'Signup', 'password': PASSWORD,
+        }}
+
+    def submit(name : str) -> Callable:
+        return lambda: {'path': quiz(name), 'user': fixture.new_user(), 'data': {'answers': fixture.answers()}}
+
+    def async_path(name : str, slug : Callable) -> Callable:
+        return lambda: reverse('api:%s' % name, kwargs={'slug': slug()})
+
+    quiz_slug = lambda: fixture.quiz.slug
+    user = lambda path, who='participant', **kwargs: lambda: {'path': path() if callable(path) else path, 'user': getattr(fixture, who), **kwargs}
+
+    return [
+        Scenario('api root', 'get', user(reverse('api:api-root'))),
+        Scenario('users list', 'get', user(reverse('api:user-list'), 'admin')),
+        Scenario('users keyset page', 'get', user(reverse('api:user-list') + '?cursor=&limit=50', 'admin')),
+        Scenario('users export', 'get', user(reverse('api:user-list') + '?all=ndjson', 'admin')),
+        Scenario('user retrieve', 'get', user(lambda: reverse('api:user-detail', kwargs={'slug': fixture.participant.slug}), 'admin')),
+        Scenario('auth check', 'post', user(reverse('api:token_verify'))),
+        Scenario('auth login', 'post', lambda: {'path': reverse('api:token_obtain_pair'), **login()}),
+        Scenario('auth refresh', 'post', lambda: {'path': reverse('api:token_refresh'), **refresh()}),
+        Scenario('async auth check', 'post', user(reverse('api:async_token_verify')), asynchronous=True),
+        Scenario('async auth login', 'post', lambda: {'path': reverse('api:async_token_obtain_pair'), **login()}, asynchronous=True),
+        Scenario('async auth refresh', 'post', lambda: {'path': reverse('api:async_token_refresh'), **refresh()}, asynchronous=True),
+
+        Scenario('quizzes list', 'get', user(reverse('api:quizzes-list'))),
+        Scenario('quizzes keyset page', 'get', user(reverse('api:quizzes-list') + '?cursor=&limit=50')),
+        Scenario('quizzes live', 'get', user(reverse('api:quizzes-list') + '?status=live')),
+        Scenario('quiz retrieve', 'get', user(lambda: quiz('detail'))),
+        Scenario('quiz retrieve admin', 'get', user(lambda: quiz('detail'), 'admin')),
+        Scenario('quiz retrieve not modified', 'get', conditional, expect=304),
+        Scenario('question retrieve', 'get', user(question, 'admin')),
+        Scenario('quiz leaderboard', 'get', user(lambda: quiz('leaderboard') + '?limit=100')),
+        Scenario('quiz my rank', 'get', user(lambda: quiz('my-rank'))),
+        Scenario('quiz user answers', 'get', user(lambda: quiz('user-answers'))),
+        Scenario('quiz analytics', 'get', user(lambda: quiz('analytics'), 'admin')),
+        Scenario('async quiz retrieve', 'get', user(async_path('async-quizzes-detail', quiz_slug)), asynchronous=True),
+        Scenario('async question retrieve', 'get', user(async_path('async-question-detail', lambda: fixture.question_slugs[0]), 'admin'), asynchronous=True),
+        Scenario('async quiz user answers', 'get', user(async_path('async-quizzes-user-answers', quiz_slug)), asynchronous=True),
+
+        Scenario('quiz submit', 'post', submit('user-submit')),
+        Scenario('async quiz submit', 'post', lambda: {**submit('user-submit')(), 'path': async_path('async-quizzes-user-submit', quiz_slug)()}, asynchronous=True),
+        Scenario('quiz publish', 'post', user(lambda: quiz('publish'), 'admin')),
+        Scenario('quiz create', 'post', new_quiz, expect=201),
+        Scenario('quiz update', 'patch', user(lambda: reverse('api:quizzes-detail', kwargs={'slug': fixture.spare_quiz.slug}), 'admin', data={'description': 'updated'})),
+        Scenario('quiz import questions', 'post', import_file),
+        Scenario('question create', 'post', user(reverse('api:question-list'), 'admin', data={
+            'quiz': str(fixture.spare_quiz.slug), 'question_text': 'created question', 'question_type': 'mcq', 'answer': 'b',
+        }), expect=201),
+        Scenario('question update', 'patch', lambda: {
+            'path': reverse('api:question-detail', kwargs={'slug': fixture.new_question().slug}),
+            'user': fixture.admin, 'data': {'question_text': 'updated question'},
+        }),
+        Scenario('question delete', 'delete', lambda: {
+            'path': reverse('api:question-detail', kwargs={'slug': fixture.new_question().slug}), 'user': fixture.admin,
+        }, expect=204),
+        Scenario('quiz delete', 'delete', lambda: {
+            'path': reverse('api:quizzes-detail', kwargs={'slug': fixture.new_quiz().slug}), 'user': fixture.admin,
+        }, expect=204),
+        Scenario('user create', 'post', new_user, expect=201),
+        Scenario('user update', 'patch', lambda: {
+            'path': reverse('api:user-detail', kwargs={'slug': fixture.new_user().slug}),
+            'user': fixture.admin, 'data': {'first_name': 'Updated'},
+        }),
+        Scenario('user delete', 'delete', lambda: {
+            'path': reverse('api:user-detail', kwargs={'slug': fixture.new_user().slug}), 'user': fixture.admin,
+        }, expect=204),
+        Scenario('auth logout', 'post', lambda: {'path': reverse('api:token_delete'), 'user': fixture.new_user()}),
+    ]
+
+def bearer(user : User) -> str:
+    # a token per request, the logout scenario revokes its own
+    return 'Bearer %s' % RefreshToken.for_user(user).access_token
+
+def percentile(values : List[float], fraction : float) -> float:
+    # nearest rank, exact on the few samples of a benchmark
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def send(scenario : Scenario, request : Dict):
+    path = request.pop('path')
+    user = request.pop('user', None)
+    headers = request.pop('headers', {})
+    data = request.pop('data', None)
+    format = request.pop('format', 'json')
+
+    if scenario.asynchronous:
+        # the async client reads the headers from lowercase keywords
+        extra = {name.lower().replace('-', '_'): value for name, value in headers.items()}
+
+        if user is not None:
+            extra['authorization'] = bearer(user)
+
+        client = AsyncClient()
+    else:
+        extra = {'HTTP_%s' % name.upper().replace('-', '_'): value for name, value in headers.items()}
+
+        if user is not None:
+            extra['HTTP_AUTHORIZATION'] = bearer(user)
+
+        client = Client()
+
+    if format == 'multipart':
+        kwargs = {'data': data}
+    elif scenario.method == 'get':
+        kwargs = {}
+    else:
+        # the api only parses json, even the requests without a body
+        kwargs = {'data': json.dumps(data or {}), 'content_type': 'application/json'}
+
+    method = getattr(client, scenario.method)
+
+    started = time.perf_counter()
+
+    if scenario.asynchronous:
+        response = async_to_sync(method)(path, **kwargs, **extra)
+    else:
+        response = method(path, **kwargs, **extra)
+
+    # a streamed response is only produced as it is consumed
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    elapsed = time.perf_counter() - started
+
+    if response.status_code != scenario.expect:
+        raise BenchmarkError('%s: %s %s answered %d instead of %d: %s' % (
+            scenario.name, scenario.method.upper(), path, response.status_code, scenario.expect, content[:500]
+        ))
+
+    return path, elapsed, query_count(response)
+
+def query_count(response) -> int:
+    # `Server-Timing: db;dur=X;desc="N queries", total;dur=Y`
+    timing = response.get('Server-Timing', '')
+    return int(timing.split('desc="', 1)[1].split(' ', 1)[0]) if 'desc="' in timing else 0
+
+@override_settings(SQL_INSTRUMENTATION=True, ASYNC_DB_WORKERS=0, PROFILE_ROUTES={}, METRICS_DIR='', QUIZ_SUBMISSION_MODE='sync')
+def run(fixture : Fixture, iterations : int, only : Optional[str] = None) -> Dict:
+    """
+        Replay every scenario `iterations` times & once more under
+        `tracemalloc` for its peak memory. The caches are emptied before
+        each scenario, its query count is the one of a cold request
+    """
+    results = {}
+
+    for scenario in scenarios(fixture):
+        if only and only not in scenario.name:
+            continue
+
+        cache.clear()
+        user_cache.clear()
+        timings, queries = [], []
+
+        for _ in range(iterations):
+            path, elapsed, count = send(scenario, scenario.build())
+            timings.append(elapsed * 1000)
+            queries.append(count)
+
+        request = scenario.build()
+        tracemalloc.start()
+
+        try:
+            path, _, count = send(scenario, request)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        queries.append(count)
+        results[scenario.name] = {
+            'route': resolve(path.split('?', 1)[0]).url_name,
+            'method': scenario.method.upper(),
+            'requests': len(timings),
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'queries': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    return results
+
+def check_budgets(results : Dict, baseline : Dict, tolerance : Optional[float]) -> List[str]:
+    """
+        Violations of the budgets stored in `baseline`, a scenario may
+        not run more queries than its baseline nor, unless `tolerance`
+        is None, be slower at p95 by more than `tolerance` of it
+    """
+    violations = []
+
+    for name, result in results.items():
+        if (budget := baseline.get('scenarios', {}).get(name)) is None:
+            continue
+
+        if result['queries'] > budget['queries']:
+            violations.append('%s: %d queries, the budget is %d' % (name, result['queries'], budget['queries']))
+
+        if tolerance is None:
+            continue
+
+        # a millisecond of slack, the timer noise of the fastest endpoints
+        limit = budget['p95_ms'] * (1 + tolerance) + 1
+
+        if result['p95_ms'] > limit:
+            violations.append('%s: p95 of %.2fms, the budget is %.2fms' % (name, result['p95_ms'], limit))
+
+    return violations
+
+def load_baseline(path=BASELINE_PATH) -> Dict:
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return {}
@@ -0,0 +1,66 @@
+import time
+import threading
+from uuid import uuid4
+from typing import Any, Callable
+
+from django.core.cache import cache
+
+# striped locks, coalesce concurrent misses of the same key within a process
+_LOCK_STRIPES = [threading.Lock() for _ in range(64)]
+
+_MISSING = object()
+
+def read_through(key : str, builder : Callable[[], Any], timeout : int,
+        lock_timeout : int = 10, wait : float = 5.0) -> Any:
+    """
+        Return the cached value of `key`, building & caching it on a
+        miss. Concurrent misses are coalesced, threads of a process
+        wait on a striped lock & other processes wait on a lock key
+        in the shared cache, so a single request rebuilds the value.
+        If the builder holding the lock takes more than `wait` seconds
+        the waiting request gives up & builds the value itself.
+    """
+    if (value := cache.get(key, _MISSING)) is not _MISSING:
+        return value
+
+    stripe = _LOCK_STRIPES[hash(key) % len(_LOCK_STRIPES)]
+    lock_key = '%s:lock' % key
+
+    with stripe:
+        if (value := cache.get(key, _MISSING)) is not _MISSING:
+            return value
+
+        token = uuid4().hex
+
+        if cache.add(lock_key, token, lock_timeout):
+            try:
+                return build(key, builder, timeout)
+            finally:
+                release_lock(lock_key, token)
+
+    # another process is building it, waited for without holding the
+    # stripe, which would also stall the other keys sharing it
+    deadline = time.monotonic() + wait
+
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+
+        if (value := cache.get(key, _MISSING)) is not _MISSING:
+            return value
+
+    with stripe:
+        if (value := cache.get(key, _MISSING)) is not _MISSING:
+            return value
+
+        return build(key, builder, timeout)
+
+def build(key : str, builder : Callable[[], Any], timeout : int) -> Any:
+    value = builder()
+    cache.set(key, value, timeout)
+    return value
+
+def release_lock(lock_key : str, token : str) -> None:
+    # a lock which expired mid build may have been taken by another
+    # process since, only the lock of this build is removed
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
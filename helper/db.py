@@ -0,0 +1,89 @@
+import time
+import random
+import functools
+from contextvars import ContextVar, Token
+from typing import Callable
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+from helper.middleware import HybridMiddleware
+
+# set for the duration of a request which may read from a replica
+reads_from_replica : ContextVar[bool] = ContextVar('reads_from_replica', default=False)
+
+class ReplicaRouter:
+    """
+        Sends the reads of safe requests to one of the
+        `DATABASE_REPLICAS`, everything else goes to the primary.
+        Reads made within a transaction stay on the primary
+    """
+
+    def db_for_read(self, model, **hints) -> str:
+        if not settings.DATABASE_REPLICAS or not reads_from_replica.get():
+            return DEFAULT_DB_ALIAS
+
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints) -> str:
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        # the replicas hold the same rows as the primary
+        return True
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    """
+        Lets the safe requests read from the replicas, a successful
+        unsafe request sets a cookie pinning the user to the primary
+        for `REPLICA_STICKY_SECONDS` so the user reads its own writes
+    """
+    cookie_name = 'read_primary'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def process_request(self, request) -> Token:
+        return reads_from_replica.set(self.may_read_from_replica(request))
+
+    def process_finally(self, request, token : Token) -> None:
+        reads_from_replica.reset(token)
+
+    def may_read_from_replica(self, request) -> bool:
+        return request.method in self.safe_methods and self.cookie_name not in request.COOKIES
+
+    def process_response(self, request, response, token : Token):
+        if request.method not in self.safe_methods and response.status_code < 400:
+            response.set_cookie(
+                self.cookie_name, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax'
+            )
+
+        return response
+
+def retry_on_locked(function : Callable) -> Callable:
+    """
+        Retry a write transaction failing with "database is locked" on
+        sqlite, up to `DATABASE_LOCK_RETRIES` times after a random
+        exponential backoff, so the writers racing for the lock spread
+        out. Calls nested in a transaction are not retried, the outer
+        transaction is rolled back as a whole
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        connection = connections[DEFAULT_DB_ALIAS]
+
+        if connection.vendor != 'sqlite' or connection.in_atomic_block:
+            return function(*args, **kwargs)
+
+        for attempt in range(settings.DATABASE_LOCK_RETRIES + 1):
+            try:
+                return function(*args, **kwargs)
+            except OperationalError as error:
+                if 'locked' not in str(error) or attempt == settings.DATABASE_LOCK_RETRIES:
+                    raise
+
+            time.sleep(random.uniform(0, settings.DATABASE_LOCK_RETRY_DELAY * 2 ** attempt))
+
+    return wrapper
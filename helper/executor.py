@@ -0,0 +1,133 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import MethodNotAllowed
+
+from helper.profiling import profiled
+
+class DatabaseExecutor:
+    """
+        Bounded pool of threads for the blocking database work of the
+        async views. Without it every sync call of an ASGI worker is
+        run on one shared thread, with it `ASYNC_DB_WORKERS` requests
+        query at once while the event loop keeps accepting others.
+        Every thread owns its connection & keeps it open from one task
+        to the next, the pool bounds the number of connections
+    """
+
+    def __init__(self) -> None:
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get_executor(self, workers : int) -> ThreadPoolExecutor:
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='database')
+
+        return self.executor
+
+    async def run(self, function : Callable, *args, **kwargs):
+        # the profile of the request, if any, follows the work
+        function = profiled(function)
+
+        if not settings.ASYNC_DB_WORKERS:
+            # inline mode, the work is run on the thread of the sync views
+            return await sync_to_async(function)(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+
+        return await loop.run_in_executor(
+            self.get_executor(settings.ASYNC_DB_WORKERS),
+            functools.partial(context.run, self.task, function, *args, **kwargs)
+        )
+
+    def call(self, function : Callable, *args, **kwargs):
+        """
+            Blocking counterpart of `run` for sync code which may end up
+            running on the event loop, like the iterator of a streamed
+            response under ASGI, where a query would be refused. Called
+            on the loop `function` is run on a database thread & waited
+            for, anywhere else it is called in place
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return function(*args, **kwargs)
+
+        context = contextvars.copy_context()
+        future = self.get_executor(max(settings.ASYNC_DB_WORKERS, 1)).submit(
+            context.run, self.task, profiled(function), *args, **kwargs
+        )
+        return future.result()
+
+    def task(self, function : Callable, *args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        finally:
+            release_connections()
+
+def release_connections() -> None:
+    """
+        Keep the connections of the thread for its next task, only
+        the ones left broken or inside a transaction are closed
+    """
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+
+        if connection.get_autocommit() != connection.settings_dict['AUTOCOMMIT']:
+            connection.close()
+        elif connection.errors_occurred:
+            if connection.is_usable():
+                connection.errors_occurred = False
+            else:
+                connection.close()
+
+database_executor = DatabaseExecutor()
+
+def async_action(viewset : type, method : str, action : str) -> Callable:
+    """
+        Serve `action` of `viewset` from the decorated coroutine, which
+        is called with the view & the DRF request once the checks of
+        the action passed. The view is set up as `as_view` would, its
+        authentication, permission & throttle checks are run on the
+        database executor, the coroutine only offloads its own blocking
+        calls with `database_executor.run`, the rest runs on the loop
+    """
+    def decorator(handler : Callable) -> Callable:
+        async def wrapped_view(request, *args, **kwargs):
+            view = viewset(action_map={method: action}, args=args, kwargs=kwargs)
+            view.format_kwarg = None
+            view.headers = view.default_response_headers
+            request = view.request = view.initialize_request(request, *args, **kwargs)
+
+            try:
+                if request.method.lower() != method:
+                    raise MethodNotAllowed(request.method)
+
+                await database_executor.run(view.initial, request, *args, **kwargs)
+                response = await handler(view, request, *args, **kwargs)
+            except Exception as error:
+                response = view.handle_exception(error)
+
+            response = view.finalize_response(request, response, *args, **kwargs)
+
+            if hasattr(response, 'render'):
+                response.render()
+
+            return response
+
+        # `csrf_exempt` would hide the coroutine from django, DRF views
+        # are exempted anyway & rely on their authentication instead
+        wrapped_view.csrf_exempt = True
+        return wrapped_view
+
+    return decorator
@@ -0,0 +1,133 @@
+import time
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from helper.middleware import HybridMiddleware
+
+logger = logging.getLogger('summachar.sql')
+
+class QueryStats:
+    """
+        Queries of a single request, only the count & the time of each
+        statement are recorded, the slow ones are kept to be explained
+        once the response is ready
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.slow : List[tuple] = []
+
+    def record(self, alias : str, sql : str, params, duration : float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements[sql] += 1
+
+        if duration * 1000 >= settings.SQL_SLOW_QUERY_MS:
+            self.slow.append((alias, sql, params, duration))
+
+    def repeated(self) -> List[tuple]:
+        # the same statement run again & again with other parameters,
+        # the signature of a lookup made in a loop instead of a join
+        return [
+            (sql, count) for sql, count in self.statements.items()
+            if count >= settings.SQL_REPEATED_QUERY_THRESHOLD
+        ]
+
+# statistics of the request being served, shared with the database
+# threads of the async views through the copied context
+request_queries : ContextVar[Optional[QueryStats]] = ContextVar('request_queries', default=None)
+
+class QueryRecorder:
+    """
+        Execute wrapper installed on every connection, it costs a
+        context lookup when no request is being instrumented
+    """
+
+    def __init__(self, alias : str) -> None:
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        if (stats := request_queries.get()) is None:
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats.record(self.alias, sql, params, time.perf_counter() - started)
+
+def install_recorder(sender, connection, **kwargs) -> None:
+    """
+        `connection_created` receiver, the wrappers of a connection
+        outlive its reconnections so the recorder is only added once
+    """
+    if not any(isinstance(wrapper, QueryRecorder) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(QueryRecorder(connection.alias))
+
+def explain(alias : str, sql : str, params) -> str:
+    connection = connections[alias]
+
+    with connection.cursor() as cursor:
+        cursor.execute(connection.ops.explain_query_prefix() + ' ' + sql, params)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+class QueryInstrumentationMiddleware(HybridMiddleware):
+    """
+        Counts the queries & the database time of every request, sent
+        back in a `Server-Timing` header. Statements repeated within a
+        request are logged as a likely N+1 & the statements slower than
+        `SQL_SLOW_QUERY_MS` are logged along with their query plan
+    """
+    def process_request(self, request) -> Optional[tuple]:
+        if not settings.SQL_INSTRUMENTATION:
+            return None
+
+        stats = QueryStats()
+        return stats, request_queries.set(stats), time.perf_counter()
+
+    def process_finally(self, request, state : tuple) -> None:
+        request_queries.reset(state[1])
+
+    async def aprocess_response(self, request, response, state : tuple):
+        if state[0].slow:
+            # the slow queries are explained, off the event loop
+            return await sync_to_async(self.process_response)(request, response, state)
+
+        return self.process_response(request, response, state)
+
+    def process_response(self, request, response, state : tuple):
+        stats, token, started = state
+        response['Server-Timing'] = 'db;dur=%.2f;desc="%d queries", total;dur=%.2f' % (
+            stats.duration * 1000, stats.count, (time.perf_counter() - started) * 1000
+        )
+
+        for sql, count in stats.repeated():
+            logger.warning('%s %s ran %d times: %s', request.method, request.path, count, sql)
+
+        for alias, sql, params, slow_duration in stats.slow:
+            plan = ''
+
+            # only the reads are explained
+            if sql.lstrip()[:6].upper() == 'SELECT':
+                try:
+                    plan = explain(alias, sql, params)
+                except Exception as error:
+                    plan = 'EXPLAIN failed: %s' % error
+
+            # the parameters are left out, they hold the emails, the
+            # password hashes & the tokens of the users
+            logger.warning(
+                'slow query of %s %s, %.1fms on %s: %s\n%s',
+                request.method, request.path, slow_duration * 1000, alias, sql, plan
+            )
+
+        return response
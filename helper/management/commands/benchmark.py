@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+
+from helper.benchmarks import BASELINE_PATH, SCALES, check_budgets, load_baseline, run, seed
+
+class Command(BaseCommand):
+    help = 'benchmark every endpoint against a seeded throwaway database & check the stored budgets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', choices=list(SCALES), default='full',
+            help='volumes of the seeded data'
+        )
+        parser.add_argument(
+            '--iterations', type=int, default=None,
+            help='requests per endpoint, defaults to the one of the scale'
+        )
+        parser.add_argument(
+            '--only', default=None,
+            help='only run the scenarios whose name contains this'
+        )
+        parser.add_argument(
+            '--baseline', default=str(BASELINE_PATH),
+            help='json file of the query & latency budgets'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help='fraction by which the p95 latency may exceed its budget'
+        )
+        parser.add_argument(
+            '--output', default=None,
+            help='also write the results to this json file'
+        )
+        parser.add_argument(
+            '--update', action='store_true',
+            help='store the results as the new baseline instead of checking them'
+        )
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        iterations = options['iterations'] or SCALES[scale]['iterations']
+
+        if options['verbosity'] < 2:
+            # the repeated statements of the submissions are known, their
+            # warnings would bury the results
+            logging.getLogger('summachar.sql').setLevel(logging.ERROR)
+
+        # the benchmark runs against a test database, whatever is
+        # configured is left untouched
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+
+        try:
+            started = time.perf_counter()
+            fixture = seed(scale, self.stdout if options['verbosity'] > 1 else None)
+            self.stdout.write('seeded the %s scale in %.1fs' % (scale, time.perf_counter() - started))
+
+            results = run(fixture, iterations, options['only'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'scale': scale,
+            'iterations': iterations,
+            'engine': settings.DATABASES['default']['ENGINE'],
+            'scenarios': results,
+        }
+
+        for name, result in results.items():
+            self.stdout.write('%-28s %-6s p50 %8.2fms  p95 %8.2fms  p99 %8.2fms  %3d queries  %9.1fKiB' % (
+                name, result['method'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['queries'], result['peak_memory_kb'],
+            ))
+
+        if options['output']:
+            self.write(options['output'], report)
+
+        if options['update']:
+            self.write(options['baseline'], report)
+            self.stdout.write(self.style.SUCCESS('Stored the baseline in %s' % options['baseline']))
+            return
+
+        baseline = load_baseline(options['baseline'])
+
+        if not baseline:
+            raise CommandError('no baseline at %s, store one with --update' % options['baseline'])
+
+        # latencies only compare at the scale they were measured at
+        tolerance = options['tolerance'] if baseline.get('scale') == scale else None
+        violations = check_budgets(results, baseline, tolerance)
+
+        if violations:
+            raise CommandError('budgets exceeded:\n%s' % '\n'.join(violations))
+
+        self.stdout.write(self.style.SUCCESS('All the endpoints are within their budgets!'))
+
+    def write(self, path : str, report : dict) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with open(path, 'w') as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+            handle.write('\n')
@@ -0,0 +1,349 @@
+import os
+import json
+import time
+import fcntl
+import weakref
+import threading
+from glob import glob
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from helper.middleware import HybridMiddleware
+
+# name : (type, help, buckets)
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Requests served, by route, method & status code.', None
+    ),
+    'http_requests_in_flight': (
+        'gauge', 'Requests being served, by method.', None
+    ),
+    'http_request_duration_seconds': (
+        'histogram', 'Latency of the requests, by route & method.',
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    ),
+    'http_request_size_bytes': (
+        'histogram', 'Size of the request bodies, by route & method.',
+        (100, 1000, 10000, 100000, 1000000)
+    ),
+    'http_response_size_bytes': (
+        'histogram', 'Size of the response bodies, by route & method.',
+        (100, 1000, 10000, 100000, 1000000)
+    ),
+}
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+class ShardOwner:
+    """
+        Held by the thread local of a thread, collected along with it
+    """
+    __slots__ = ('__weakref__',)
+
+class Registry:
+    """
+        Metrics of the process, every thread records into a shard of
+        its own so recording takes no lock, the shards are only summed
+        when the metrics are scraped & the shard of a finished thread
+        is folded into the retired totals. With `METRICS_DIR` set, each
+        process also writes its totals to a file of its own, at most
+        every `METRICS_FLUSH_INTERVAL` seconds, & a scrape sums the
+        files of all the workers
+    """
+    RETIRED_FILE = 'metrics-retired.json'
+
+    def __init__(self) -> None:
+        self.local = threading.local()
+        self.shards : List[Dict[Key, list]] = []
+        self.retired : Dict[Key, list] = {}
+        self.shards_lock = threading.Lock()
+        self.flushed_at = 0.0
+        self.process = None
+
+    @property
+    def shard(self) -> Dict[Key, list]:
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = {}
+            self.local.owner = ShardOwner()
+
+            with self.shards_lock:
+                self.shards.append(shard)
+
+            weakref.finalize(self.local.owner, self.retire, shard)
+            return shard
+
+    def retire(self, shard : Dict[Key, list]) -> None:
+        with self.shards_lock:
+            self.shards = [other for other in self.shards if other is not shard]
+
+            for key, values in shard.items():
+                merge(self.retired, key, list(values))
+
+    def values(self, name : str, labels : Tuple) -> list:
+        key = (name, labels)
+
+        if (values := self.shard.get(key)) is None:
+            buckets = METRICS[name][2]
+            # a counter or a gauge is a single value, a histogram
+            # holds its bucket counts followed by the sum & the count
+            values = self.shard[key] = [0] * (len(buckets) + 2 if buckets else 1)
+
+        return values
+
+    def inc(self, name : str, labels : Tuple, amount : float = 1) -> None:
+        self.values(name, labels)[0] += amount
+
+    def observe(self, name : str, labels : Tuple, value : float) -> None:
+        values = self.values(name, labels)
+        buckets = METRICS[name][2]
+
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                values[index] += 1
+                break
+
+        values[-2] += value
+        values[-1] += 1
+
+    def collect(self) -> Dict[Key, list]:
+        with self.shards_lock:
+            shards = list(self.shards)
+            totals = {key: list(values) for key, values in self.retired.items()}
+
+        for shard in shards:
+            # copied at once, the owning thread keeps recording
+            for key, values in list(shard.items()):
+                merge(totals, key, list(values))
+
+        return totals
+
+    def process_key(self) -> str:
+        """
+            The pid along with the start time of the process, the file
+            of a dead worker is never taken over by a reused pid
+        """
+        if self.process is None or self.process[0] != os.getpid():
+            pid = os.getpid()
+            self.process = (pid, '%d-%s' % (pid, process_started(pid) or time.time_ns()))
+
+        return self.process[1]
+
+    def flush(self, force : bool = False) -> None:
+        if not settings.METRICS_DIR:
+            return
+
+        now = time.monotonic()
+
+        if not force and now - self.flushed_at < settings.METRICS_FLUSH_INTERVAL:
+            return
+
+        self.flushed_at = now
+        path = os.path.join(settings.METRICS_DIR, 'metrics-%s.json' % self.process_key())
+        write_rows(path, self.collect())
+
+    def collect_all(self) -> Dict[Key, list]:
+        """
+            Totals of every worker, counters & histograms of workers
+            which exited are kept, their in flight requests are not
+        """
+        if not settings.METRICS_DIR:
+            return self.collect()
+
+        self.flush(force=True)
+        self.retire_dead_workers()
+        totals = {}
+
+        with open(os.path.join(settings.METRICS_DIR, 'metrics.lock'), 'a') as lock:
+            # a file folded into the retired one by a concurrent scrape
+            # would be counted twice, or not at all
+            fcntl.flock(lock, fcntl.LOCK_SH)
+
+            for path in glob(os.path.join(settings.METRICS_DIR, 'metrics-*.json')):
+                for key, values in read_rows(path).items():
+                    merge(totals, key, values)
+
+        return totals
+
+    def retire_dead_workers(self) -> None:
+        """
+            Fold the files of the workers which exited into the retired
+            file, without their gauges, & remove them. Concurrent scrapes
+            of the other workers wait on the lock
+        """
+        retired_path = os.path.join(settings.METRICS_DIR, self.RETIRED_FILE)
+
+        with open(os.path.join(settings.METRICS_DIR, 'metrics.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            dead = [
+                path for path in glob(os.path.join(settings.METRICS_DIR, 'metrics-*.json'))
+                if path != retired_path and not worker_alive(os.path.basename(path)[8:-5])
+            ]
+
+            if not dead:
+                return
+
+            totals = read_rows(retired_path)
+
+            for path in dead:
+                for key, values in read_rows(path).items():
+                    if METRICS[key[0]][0] != 'gauge':
+                        merge(totals, key, values)
+
+            write_rows(retired_path, totals)
+
+            for path in dead:
+                os.remove(path)
+
+def read_rows(path : str) -> Dict[Key, list]:
+    try:
+        with open(path) as handle:
+            rows = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+    return {(name, tuple(tuple(label) for label in labels)): values for name, labels, values in rows}
+
+def write_rows(path : str, totals : Dict[Key, list]) -> None:
+    temp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+
+    with open(temp_path, 'w') as handle:
+        json.dump([[name, labels, values] for (name, labels), values in totals.items()], handle)
+
+    os.replace(temp_path, path)
+
+def merge(totals : Dict[Key, list], key : Key, values : list) -> None:
+    if (current := totals.get(key)) is None:
+        totals[key] = values
+        return
+
+    for index, value in enumerate(values):
+        current[index] += value
+
+def process_alive(pid : int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+def process_started(pid : int) -> Optional[str]:
+    """
+        Start time of a process in clock ticks since boot, where the
+        platform exposes it
+    """
+    try:
+        with open('/proc/%d/stat' % pid) as handle:
+            # the command may contain spaces, the fields follow its `)`
+            return handle.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+def worker_alive(key : str) -> bool:
+    pid, _, started = key.partition('-')
+
+    try:
+        pid = int(pid)
+    except ValueError:
+        return False
+
+    if not process_alive(pid):
+        return False
+
+    # without a start time to compare with a live pid is taken as the worker
+    current = process_started(pid)
+    return current is None or not started.isdigit() or current == started
+
+def format_labels(labels : Tuple, extra : Optional[Tuple] = None) -> str:
+    pairs = labels + ((extra,) if extra else ())
+
+    if not pairs:
+        return ''
+
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in pairs
+    )
+
+def exposition(totals : Dict[Key, list]) -> str:
+    """
+        Totals in the Prometheus text format
+    """
+    lines = []
+
+    for name, (kind, description, buckets) in METRICS.items():
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s %s' % (name, kind))
+
+        for (metric, labels), values in sorted(totals.items()):
+            if metric != name:
+                continue
+
+            if kind != 'histogram':
+                lines.append('%s%s %s' % (name, format_labels(labels), values[0]))
+                continue
+
+            cumulative = 0
+
+            for bound, count in zip(buckets, values):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (name, format_labels(labels, ('le', bound)), cumulative))
+
+            lines.append('%s_bucket%s %d' % (name, format_labels(labels, ('le', '+Inf')), values[-1]))
+            lines.append('%s_sum%s %s' % (name, format_labels(labels), values[-2]))
+            lines.append('%s_count%s %d' % (name, format_labels(labels), values[-1]))
+
+    return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+        Records the metrics of every request. The route is the name of
+        the resolved url within the `api` namespace, so the requests of
+        a viewset action share their labels whatever the object
+    """
+    def process_request(self, request) -> float:
+        registry.inc('http_requests_in_flight', (('method', request.method),))
+        return time.perf_counter()
+
+    def process_finally(self, request, started : float) -> None:
+        registry.inc('http_requests_in_flight', (('method', request.method),), -1)
+
+    def route(self, request) -> str:
+        match = getattr(request, 'resolver_match', None)
+
+        if match is None:
+            return 'unmatched'
+
+        if 'api' not in match.namespaces:
+            return 'other'
+
+        return match.url_name or 'other'
+
+    def content_length(self, request) -> int:
+        # the header is sent by the client, whatever it holds
+        try:
+            return max(0, int(request.META.get('CONTENT_LENGTH') or 0))
+        except ValueError:
+            return 0
+
+    def process_response(self, request, response, started : float):
+        labels = (('route', self.route(request)), ('method', request.method))
+
+        registry.inc('http_requests_total', labels + (('status', str(response.status_code)),))
+        registry.observe('http_request_duration_seconds', labels, time.perf_counter() - started)
+        registry.observe('http_request_size_bytes', labels, self.content_length(request))
+
+        # the size of a streamed response is not known upfront
+        if not response.streaming:
+            registry.observe('http_response_size_bytes', labels, len(response.content))
+
+        registry.flush()
+        return response
@@ -0,0 +1,69 @@
+import asyncio
+from typing import Any
+
+class HybridMiddleware:
+    """
+        Base of the middlewares served natively in both modes, the async
+        views are served without switching threads under ASGI, unlike
+        with `MiddlewareMixin`. The subclasses implement the hooks:
+
+        `process_request(request)` returns the state of the request,
+        `None` skips the other hooks for this request.
+        `process_finally(request, state)` runs once the response is
+        ready or the view raised, to release what the request holds.
+        `process_response(request, response, state)` returns the
+        response sent back.
+
+        `aprocess_request` & `aprocess_response` are their async
+        counterparts, they run the sync hooks on the event loop unless
+        overridden
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+        if asyncio.iscoroutinefunction(get_response):
+            # mark the instance as a coroutine function, like MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if (state := self.process_request(request)) is None:
+            return self.get_response(request)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            self.process_finally(request, state)
+
+        return self.process_response(request, response, state)
+
+    async def __acall__(self, request):
+        if (state := await self.aprocess_request(request)) is None:
+            return await self.get_response(request)
+
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.process_finally(request, state)
+
+        return await self.aprocess_response(request, response, state)
+
+    def process_request(self, request) -> Any:
+        return None
+
+    async def aprocess_request(self, request) -> Any:
+        return self.process_request(request)
+
+    def process_finally(self, request, state : Any) -> None:
+        pass
+
+    def process_response(self, request, response, state : Any):
+        return response
+
+    async def aprocess_response(self, request, response, state : Any):
+        return self.process_response(request, response, state)
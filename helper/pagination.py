@@ -0,0 +1,171 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+class KeysetPagination(BasePagination):
+    """
+        Cursor pagination over a unique tuple of columns, `(created_at, id)`
+        by default. Every page is a range seek on that tuple instead of an
+        `OFFSET`, so the n-th page costs the same as the first one given
+        an index on the columns. The total count is only computed when
+        asked for with `?count=true`.
+
+        Cursors are opaque to clients, they encode the keys of the last
+        (or first) row of the current page & the direction to move in.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+    page_size = 10
+    max_page_size = 1000
+    keyset_fields = ('created_at', 'id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset : QuerySet, request, view=None) -> List:
+        self.request = request
+        self.keyset_fields = getattr(view, 'keyset_fields', self.keyset_fields)
+        self.page_size = self.get_page_size(request)
+        self.count = queryset.count() if self.get_count_requested(request) else None
+
+        keys, reverse = self.decode_cursor(request, queryset)
+
+        if keys is not None:
+            queryset = queryset.filter(self.get_seek_filter(keys, reverse))
+
+        ordering = [('-%s' if reverse else '%s') % field for field in self.keyset_fields]
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = keys is not None, has_more
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_count_requested(self, request) -> bool:
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def get_seek_filter(self, keys : List[Any], reverse : bool) -> Q:
+        """
+            Row value comparison `(a, b) > (x, y)` expanded into
+            `a >= x AND (a > x OR (a = x AND b > y))`, the redundant
+            bound on the leading column lets the planner turn it
+            into a range seek of the composite index
+        """
+        lookup = 'lt' if reverse else 'gt'
+        seek = Q()
+
+        for position, field in enumerate(self.keyset_fields):
+            equal = {name: keys[index] for index, name in enumerate(self.keyset_fields[:position])}
+            seek |= Q(**equal, **{'%s__%s' % (field, lookup): keys[position]})
+
+        return Q(**{'%s__%se' % (self.keyset_fields[0], lookup): keys[0]}) & seek
+
+    def encode_cursor(self, row : Any, reverse : bool) -> str:
+        keys = [getattr(row, field) for field in self.keyset_fields]
+        payload = json.dumps({
+            'k': [key.isoformat() if hasattr(key, 'isoformat') else key for key in keys],
+            'r': reverse,
+        }, separators=(',', ':'))
+
+        cursor = urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+        # the total is only counted for the page it was asked on
+        url = remove_query_param(self.request.build_absolute_uri(), self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, queryset : QuerySet) -> Tuple[Optional[List[Any]], bool]:
+        cursor = request.query_params.get(self.cursor_query_param, '')
+
+        if not cursor:
+            return None, False
+
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            keys, reverse = payload['k'], bool(payload['r'])
+
+            if not isinstance(keys, list) or len(keys) != len(self.keyset_fields):
+                raise ValueError
+
+            # a forged cursor is rejected here rather than by the database
+            keys = [
+                self.get_keyset_field(queryset, name).to_python(key)
+                for name, key in zip(self.keyset_fields, keys)
+            ]
+        except (BinasciiError, ValidationError, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if None in keys:
+            raise NotFound(self.invalid_cursor_message)
+
+        return keys, reverse
+
+    def get_keyset_field(self, queryset : QuerySet, name : str):
+        opts = queryset.model._meta
+        return opts.pk if name == 'pk' else opts.get_field(name)
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self) -> Optional[str]:
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data) -> Response:
+        response = [
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]
+
+        if self.count is not None:
+            response.insert(0, ('count', self.count))
+
+        return Response(OrderedDict(response))
+
+    def get_schema_operation_parameters(self, view) -> List:
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'schema': {'type': 'boolean'},
+            },
+        ]
@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import time
+import random
+import functools
+import pstats
+import cProfile
+import marshal
+import threading
+import contextvars
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, List, Optional
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+from helper.middleware import HybridMiddleware
+
+class StackSampler:
+    """
+        Statistical profiler of the threads serving a request, their
+        stacks are sampled every `interval` seconds from a background
+        thread, the request itself runs at full speed
+    """
+
+    def __init__(self, interval : float) -> None:
+        self.interval = interval
+        self.thread_ids = set()
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                stack = []
+
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+
+                if stack:
+                    self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self) -> bytes:
+        # one `frame;frame;frame count` line per stack, as read by flamegraph.pl
+        return ''.join('%s %d\n' % item for item in self.stacks.most_common()).encode()
+
+class ProfileRing:
+    """
+        The last `size` profiles on disk, a profile is a json file of
+        metadata next to its dump, the oldest ones are removed as new
+        ones are stored
+    """
+    FORMATS = {'collapsed': 'collapsed', 'pstats': 'prof'}
+
+    def __init__(self, directory : str, size : int) -> None:
+        self.directory = directory
+        self.size = size
+
+    def save(self, meta : Dict, format : str, data : bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, meta['id'])
+
+        with open('%s.%s' % (path, self.FORMATS[format]), 'wb') as handle:
+            handle.write(data)
+
+        # the metadata is written last, a listed profile always has its dump
+        with open('%s.json' % path, 'w') as handle:
+            json.dump(meta, handle)
+
+        for stale in self.list()[self.size:]:
+            for suffix in ['json', *self.FORMATS.values()]:
+                try:
+                    os.remove(os.path.join(self.directory, '%s.%s' % (stale['id'], suffix)))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> List[Dict]:
+        profiles = []
+
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return profiles
+
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+
+            try:
+                with open(os.path.join(self.directory, name)) as handle:
+                    profiles.append(json.load(handle))
+            except (OSError, ValueError):
+                continue
+
+        return sorted(profiles, key=lambda meta: meta['created_at'], reverse=True)
+
+    def load(self, profile_id : str) -> Optional[tuple]:
+        for meta in self.list():
+            if meta['id'] == profile_id:
+                path = os.path.join(self.directory, '%s.%s' % (profile_id, self.FORMATS[meta['format']]))
+
+                with open(path, 'rb') as handle:
+                    return meta, handle.read()
+
+        return None
+
+def get_ring() -> ProfileRing:
+    return ProfileRing(settings.PROFILE_DIR, settings.PROFILE_RING_SIZE)
+
+class RequestProfile:
+    """
+        Profile of one request, attached to each thread for as long as
+        it runs a part of the request. A thread is only ever profiled
+        while it works for the request, the dump merges all of them
+    """
+
+    def __init__(self, format : str) -> None:
+        self.format = format
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.profilers = []
+        self.data : Optional[bytes] = None
+        self.sampler = StackSampler(settings.PROFILE_SAMPLE_INTERVAL)
+
+        if format == 'collapsed':
+            self.sampler.start()
+
+    @contextmanager
+    def attach(self):
+        thread_id = threading.get_ident()
+
+        if thread_id in self.sampler.thread_ids:
+            # already attached further up the stack of this thread
+            yield
+            return
+
+        self.sampler.thread_ids.add(thread_id)
+        # a `cProfile.Profile` only ever sees the thread enabling it
+        profiler = cProfile.Profile() if self.format == 'pstats' else None
+
+        try:
+            if profiler is not None:
+                profiler.enable()
+
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+                with self.lock:
+                    self.profilers.append(profiler)
+
+            self.sampler.thread_ids.discard(thread_id)
+
+    def stop(self) -> bytes:
+        if self.format == 'collapsed':
+            self.sampler.stop()
+            return self.sampler.collapsed()
+
+        with self.lock:
+            profilers = [profiler for profiler in self.profilers if profiler.getstats()]
+
+        # the format of `pstats.Stats` dump files
+        return marshal.dumps(pstats.Stats(*profilers).stats if profilers else {})
+
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+def profiled(function : Callable) -> Callable:
+    """
+        Run `function` with the profile of the current request, if any,
+        attached to the thread it runs on. The sync work of an async
+        request is run through this wherever it is offloaded
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if (profile := current_profile.get()) is None:
+            return function(*args, **kwargs)
+
+        with profile.attach():
+            return function(*args, **kwargs)
+
+    return wrapper
+
+class ProfilingMiddleware(HybridMiddleware):
+    """
+        Profiles a request on demand. A superuser asks for it with the
+        `X-Profile` header, `sample` for a statistical sample of the
+        stacks or `cprofile` for a deterministic profile, & the routes
+        of `PROFILE_ROUTES` are sampled at their rate. The id of the
+        stored profile is sent back in `X-Profile-Id`.
+
+        Only the threads working for the request are profiled. Under
+        WSGI it is the thread of the request. Under ASGI the event loop
+        is shared by every request, the profile is attached to the work
+        offloaded with `profiled`, i.e. the database executor of the
+        async views, sync views served under ASGI are not profiled
+    """
+    header = 'HTTP_X_PROFILE'
+
+    def process_request(self, request) -> Optional[tuple]:
+        requested = request.META.get(self.header) is not None and self.is_superuser(request)
+
+        if (format := self.requested_format(request, requested)) is None:
+            return None
+
+        profile = RequestProfile(format)
+        # left by `process_finally`, once the view is done
+        attached = ExitStack()
+        attached.enter_context(profile.attach())
+        return profile, attached.close
+
+    async def aprocess_request(self, request) -> Optional[tuple]:
+        requested = request.META.get(self.header) is not None and await sync_to_async(self.is_superuser)(request)
+
+        if (format := self.requested_format(request, requested)) is None:
+            return None
+
+        profile = RequestProfile(format)
+        token = current_profile.set(profile)
+        return profile, functools.partial(current_profile.reset, token)
+
+    def process_finally(self, request, state : tuple) -> None:
+        profile, detach = state
+        detach()
+        profile.data = profile.stop()
+
+    def process_response(self, request, response, state : tuple):
+        profile, detach = state
+        meta = {
+            'id': uuid4().hex,
+            'format': profile.format,
+            'method': request.method,
+            'path': request.path,
+            'route': self.route(request),
+            'status': response.status_code,
+            'duration': time.perf_counter() - profile.started,
+            'created_at': time.time(),
+        }
+
+        get_ring().save(meta, profile.format, profile.data)
+        response['X-Profile-Id'] = meta['id']
+        return response
+
+    def route(self, request) -> Optional[str]:
+        try:
+            return resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+
+    def requested_format(self, request, requested : bool) -> Optional[str]:
+        if requested:
+            return 'pstats' if request.META[self.header] == 'cprofile' else 'collapsed'
+
+        if not settings.PROFILE_ROUTES:
+            return None
+
+        rate = settings.PROFILE_ROUTES.get(self.route(request), 0)
+        return 'collapsed' if rate and random.random() < rate else None
+
+    def is_superuser(self, request) -> bool:
+        # resolved like DRF does, the user is usually cached
+        from accounts.authentication import CachedJWTAuthentication
+
+        try:
+            authenticated = CachedJWTAuthentication().authenticate(request)
+        except Exception:
+            return False
+
+        return authenticated is not None and authenticated[0].is_superuser
@@ -0,0 +1,35 @@
+from django.db.backends.sqlite3 import base
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+        SQLite tuned for concurrent requests. In WAL mode readers no
+        longer wait on a writer, a busy connection waits for the lock
+        instead of failing right away & write transactions take the
+        write lock with `BEGIN IMMEDIATE`. A deferred transaction only
+        asks for it on its first write, when waiting can no longer help
+        & sqlite fails with "database is locked" at once.
+
+        The pragmas can be overridden with `PRAGMAS` in the settings
+        of the database
+    """
+    default_pragmas = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        # 256 MiB mapped, 64 MiB of page cache per connection
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,
+        'temp_store': 'MEMORY',
+    }
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**self.default_pragmas, **self.settings_dict.get('PRAGMAS', {})}
+
+        for name, value in pragmas.items():
+            conn.execute('PRAGMA %s = %s' % (name, value))
+
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -1,3 +1,384 @@
-from django.test import TestCase
+import os
+import json
+import marshal
+import pstats
+import shutil
+import logging
+import tempfile
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import URLPattern, URLResolver
+
+from helper.cache import read_through
+from django.contrib.auth import get_user_model
+from helper.instrumentation import QueryInstrumentationMiddleware
+from helper.metrics import registry
+from helper.profiling import StackSampler, get_ring
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.test import APIClient
+from helper.db import ReplicaRouter, ReplicaRoutingMiddleware, retry_on_locked
+from helper.executor import database_executor
+from helper.benchmarks import check_budgets, load_baseline, run, seed
 
 # Create your tests here.
+class ReadThroughCacheTest(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_concurrent_misses_are_coalesced(self) -> None:
+        calls = []
+
+        def builder() -> dict:
+            calls.append(1)
+            time.sleep(0.1)
+            return {'payload': True}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(read_through('key', builder, 60)))
+            for _ in range(8)
+        ]
+
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'payload': True}] * 8)
+
+    def test_lock_of_another_process(self) -> None:
+        # the lock key of a build running in another process
+        cache.add('key:lock', 'other', 60)
+        stripe = hash('key') % 64
+        neighbour = next(
+            name for name in ('key-%d' % index for index in range(10000))
+            if hash(name) % 64 == stripe
+        )
+
+        results = []
+        waiting = threading.Thread(target=lambda: results.append(
+            read_through('key', lambda: 'built', 60, wait=0.5)
+        ))
+        waiting.start()
+        time.sleep(0.1)
+
+        # the wait does not hold the stripe shared with other keys
+        started = time.monotonic()
+        self.assertEqual(read_through(neighbour, lambda: 'neighbour', 60), 'neighbour')
+        self.assertLess(time.monotonic() - started, 0.3)
+
+        waiting.join()
+        self.assertEqual(results, ['built'])
+        # the lock of the other build is left alone
+        self.assertEqual(cache.get('key:lock'), 'other')
+
+class DatabaseExecutorTest(SimpleTestCase):
+
+    def test_runs_on_the_database_threads(self) -> None:
+        thread_name = lambda: threading.current_thread().name
+
+        with override_settings(ASYNC_DB_WORKERS=2):
+            self.assertTrue(async_to_sync(database_executor.run)(thread_name).startswith('database'))
+
+        with override_settings(ASYNC_DB_WORKERS=0):
+            self.assertFalse(async_to_sync(database_executor.run)(thread_name).startswith('database'))
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRoutingTest(SimpleTestCase):
+
+    def route(self, request) -> tuple:
+        targets = []
+
+        def get_response(request) -> HttpResponse:
+            targets.append(ReplicaRouter().db_for_read(None))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(get_response)(request)
+        return targets[0], response
+
+    def test_safe_requests_read_from_replicas(self) -> None:
+        factory = RequestFactory()
+
+        target, response = self.route(factory.get('/'))
+        self.assertEqual(target, 'replica_0')
+        self.assertNotIn('read_primary', response.cookies)
+
+        target, response = self.route(factory.post('/'))
+        self.assertEqual(target, 'default')
+        self.assertEqual(response.cookies['read_primary']['max-age'], 10)
+
+        # the user reads its own write from the primary
+        request = factory.get('/')
+        request.COOKIES['read_primary'] = '1'
+        self.assertEqual(self.route(request)[0], 'default')
+
+        # outside of a request everything goes to the primary
+        self.assertEqual(ReplicaRouter().db_for_read(None), 'default')
+
+class SQLiteBackendTest(TestCase):
+
+    def test_connection_pragmas(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1) # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+@override_settings(DATABASE_LOCK_RETRIES=2, DATABASE_LOCK_RETRY_DELAY=0)
+class RetryOnLockedTest(SimpleTestCase):
+
+    def test_locked_writes_are_retried(self) -> None:
+        calls = []
+
+        @retry_on_locked
+        def write(failures : int) -> int:
+            calls.append(1)
+
+            if len(calls) <= failures:
+                raise OperationalError('database is locked')
+
+            return len(calls)
+
+        self.assertEqual(write(2), 3)
+
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            write(3)
+        self.assertEqual(len(calls), 3)
+
+class QueryInstrumentationTest(TestCase):
+
+    def serve(self, queries : int) -> HttpResponse:
+        def get_response(request) -> HttpResponse:
+            for _ in range(queries):
+                get_user_model().objects.filter(username='missing').exists()
+            return HttpResponse()
+
+        return QueryInstrumentationMiddleware(get_response)(RequestFactory().get('/'))
+
+    def test_server_timing(self) -> None:
+        response = self.serve(2)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="2 queries", total;dur=[\d.]+$')
+
+    def test_repeated_queries_are_logged(self) -> None:
+        with self.assertLogs('summachar.sql', 'WARNING') as logs:
+            self.serve(5)
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('ran 5 times', logs.output[0])
+
+    @override_settings(SQL_SLOW_QUERY_MS=0)
+    def test_slow_queries_are_explained(self) -> None:
+        with self.assertLogs('summachar.sql', 'WARNING') as logs:
+            self.serve(1)
+
+        self.assertIn('slow query of GET /', logs.output[0])
+        self.assertIn('accounts_user', logs.output[0])
+        self.assertRegex(logs.output[0], r'SEARCH|SCAN')
+        self.assertNotIn('missing', logs.output[0])
+
+class MetricsTest(TestCase):
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_user(
+            username='admin_user', password='password', is_superuser=True
+        )
+
+    def scrape(self) -> str:
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/v1/metrics/')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def total_of(self, body : str, sample : str) -> float:
+        lines = [line for line in body.splitlines() if line.startswith(sample + ' ')]
+        return float(lines[0].split()[-1]) if lines else 0
+
+    def test_requests_are_recorded(self) -> None:
+        sample = 'http_requests_total{route="ping",method="GET",status="200"}'
+        before = self.total_of(self.scrape(), sample)
+
+        # recorded from another thread, in a shard of its own which
+        # is folded into the retired totals once the thread is gone
+        shards = len(registry.shards)
+        thread = threading.Thread(target=lambda: APIClient().get('/api/v1/ping/'))
+        thread.start()
+        thread.join()
+        self.assertEqual(len(registry.shards), shards)
+
+        response = self.client.get('/api/v1/ping/', CONTENT_LENGTH='garbage')
+        self.assertEqual(response.status_code, 200)
+
+        body = self.scrape()
+        self.assertEqual(self.total_of(body, sample), before + 2)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_bucket{route="ping",method="GET",le="+Inf"}', body)
+
+    def test_admin_only(self) -> None:
+        self.client.force_authenticate(get_user_model().objects.create_user(username='user'))
+        response = self.client.get('/api/v1/metrics/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_workers_are_aggregated(self) -> None:
+        directory = tempfile.mkdtemp()
+        sample = 'http_requests_total{route="ping",method="GET",status="200"}'
+
+        # the files of a worker which already exited & of a worker whose
+        # pid was reused since, by this process
+        for key in ['999999999-1', '%d-1' % os.getpid()]:
+            with open(os.path.join(directory, 'metrics-%s.json' % key), 'w') as handle:
+                json.dump([
+                    ['http_requests_total', [['route', 'ping'], ['method', 'GET'], ['status', '200']], [20]],
+                    ['http_requests_in_flight', [['method', 'GET']], [3]],
+                ], handle)
+
+        local = self.total_of(self.scrape(), sample)
+
+        with override_settings(METRICS_DIR=directory):
+            body = self.scrape()
+
+            self.assertEqual(self.total_of(body, sample), local + 40)
+            self.assertEqual(self.total_of(body, 'http_requests_in_flight{method="GET"}'), 1)
+
+            # their files were folded into the retired totals
+            self.assertFalse(os.path.exists(os.path.join(directory, 'metrics-999999999-1.json')))
+            self.assertFalse(os.path.exists(os.path.join(directory, 'metrics-%d-1.json' % os.getpid())))
+            self.assertEqual(self.total_of(self.scrape(), sample), local + 40)
+
+class ProfilingTest(TestCase):
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.directory = tempfile.mkdtemp()
+        self.admin = get_user_model().objects.create_user(
+            username='admin_user', password='password', is_superuser=True
+        )
+        self.auth = {'HTTP_AUTHORIZATION': 'Bearer %s' % RefreshToken.for_user(self.admin).access_token}
+
+    def test_profile_on_demand(self) -> None:
+        with override_settings(PROFILE_DIR=self.directory, PROFILE_RING_SIZE=2):
+            response = self.client.get('/api/v1/ping/', HTTP_X_PROFILE='cprofile', **self.auth)
+            profile_id = response['X-Profile-Id']
+
+            for _ in range(2):
+                self.client.get('/api/v1/ping/', HTTP_X_PROFILE='sample', **self.auth)
+
+            listed = self.client.get('/api/v1/profiles/', **self.auth).data
+            self.assertEqual([meta['format'] for meta in listed], ['collapsed', 'collapsed'])
+
+            # the oldest profile was dropped from the ring
+            response = self.client.get('/api/v1/profiles/%s/' % profile_id, **self.auth)
+            self.assertEqual(response.status_code, 404)
+
+            response = self.client.get('/api/v1/ping/', HTTP_X_PROFILE='cprofile', **self.auth)
+            dump = self.client.get('/api/v1/profiles/%s/' % response['X-Profile-Id'], **self.auth)
+
+        self.assertEqual(dump['Content-Type'], 'application/octet-stream')
+        path = os.path.join(self.directory, 'dump.prof')
+
+        with open(path, 'wb') as handle:
+            handle.write(dump.content)
+
+        functions = [function for _, _, function in pstats.Stats(path).stats]
+        self.assertIn('ping', functions)
+
+    @override_settings(ASYNC_DB_WORKERS=0)
+    async def test_profile_async_view(self) -> None:
+        auth = {'authorization': self.auth['HTTP_AUTHORIZATION'], 'x-profile': 'cprofile'}
+
+        with override_settings(PROFILE_DIR=self.directory):
+            response = await AsyncClient().get('/api/v1/async/quizzes/missing/', **auth)
+            meta, dump = get_ring().load(response['X-Profile-Id'])
+
+        # the lookup ran on the database executor, not on the event loop
+        self.assertEqual(meta['status'], 404)
+        functions = [function for _, _, function in marshal.loads(dump)]
+        self.assertIn('get_object', functions)
+        self.assertNotIn('__acall__', functions)
+
+    def test_requires_superuser_or_sampled_route(self) -> None:
+        user = get_user_model().objects.create_user(username='user')
+        auth = {'HTTP_AUTHORIZATION': 'Bearer %s' % RefreshToken.for_user(user).access_token}
+
+        with override_settings(PROFILE_DIR=self.directory):
+            response = self.client.get('/api/v1/ping/', HTTP_X_PROFILE='cprofile', **auth)
+            self.assertNotIn('X-Profile-Id', response)
+
+            with override_settings(PROFILE_ROUTES={'ping': 1}):
+                response = self.client.get('/api/v1/ping/')
+                self.assertIn('X-Profile-Id', response)
+
+    def test_stack_sampler(self) -> None:
+        def busy_request() -> None:
+            deadline = time.monotonic() + 0.1
+            while time.monotonic() < deadline:
+                pass
+
+        thread = threading.Thread(target=busy_request)
+        thread.start()
+        sampler = StackSampler(0.001)
+        sampler.thread_ids.add(thread.ident)
+        sampler.start()
+        thread.join()
+        sampler.stop()
+
+        self.assertIn('busy_request (tests.py:', sampler.collapsed().decode())
+
+class BenchmarkSuiteTest(TransactionTestCase):
+    """
+        The benchmark at its smallest scale, the query counts are
+        checked against the stored baseline, the latencies are only
+        compared by the `benchmark` command at the baseline scale.
+        Transactions are committed like in production, the counts
+        would otherwise include the savepoints of the test case
+    """
+
+    def setUp(self) -> None:
+        logger = logging.getLogger('summachar.sql')
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.ERROR)
+
+        # the logout scenario revokes its tokens, away from the default file
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        revocation = override_settings(TOKEN_REVOCATION_FILE=os.path.join(directory, 'revoked.bin'))
+        revocation.enable()
+        self.addCleanup(revocation.disable)
+
+    def route_names(self, patterns) -> set:
+        names = set()
+
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                names |= self.route_names(pattern.url_patterns)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                names.add(pattern.name)
+
+        return names
+
+    def test_within_query_budgets(self) -> None:
+        from accounts import urls as accounts_urls
+        from quiz import urls as quiz_urls
+
+        results = run(seed('tiny'), iterations=1)
+
+        expected = self.route_names(accounts_urls.urlpatterns + quiz_urls.urlpatterns)
+        self.assertEqual(expected - {result['route'] for result in results.values()}, set())
+
+        baseline = load_baseline()
+        self.assertEqual(set(results) - set(baseline['scenarios']), set())
+        self.assertEqual(check_budgets(results, baseline, tolerance=None), [])
+
+    def test_check_budgets(self) -> None:
+        baseline = {'scenarios': {'quiz list': {'queries': 4, 'p95_ms': 10.0}}}
+
+        self.assertEqual(check_budgets({'quiz list': {'queries': 4, 'p95_ms': 15.0}}, baseline, 0.5), [])
+        self.assertEqual(check_budgets({'quiz list': {'queries': 4, 'p95_ms': 50.0}}, baseline, None), [])
+        self.assertEqual(len(check_budgets({'quiz list': {'queries': 5, 'p95_ms': 17.0}}, baseline, 0.5)), 2)
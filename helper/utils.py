@@ -1,8 +1,16 @@
+import re
+
+from django.db.models import QuerySet
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 class TestEssentials(object):
+    # plan lines of a full table scan, `SCAN <table>` on sqlite
+    # (bare or through an index walk) & `Seq Scan` on postgres
+    FULL_SCAN_PATTERN = re.compile(r'\bSCAN\b|\bSeq Scan\b')
+    # plan lines of a sort, `USE TEMP B-TREE` on sqlite & `Sort` on postgres
+    UNORDERED_SCAN_PATTERN = re.compile(FULL_SCAN_PATTERN.pattern + r'|\bTEMP B-TREE\b|\bSort\b')
 
     def jwt_login(self) -> User:
         user = User.objects.create_user(
@@ -19,4 +27,18 @@ class TestEssentials(object):
         user = func()
         user.is_superuser = True
         user.save()
-        return user
\ No newline at end of file
+        return user
+
+    def assertUsesIndex(self, queryset : QuerySet, ordered : bool = False) -> None:
+        """
+            Fails when the query plan of `queryset` falls back to
+            scanning a whole table instead of seeking an index, with
+            `ordered` also when the rows are sorted instead of read
+            in the order of an index
+        """
+        plan = queryset.explain()
+        pattern = self.FULL_SCAN_PATTERN if not ordered else self.UNORDERED_SCAN_PATTERN
+        scans = [line for line in plan.splitlines() if pattern.search(line)]
+
+        if scans:
+            self.fail('full scan in the plan of %s\n%s' % (queryset.query, plan))
@@ -1,9 +1,46 @@
+from django.http import HttpResponse
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+
+from helper.metrics import exposition, registry
+from helper.profiling import get_ring
+from helper.permissions import AdminUserOnly
 
 # create views and actions here
 
 @api_view(['GET'])
 def ping(request) -> Response:
     return Response(data={'message' : 'pong'}, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([AdminUserOnly])
+def metrics(request) -> HttpResponse:
+    # prometheus text format, summed over all the workers
+    return HttpResponse(
+        exposition(registry.collect_all()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+@api_view(['GET'])
+@permission_classes([AdminUserOnly])
+def profiles(request) -> Response:
+    # newest first
+    return Response(data=get_ring().list(), status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([AdminUserOnly])
+def profile_detail(request, profile_id : str) -> HttpResponse:
+    if (profile := get_ring().load(profile_id)) is None:
+        return Response(data={'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    meta, data = profile
+
+    if meta['format'] == 'collapsed':
+        # ready for flamegraph.pl & speedscope
+        return HttpResponse(data, content_type='text/plain; charset=utf-8')
+
+    # loaded with `pstats.Stats(path)` or snakeviz
+    response = HttpResponse(data, content_type='application/octet-stream')
+    response['Content-Disposition'] = 'attachment; filename="%s.prof"' % profile_id
+    return response
@@ -1,6 +1,16 @@
+import hashlib
+from datetime import datetime
+from typing import Any, Iterable, Optional, Tuple
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from rest_framework import mixins
+from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
+from helper.pagination import KeysetPagination
+
 class ModelViewSetWithoutList(mixins.CreateModelMixin,
                                 mixins.RetrieveModelMixin,
                                 mixins.UpdateModelMixin,
@@ -9,4 +19,79 @@ class ModelViewSetWithoutList(mixins.CreateModelMixin,
     """
     A viewset that provides provide all actions EXCEPT `list()`
     """
-    pass
\ No newline at end of file
+    pass
+
+class ConditionalRetrieveMixin:
+    """
+        Answers `If-None-Match` & `If-Modified-Since` of `retrieve`
+        with a 304 right after the object lookup, before any
+        serializer runs. Viewsets describe the version of an object
+        with `get_etag_parts` & optionally `get_last_modified`, both
+        should only use what the `get_object` query already fetched.
+    """
+
+    def get_etag_parts(self, instance) -> Iterable[Any]:
+        raise NotImplementedError('`get_etag_parts()` must be implemented.')
+
+    def get_last_modified(self, instance) -> Optional[datetime]:
+        return None
+
+    def get_etag(self, instance) -> str:
+        digest = hashlib.sha1(
+            '|'.join(str(part) for part in self.get_etag_parts(instance)).encode()
+        ).hexdigest()
+        return quote_etag(digest)
+
+    def retrieve_response(self, request, instance) -> Response:
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+    def conditional_response(self, request, instance) -> Tuple[Optional[HttpResponse], str, Optional[int]]:
+        """
+            The 304 answering the validators of the request if any,
+            along with the validators of `instance`
+        """
+        etag = self.get_etag(instance)
+        last_modified = self.get_last_modified(instance)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        return get_conditional_response(request, etag=etag, last_modified=timestamp), etag, timestamp
+
+    def set_validators(self, response : HttpResponse, etag : str, timestamp : Optional[int]) -> HttpResponse:
+        response['ETag'] = etag
+
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+
+        # per user payloads, clients have to revalidate every time
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def retrieve(self, request, *args, **kwargs) -> Response:
+        instance = self.get_object()
+        response, etag, timestamp = self.conditional_response(request, instance)
+
+        if response is None:
+            response = self.retrieve_response(request, instance)
+
+        return self.set_validators(response, etag, timestamp)
+
+class KeysetPaginationMixin:
+    """
+        Opt-in keyset pagination, requests carrying the `cursor` query
+        parameter (empty for the first page) are paginated with
+        `keyset_pagination_class` over `keyset_fields`, all the other
+        requests keep using the `pagination_class` of the view
+    """
+    keyset_pagination_class = KeysetPagination
+    keyset_fields = ('created_at', 'id')
+
+    @property
+    def paginator(self):
+        cursor_param = self.keyset_pagination_class.cursor_query_param
+
+        if not hasattr(self, '_paginator') and cursor_param in self.request.query_params:
+            self._paginator = self.keyset_pagination_class()
+
+        return super().paginator
+
@@ -1,3 +1,10 @@
 from django.contrib import admin
 
+from quiz.models import QuestionStats
+
 # Register your models here.
+
+@admin.register(QuestionStats)
+class QuestionStatsAdmin(admin.ModelAdmin):
+    list_display = ('question', 'total_attempt', 'total_correct')
+    readonly_fields = QuestionStats.COUNTER_FIELDS
@@ -0,0 +1,112 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from typing import Dict, List, Optional
+
+from django.db.models import Count, Q
+
+from quiz.models import QuestionSolution, Quiz, TakenQuiz
+
+PERCENTILES = [10, 25, 50, 75, 90, 99]
+
+# share of the attempts in the upper & lower groups of the discrimination index
+DISCRIMINATION_GROUP = 0.27
+
+def percentile(ordered : array, rank : float) -> Optional[float]:
+    """
+        Linear interpolation between the closest ranks of a sorted array
+    """
+    if not ordered:
+        return None
+
+    position = (len(ordered) - 1) * rank / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def spread(ordered : array) -> Dict[str, Optional[float]]:
+    return {
+        'min': ordered[0] if ordered else None,
+        'max': ordered[-1] if ordered else None,
+        'mean': sum(ordered) / len(ordered) if ordered else None,
+        **{'p%d' % rank: percentile(ordered, rank) for rank in PERCENTILES},
+    }
+
+def build_quiz_analytics(quiz : Quiz) -> dict:
+    """
+        Analytics of a quiz from a single pass over its attempts, pulled
+        into compact arrays for the score & time distributions. Per
+        question figures come from the materialized `QuestionStats`
+        & one grouped aggregate over the correct solutions of the
+        upper & lower score groups.
+    """
+    scores, offsets = array('d'), array('d')
+
+    for score, taken_on in TakenQuiz.objects.filter(quiz=quiz).values_list('score', 'taken_on').iterator(chunk_size=5000):
+        scores.append(score)
+        offsets.append((taken_on - quiz.schedule_date).total_seconds())
+
+    scores = array('d', sorted(scores))
+    offsets = array('d', sorted(offsets))
+    attempts = len(scores)
+
+    # upper & lower groups of the discrimination index, by score cut offs
+    group_size = max(1, int(attempts * DISCRIMINATION_GROUP)) if attempts else 0
+    lower_cut = scores[group_size - 1] if attempts else 0
+    upper_cut = scores[attempts - group_size] if attempts else 0
+    lower_total = bisect_right(scores, lower_cut)
+    upper_total = attempts - bisect_left(scores, upper_cut)
+
+    # answer counters are materialized already, only the correct
+    # answers of the upper & lower groups need to be aggregated
+    groups = QuestionSolution.objects.filter(
+        Q(taken_quiz__score__gte=upper_cut) | Q(taken_quiz__score__lte=lower_cut),
+        taken_quiz__quiz=quiz, is_correct=True,
+    ).values('question_id').annotate(
+        upper_correct=Count('id', filter=Q(taken_quiz__score__gte=upper_cut)),
+        lower_correct=Count('id', filter=Q(taken_quiz__score__lte=lower_cut)),
+    )
+    counters = {row.pop('question_id'): row for row in groups}
+
+    questions : List[dict] = []
+    for question in quiz.questions.order_by('id'):
+        row = counters.get(question.id, {})
+        stats = question.stats
+        answered = stats['total_attempt']
+
+        entry = {
+            'id': question.slug,
+            'question_type': question.question_type,
+            'total_attempt': answered,
+            'total_correct': stats['total_correct'],
+            # classical difficulty, the share of correct answers
+            'difficulty': stats['total_correct'] / answered if answered else None,
+            'discrimination': (
+                row.get('upper_correct', 0) / upper_total - row.get('lower_correct', 0) / lower_total
+            ) if upper_total and lower_total else None,
+        }
+
+        if question.question_type == 'mcq':
+            entry['options'] = {
+                option[-1]: {
+                    'total': total,
+                    'share': total / answered if answered else None,
+                }
+                for option, total in stats['mcq'].items()
+            }
+
+        questions.append(entry)
+
+    return {
+        'id': quiz.slug,
+        'total_attempts': attempts,
+        'scores': spread(scores),
+        'score_histogram': [
+            {'score': score, 'total': total}
+            for score, total in sorted(Counter(scores).items())
+        ],
+        # seconds from the schedule date to the submission, the only
+        # completion time recorded for an attempt
+        'submission_time': spread(offsets),
+        'questions': questions,
+    }
@@ -0,0 +1,62 @@
+import time
+from typing import Any, Callable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from helper.cache import read_through
+
+# payloads only made of the content of the quiz, left cached by submissions
+CONTENT_AUDIENCES = ['participant']
+
+def quiz_version_key(quiz_id : int, scope : str = 'version') -> str:
+    return 'quiz:%s:%s' % (quiz_id, scope)
+
+def get_quiz_version(quiz_id : int, scope : str = 'version') -> int:
+    """
+        Version of the quiz content & its stats, every cached payload
+        of a quiz is keyed by it, the payloads without stats are keyed
+        by the `content_version` scope which submissions leave alone.
+        The version is seeded from the clock so an evicted counter
+        never reuses the version of stale entries
+    """
+    key = quiz_version_key(quiz_id, scope)
+
+    if (version := cache.get(key)) is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+
+    return version
+
+def bump_quiz_version(quiz_id : int, scope : str = 'version') -> None:
+    try:
+        cache.incr(quiz_version_key(quiz_id, scope))
+    except ValueError:
+        cache.add(quiz_version_key(quiz_id, scope), time.time_ns(), None)
+
+def bump_quiz_content_version(quiz_id : int) -> None:
+    """
+        The content of the quiz changed, every payload is stale
+    """
+    bump_quiz_version(quiz_id, 'content_version')
+    bump_quiz_version(quiz_id)
+
+def seconds_to_next_transition(quiz) -> int:
+    """
+        `is_live` is part of the payload, never cache beyond the
+        moment the quiz goes live or ends
+    """
+    now = timezone.now()
+    timeout = settings.QUIZ_CACHE_TIMEOUT
+
+    for moment in (quiz.schedule_date, quiz.end_date):
+        if moment > now:
+            timeout = min(timeout, int((moment - now).total_seconds()) + 1)
+
+    return timeout
+
+def cached_quiz_payload(quiz, audience : str, builder : Callable[[], Any]) -> Any:
+    scope = 'content_version' if audience in CONTENT_AUDIENCES else 'version'
+    key = 'quiz:%s:%s:v%s' % (quiz.slug, audience, get_quiz_version(quiz.id, scope))
+    return read_through(key, builder, seconds_to_next_transition(quiz))
@@ -5,3 +5,8 @@ class QuizNotTakenException(APIException):
     status_code = status.HTTP_404_NOT_FOUND
     default_detail = 'User did not attempted this quiz.'
     default_code = 'invalid'
+
+class QuizAlreadyTakenException(APIException):
+    status_code = status.HTTP_403_FORBIDDEN
+    default_detail = 'User Has already taken this quiz, cannot retake it.'
+    default_code = 'permission_denied'
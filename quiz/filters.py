@@ -0,0 +1,66 @@
+from datetime import datetime
+
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.serializers import ValidationError
+
+class QuizScheduleFilter(BaseFilterBackend):
+    """
+        Filters the quiz list in sql by where it stands in its schedule,
+        `?status=live|upcoming|ended`, and by the quizzes running at
+        some point between `?from=` & `?to=` (dates or datetimes)
+    """
+    STATUS_CHOICES = ['live', 'upcoming', 'ended']
+
+    def parse_moment(self, name : str, value : str, end_of_day : bool = False):
+        try:
+            # well formed but impossible values, like `2021-02-30`, raise
+            moment = parse_datetime(value)
+            day = parse_date(value) if moment is None else None
+        except ValueError:
+            moment = day = None
+
+        if moment is None:
+            if day is None:
+                raise ValidationError({name: ['expected a date or a datetime.']})
+
+            moment = datetime.combine(
+                day, datetime.max.time() if end_of_day else datetime.min.time()
+            )
+
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+
+        return moment
+
+    def filter_queryset(self, request, queryset : QuerySet, view) -> QuerySet:
+        if view.action != 'list':
+            return queryset
+
+        params = request.query_params
+        today = timezone.now()
+
+        if status := params.get('status'):
+            if status not in self.STATUS_CHOICES:
+                raise ValidationError({'status': [
+                    'valid values are : %s' % ', '.join(self.STATUS_CHOICES)
+                ]})
+
+            if status == 'live':
+                queryset = queryset.filter(schedule_date__lte=today, end_date__gte=today)
+            elif status == 'upcoming':
+                queryset = queryset.filter(schedule_date__gt=today)
+            else:
+                # a quiz never ends before it starts, the redundant bound
+                # on `schedule_date` lets the schedule index serve it
+                queryset = queryset.filter(schedule_date__lt=today, end_date__lt=today)
+
+        if value := params.get('from'):
+            queryset = queryset.filter(end_date__gte=self.parse_moment('from', value))
+
+        if value := params.get('to'):
+            queryset = queryset.filter(schedule_date__lte=self.parse_moment('to', value, end_of_day=True))
+
+        return queryset
@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+from typing import IO, Dict, Iterator, List, Tuple
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from quiz.models import Question, Quiz, QuizSnapshot
+from quiz.serializers import QuestionSerializer
+
+class QuestionImporter:
+    """
+        Streams a CSV or JSONL bank of questions into a quiz. Rows are
+        parsed one at a time & validated with the `QuestionSerializer`
+        rules a chunk at a time & each chunk is written with one
+        `bulk_create`, so memory stays flat whatever the size of the
+        bank. Invalid rows, undecodable ones included, are reported
+        without aborting the job, only the first `max_errors` of them
+        are kept in the report.
+    """
+    FORMATS = ['csv', 'jsonl']
+    FIELDS = ['question_text', 'question_type', 'answer']
+
+    def __init__(self, quiz : Quiz, chunk_size : int = 1000, max_errors : int = 100) -> None:
+        self.quiz = quiz
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.created = 0
+        self.failed = 0
+        self.errors : List[dict] = []
+
+    @classmethod
+    def guess_format(cls, filename : str) -> str:
+        extension = filename.rsplit('.', 1)[-1].lower()
+        return 'jsonl' if extension in ['jsonl', 'ndjson'] else 'csv'
+
+    def parse_csv(self, stream : IO[bytes]) -> Iterator[Tuple[int, object]]:
+        # undecodable bytes are kept as surrogates & reported with their row
+        reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', errors='surrogateescape', newline=''))
+
+        try:
+            header = next(reader)
+        except (StopIteration, csv.Error):
+            return
+
+        while True:
+            try:
+                values = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as error:
+                yield reader.line_num, ValueError(str(error))
+                continue
+
+            # the line of a row is its last one, a quoted field may span lines
+            yield reader.line_num, dict(zip(header, values))
+
+    def parse_jsonl(self, stream : IO[bytes]) -> Iterator[Tuple[int, object]]:
+        lines = io.TextIOWrapper(stream, encoding='utf-8', errors='surrogateescape')
+
+        for line, raw in enumerate(lines, start=1):
+            if not raw.strip():
+                continue
+
+            try:
+                yield line, json.loads(raw)
+            except ValueError:
+                yield line, None
+
+    def add_error(self, line : int, errors) -> None:
+        self.failed += 1
+
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': line, 'errors': errors})
+
+    def clean(self, row : object) -> Dict:
+        """
+            The imported fields of a row, anything else such as an `id`
+            is dropped, the questions always get a slug of their own
+        """
+        if isinstance(row, ValueError):
+            raise ValidationError({'non_field_errors': [str(row)]})
+
+        if not isinstance(row, dict):
+            raise ValidationError({'non_field_errors': ['expected a json object.']})
+
+        row = {field: row[field] for field in self.FIELDS if field in row}
+
+        for value in row.values():
+            try:
+                str(value).encode('utf-8')
+            except UnicodeEncodeError:
+                raise ValidationError({'non_field_errors': ['invalid utf-8 in the row.']})
+
+        return row
+
+    def validate(self, chunk : List[Tuple[int, object]]) -> List[Question]:
+        # one serializer validates the whole chunk, the fields are not
+        # rebuilt for every row
+        serializer = QuestionSerializer(hide_quiz=True)
+        questions = []
+
+        for line, row in chunk:
+            try:
+                data = serializer.run_validation(self.clean(row))
+            except ValidationError as error:
+                self.add_error(line, as_serializer_error(error))
+                continue
+
+            questions.append(Question(quiz=self.quiz, **data))
+
+        return questions
+
+    def flush(self, chunk : List[Tuple[int, object]]) -> None:
+        if questions := self.validate(chunk):
+            with transaction.atomic():
+                Question.objects.bulk_create(questions)
+            self.created += len(questions)
+
+    def run(self, stream : IO[bytes], format : str) -> dict:
+        rows = self.parse_jsonl(stream) if format == 'jsonl' else self.parse_csv(stream)
+        chunk : List[Tuple[int, object]] = []
+
+        for row in rows:
+            chunk.append(row)
+
+            if len(chunk) == self.chunk_size:
+                self.flush(chunk)
+                chunk = []
+
+        self.flush(chunk)
+
+        if self.created:
+            QuizSnapshot.invalidate(self.quiz.id)
+
+        return self.report
+
+    @property
+    def report(self) -> dict:
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
@@ -0,0 +1,151 @@
+import time
+import threading
+from collections import Counter
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.utils import timezone
+
+from quiz.models import Question, Quiz, TakenQuiz
+from quiz.serializers import QuizSubmissionSerializer
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = 'measure the throughput of concurrent quiz submissions against the configured database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=500,
+            help='number of participants, each submits the quiz once'
+        )
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='number of concurrent submitters, each with its own connection'
+        )
+        parser.add_argument(
+            '--questions', type=int, default=10,
+            help='number of questions of the benchmark quiz'
+        )
+        parser.add_argument(
+            '--readers', type=int, default=4,
+            help='number of threads reading the leaderboard while the submissions run'
+        )
+        parser.add_argument(
+            '--no-retries', action='store_true',
+            help='fail on the first "database is locked" instead of retrying'
+        )
+
+    def handle(self, *args, **options):
+        if options['no_retries']:
+            settings.DATABASE_LOCK_RETRIES = 0
+
+        prefix = 'bench-%s' % uuid4().hex[:8]
+        quiz, users = self.setup(prefix, options)
+
+        try:
+            results, elapsed = self.run(quiz, users, options['threads'], options['readers'])
+        finally:
+            # the quiz cascades to the attempts & their solutions
+            quiz.delete()
+            User.objects.filter(username__startswith=prefix).delete()
+
+        self.stdout.write('engine %s, journal mode %s' % (
+            settings.DATABASES['default']['ENGINE'], self.journal_mode()
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            '%d submissions in %.2fs, %.1f per second, %d locked, %d failed' % (
+                results['ok'], elapsed, results['ok'] / elapsed,
+                results['locked'], results['failed'],
+            )
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            '%d leaderboard reads, %.1f per second, %d locked' % (
+                results['read'], results['read'] / elapsed, results['read_locked'],
+            )
+        ))
+
+    def setup(self, prefix : str, options : dict) -> tuple:
+        owner = User.objects.create_user(username='%s-owner' % prefix)
+        quiz = Quiz.objects.create(
+            name=prefix, description=prefix, time_per_question=10,
+            schedule_date=timezone.now() - timedelta(hours=1),
+            end_date=timezone.now() + timedelta(hours=1),
+            created_by=owner, updated_by=owner,
+        )
+
+        for index in range(options['questions']):
+            Question.objects.create(
+                quiz=quiz, question_text='%s %d' % (prefix, index),
+                question_type='mcq', answer='abc'[index % 3],
+            )
+
+        users = User.objects.bulk_create([
+            User(username='%s-%d' % (prefix, index)) for index in range(options['users'])
+        ])
+
+        return quiz, list(User.objects.filter(username__in=[user.username for user in users]))
+
+    def run(self, quiz : Quiz, users : list, threads : int, readers : int) -> tuple:
+        answers = [
+            {'question': str(slug), 'answer': 'a'}
+            for slug in quiz.question_set.values_list('slug', flat=True)
+        ]
+        results = Counter()
+        lock = threading.Lock()
+
+        def submitter(chunk : list) -> None:
+            for user in chunk:
+                serializer = QuizSubmissionSerializer(
+                    data={'answers': answers}, context={'quiz': quiz, 'user': user}
+                )
+
+                try:
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save()
+                    outcome = 'ok'
+                except OperationalError as error:
+                    outcome = 'locked' if 'locked' in str(error) else 'failed'
+
+                with lock:
+                    results[outcome] += 1
+
+            connection.close()
+
+        def reader() -> None:
+            while not done.is_set():
+                try:
+                    TakenQuiz.leaderboard(quiz, 10)
+                    outcome = 'read'
+                except OperationalError:
+                    outcome = 'read_locked'
+
+                with lock:
+                    results[outcome] += 1
+
+            connection.close()
+
+        done = threading.Event()
+        workers = [
+            threading.Thread(target=submitter, args=(users[index::threads],))
+            for index in range(threads)
+        ]
+        background = [threading.Thread(target=reader) for _ in range(readers)]
+
+        started = time.perf_counter()
+        for thread in workers + background: thread.start()
+        for worker in workers: worker.join()
+
+        done.set()
+        for thread in background: thread.join()
+
+        return results, time.perf_counter() - started
+
+    def journal_mode(self) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            return cursor.fetchone()[0]
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from quiz.models import PendingSubmission
+
+class Command(BaseCommand):
+    help = 'grade & store the submissions queued by `user_submit` in `queue` mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='number of queued submissions graded per transaction'
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='keep polling the queue instead of exiting once it is empty'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='seconds to sleep between polls of an empty queue with `--loop`'
+        )
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+
+        while True:
+            result = PendingSubmission.drain(options['batch_size'])
+            processed += result[PendingSubmission.STATUS_PROCESSED]
+            failed += result[PendingSubmission.STATUS_FAILED]
+
+            if sum(result.values()):
+                continue
+
+            if not options['loop']:
+                break
+
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            'Drained the queue, %d submissions processed & %d failed!' % (processed, failed)
+        ))
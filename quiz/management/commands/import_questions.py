@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.imports import QuestionImporter
+from quiz.models import Quiz
+
+class Command(BaseCommand):
+    help = 'stream a CSV or JSONL bank of questions into a quiz'
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz_slug', help='quiz the questions are added to')
+        parser.add_argument('path', help='CSV (question_text, question_type, answer) or JSONL file')
+        parser.add_argument(
+            '--format', choices=QuestionImporter.FORMATS, default=None,
+            help='format of the file, guessed from its extension by default'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='number of questions validated & inserted together'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            quiz = Quiz.objects.get(slug=options['quiz_slug'])
+        except Quiz.DoesNotExist:
+            raise CommandError('quiz `%s` does not exist' % options['quiz_slug'])
+
+        importer = QuestionImporter(quiz, chunk_size=options['chunk_size'])
+        format = options['format'] or QuestionImporter.guess_format(options['path'])
+
+        with open(options['path'], 'rb') as stream:
+            report = importer.run(stream, format)
+
+        for error in report['errors']:
+            self.stdout.write(self.style.WARNING('row %(row)d: %(errors)s' % error))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Imported %(created)d questions, %(failed)d rows failed!' % report
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from quiz.models import Quiz
+from quiz.snapshots import publish_quiz
+
+class Command(BaseCommand):
+    help = 'render the participant snapshots of scheduled quizzes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'slugs', nargs='*',
+            help='quizzes to publish, defaults to every scheduled quiz without a snapshot'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='re-render the snapshots which already exist'
+        )
+
+    def handle(self, *args, **options):
+        if options['slugs']:
+            quizzes = Quiz.objects.filter(slug__in=options['slugs'])
+
+            if quizzes.count() != len(set(options['slugs'])):
+                raise CommandError('some of the given quizzes do not exist')
+        else:
+            quizzes = Quiz.objects.filter(schedule_date__lte=timezone.now())
+
+            if not options['force']:
+                quizzes = quizzes.filter(snapshot__isnull=True)
+
+        published = 0
+        for quiz in quizzes.iterator():
+            publish_quiz(quiz)
+            published += 1
+
+        self.stdout.write(self.style.SUCCESS('Published %d quizzes!' % published))
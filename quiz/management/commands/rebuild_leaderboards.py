@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from quiz.models import ScoreBucket, TakenQuiz
+
+class Command(BaseCommand):
+    help = 'rebuild the per quiz score buckets backing the leaderboards from the attempts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--quiz', dest='quiz_slug', default=None,
+            help='limit the rebuild to a single quiz'
+        )
+
+    def handle(self, *args, **options):
+        attempts = TakenQuiz.objects.all()
+        buckets = ScoreBucket.objects.all()
+
+        if quiz_slug := options['quiz_slug']:
+            attempts = attempts.filter(quiz__slug=quiz_slug)
+            buckets = buckets.filter(quiz__slug=quiz_slug)
+
+        rows = attempts.order_by().values('quiz_id', 'score').annotate(total=Count('id'))
+
+        with transaction.atomic():
+            buckets.delete()
+            ScoreBucket.objects.bulk_create(
+                [ScoreBucket(**row) for row in rows.iterator()], batch_size=500
+            )
+
+        self.stdout.write(self.style.SUCCESS('Rebuilt the leaderboard score buckets!'))
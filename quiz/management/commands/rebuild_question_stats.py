@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Q
+
+from quiz.models import Question, QuestionSolution, QuestionStats
+
+class Command(BaseCommand):
+    help = 'rebuild or verify the materialized question stats from the submitted solutions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='only report the questions whose counters drifted, do not write anything'
+        )
+        parser.add_argument(
+            '--quiz', dest='quiz_slug', default=None,
+            help='limit the rebuild to the questions of a single quiz'
+        )
+
+    def get_actual_counters(self, quiz_slug=None) -> dict:
+        solutions = QuestionSolution.objects.all()
+
+        if quiz_slug is not None:
+            solutions = solutions.filter(question__quiz__slug=quiz_slug)
+
+        # a single grouped scan over the solutions instead of
+        # five count queries per question
+        rows = solutions.values('question_id').annotate(
+            total_attempt=Count('id'),
+            total_correct=Count('id', filter=Q(is_correct=True)),
+            total_a=Count('id', filter=Q(answer='a')),
+            total_b=Count('id', filter=Q(answer='b')),
+            total_c=Count('id', filter=Q(answer='c')),
+        )
+
+        return {row.pop('question_id'): row for row in rows}
+
+    def handle(self, *args, **options):
+        quiz_slug = options['quiz_slug']
+        questions = Question.objects.all()
+
+        if quiz_slug is not None:
+            questions = questions.filter(quiz__slug=quiz_slug)
+
+            if not questions.exists():
+                raise CommandError('no questions found for quiz `%s`' % quiz_slug)
+
+        actual = self.get_actual_counters(quiz_slug)
+        stored = {
+            stats.question_id: stats for stats in
+            QuestionStats.objects.filter(question__in=questions)
+        }
+
+        drifted = []
+        for question_id in questions.values_list('id', flat=True).iterator():
+            counters = actual.get(question_id, dict.fromkeys(QuestionStats.COUNTER_FIELDS, 0))
+            stats = stored.get(question_id, QuestionStats(question_id=question_id))
+
+            if any(getattr(stats, field) != counters[field] for field in QuestionStats.COUNTER_FIELDS):
+                for field in QuestionStats.COUNTER_FIELDS:
+                    setattr(stats, field, counters[field])
+                drifted.append(stats)
+
+        if options['verify']:
+            for stats in drifted:
+                self.stdout.write(self.style.WARNING(
+                    'question %s drifted from its solutions' % stats.question_id
+                ))
+
+            if drifted:
+                raise CommandError('%d question stats out of sync' % len(drifted))
+
+            self.stdout.write(self.style.SUCCESS('All the question stats are in sync!'))
+            return
+
+        with transaction.atomic():
+            QuestionStats.objects.filter(question__in=[s.question_id for s in drifted]).delete()
+            QuestionStats.objects.bulk_create(drifted, batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS('Rebuilt stats of %d questions!' % len(drifted)))
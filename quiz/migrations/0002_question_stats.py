@@ -0,0 +1,42 @@
+# Generated by Django 3.1.7 on 2026-10-18 13:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_question_stats(apps, schema_editor):
+    QuestionSolution = apps.get_model('quiz', 'QuestionSolution')
+    QuestionStats = apps.get_model('quiz', 'QuestionStats')
+
+    rows = QuestionSolution.objects.values('question_id').annotate(
+        total_attempt=models.Count('id'),
+        total_correct=models.Count('id', filter=models.Q(is_correct=True)),
+        total_a=models.Count('id', filter=models.Q(answer='a')),
+        total_b=models.Count('id', filter=models.Q(answer='b')),
+        total_c=models.Count('id', filter=models.Q(answer='c')),
+    )
+
+    QuestionStats.objects.bulk_create(
+        [QuestionStats(**row) for row in rows.iterator()], batch_size=500
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='answer_stats', serialize=False, to='quiz.question')),
+                ('total_attempt', models.PositiveIntegerField(default=0, verbose_name='total_attempt')),
+                ('total_correct', models.PositiveIntegerField(default=0, verbose_name='total_correct')),
+                ('total_a', models.PositiveIntegerField(default=0, verbose_name='total_a')),
+                ('total_b', models.PositiveIntegerField(default=0, verbose_name='total_b')),
+                ('total_c', models.PositiveIntegerField(default=0, verbose_name='total_c')),
+            ],
+        ),
+        migrations.RunPython(backfill_question_stats, migrations.RunPython.noop),
+    ]
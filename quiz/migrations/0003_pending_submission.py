@@ -0,0 +1,39 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0002_question_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingSubmission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receipt', models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name='receipt')),
+                ('answers', models.JSONField(verbose_name='answers')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('processed', 'processed'), ('failed', 'failed')], default='pending', max_length=15, verbose_name='status')),
+                ('error', models.TextField(default=None, null=True, verbose_name='error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created_at')),
+                ('processed_at', models.DateTimeField(default=None, null=True, verbose_name='processed_at')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.quiz')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pendingsubmission',
+            index=models.Index(fields=['status', 'id'], name='quiz_pendin_status_ba54ca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pendingsubmission',
+            index=models.Index(fields=['user', 'quiz'], name='quiz_pendin_user_id_ded7e6_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0003_pending_submission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizSnapshot',
+            fields=[
+                ('quiz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='quiz.quiz')),
+                ('body', models.BinaryField(verbose_name='body')),
+                ('body_gzip', models.BinaryField(verbose_name='body_gzip')),
+                ('published_at', models.DateTimeField(auto_now=True, verbose_name='published_at')),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0005_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='question',
+            name='slug',
+            field=models.SlugField(default=uuid.uuid4, editable=False, unique=True, verbose_name='slug'),
+        ),
+        migrations.AlterField(
+            model_name='questionsolution',
+            name='question',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='quiz.question'),
+        ),
+        migrations.AlterField(
+            model_name='questionsolution',
+            name='taken_quiz',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='quiz.takenquiz'),
+        ),
+        migrations.AlterField(
+            model_name='quiz',
+            name='slug',
+            field=models.SlugField(default=uuid.uuid4, editable=False, unique=True, verbose_name='slug'),
+        ),
+        migrations.AddIndex(
+            model_name='questionsolution',
+            index=models.Index(fields=['question', 'is_correct', 'answer'], name='quiz_questi_questio_f19741_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='questionsolution',
+            index=models.Index(fields=['taken_quiz', 'question', 'is_correct', 'answer'], name='quiz_questi_taken_q_e3a1f6_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='takenquiz',
+            constraint=models.UniqueConstraint(fields=('user', 'quiz'), name='unique_taken_quiz'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0006_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['schedule_date', 'end_date'], name='quiz_quiz_schedul_faa04e_idx'),
+        ),
+    ]
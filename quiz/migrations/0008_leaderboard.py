@@ -0,0 +1,46 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_score_buckets(apps, schema_editor):
+    TakenQuiz = apps.get_model('quiz', 'TakenQuiz')
+    ScoreBucket = apps.get_model('quiz', 'ScoreBucket')
+
+    rows = TakenQuiz.objects.values('quiz_id', 'score').annotate(total=models.Count('id'))
+
+    ScoreBucket.objects.bulk_create(
+        [ScoreBucket(**row) for row in rows.iterator()], batch_size=500
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0007_schedule_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='score')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='total')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='takenquiz',
+            index=models.Index(fields=['quiz', '-score', 'taken_on', 'id'], name='quiz_takenq_quiz_id_2f37a4_idx'),
+        ),
+        migrations.AddField(
+            model_name='scorebucket',
+            name='quiz',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='quiz.quiz'),
+        ),
+        migrations.AddConstraint(
+            model_name='scorebucket',
+            constraint=models.UniqueConstraint(fields=('quiz', 'score'), name='unique_score_bucket'),
+        ),
+        migrations.RunPython(backfill_score_buckets, migrations.RunPython.noop),
+    ]
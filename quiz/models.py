@@ -1,8 +1,15 @@
 from uuid import uuid4
-from django.db import models
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Count, ExpressionWrapper, F, Max, OuterRef, Q, Subquery, Sum
 from django.utils import timezone
+from helper.db import retry_on_locked
 from helper.models import ModelStamps
+from quiz.cache import bump_quiz_content_version, bump_quiz_version
 from django.db.models.query import QuerySet
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.utils.translation import ugettext_lazy as _
 from django.core.validators import FileExtensionValidator
@@ -13,7 +20,7 @@ User = get_user_model()
 
 class Quiz(ModelStamps):
     name = models.CharField(_('name'), max_length=250)
-    slug = models.SlugField(_('slug'), default=uuid4, editable=False)
+    slug = models.SlugField(_('slug'), default=uuid4, editable=False, unique=True)
     schedule_date = models.DateTimeField(_('schedule_date'))
     end_date = models.DateTimeField(_('end_date'))
     description = models.TextField(_('description'), null=True, default=None)
@@ -22,25 +29,68 @@ class Quiz(ModelStamps):
         help_text=_('Time in seconds to be given per question for a quiz')
     )
 
+    class Meta:
+        indexes = [
+            # keyset pagination of the quiz list
+            models.Index(fields=['created_at', 'id']),
+            # live / upcoming / ended & date range filters of the quiz list
+            models.Index(fields=['schedule_date', 'end_date']),
+        ]
+
     def __str__(self) -> str:
         return '<Quiz {}>'.format(self.name)
 
     @property
     def question_count(self) -> int:
+        # prefetched by the list queryset, counted per quiz otherwise
+        if 'question_set' in getattr(self, '_prefetched_objects_cache', {}):
+            return len(self.question_set.all())
+
         return self.questions.count()
 
     @property
     def is_live(self) -> bool:
+        # querysets annotated with `live_annotation` carry it already
+        if (is_live := self.__dict__.get('_is_live')) is not None:
+            return is_live
+
+        today = timezone.now()
+        return self.schedule_date <= today <= self.end_date
+
+    @is_live.setter
+    def is_live(self, value : bool) -> None:
+        self._is_live = value
+
+    @staticmethod
+    def live_annotation() -> dict:
+        """
+            `is_live` evaluated by the database, so listing quizzes
+            never computes it row by row
+        """
         today = timezone.now()
-        return  today >= self.schedule_date or today <= self.end_date 
+
+        return {
+            'is_live': ExpressionWrapper(
+                Q(schedule_date__lte=today, end_date__gte=today),
+                output_field=models.BooleanField()
+            )
+        }
 
     @property
     def questions(self) -> QuerySet:
-        return Question.objects.filter(quiz=self)
+        return Question.objects.filter(quiz=self).select_related('answer_stats')
+
+    @classmethod
+    def touch(cls, quiz_id : int) -> None:
+        """
+            Advance `updated_at` of a quiz which lost questions, a
+            delete leaves no newer question timestamp behind it
+        """
+        cls.objects.filter(id=quiz_id).update(updated_at=timezone.now())
 
 class Question(models.Model):
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
-    slug = models.SlugField(_('slug'), default=uuid4, editable=False)
+    slug = models.SlugField(_('slug'), default=uuid4, editable=False, unique=True)
     question_text = models.TextField(_('question_text'), null=False)
     question_img = models.FileField(
         _('question_img'), 
@@ -69,23 +119,41 @@ class Question(models.Model):
 
     @property
     def stats(self) -> dict:
-        question_solutions = QuestionSolution.objects.filter(question=self)
-        data = {
-            'total_correct': question_solutions.filter(is_correct=True).count(),
-            'total_attempt' : question_solutions.count()
-        }
-        
-        if self.question_type == 'mcq':
-            data.update({
-                'mcq': {
-                    'total_a' : question_solutions.filter(answer='a').count(),
-                    'total_b' : question_solutions.filter(answer='b').count(),
-                    'total_c' : question_solutions.filter(answer='c').count(),
-                }   
-            })
+        # counters are maintained incrementally on every submission,
+        # see `QuestionStats.record`, so reading them is a single row
+        try:
+            question_stats = self.answer_stats
+        except QuestionStats.DoesNotExist:
+            question_stats = QuestionStats(question=self)
 
-        return data
+        return question_stats.as_dict(self.question_type)
         
+    @property
+    def stats_counters(self) -> List[int]:
+        stats = self.stats
+        return [
+            stats['total_attempt'], stats['total_correct'],
+            *stats.get('mcq', {}).values()
+        ]
+
+    @staticmethod
+    def content_version_annotations() -> dict:
+        """
+            Subqueries describing the version of the questions of a
+            quiz, a question edit bumps the latest `updated_at` & a
+            delete changes the total
+        """
+        questions = Question.objects.filter(quiz=OuterRef('pk')).order_by().values('quiz')
+
+        return {
+            'questions_updated_at': Subquery(
+                questions.annotate(latest=Max('updated_at')).values('latest')
+            ),
+            'questions_total': Subquery(
+                questions.annotate(total=Count('id')).values('total')
+            ),
+        }
+
     @property
     def quiz_slug(self) -> str:
         return self.quiz.slug
@@ -100,29 +168,476 @@ class TakenQuiz(models.Model):
     taken_on = models.DateTimeField(_('taken_on'), auto_now_add=True)
     score = models.FloatField(_('score'), default=0)
 
-    def save_total_score(self) -> None:
-        self.score = QuestionSolution.objects.filter(
-            taken_quiz=self, is_correct=True
-        ).count()
+    class Meta:
+        constraints = [
+            # a quiz can only be taken once, also serves the
+            # `(user, quiz)` lookups of `IsQuizTaken` & `user_answers`
+            models.UniqueConstraint(fields=['user', 'quiz'], name='unique_taken_quiz'),
+        ]
+        indexes = [
+            # the leaderboard of a quiz is a seek + walk of this b-tree
+            models.Index(fields=['quiz', '-score', 'taken_on', 'id']),
+        ]
+
+    LEADERBOARD_ORDERING = ['-score', 'taken_on', 'id']
+
+    @classmethod
+    @retry_on_locked
+    def finalise(cls, quiz : Quiz, user : User, solutions : List['QuestionSolution']) -> 'TakenQuiz':
+        """
+            Persist a graded submission, the score is computed from the
+            solutions already in memory so the attempt is written once
+            & in the same transaction as its answers, a partially
+            scored attempt is never visible to other requests.
+        """
+        score = sum(1 for solution in solutions if solution.is_correct)
+
+        with transaction.atomic():
+            taken_quiz = cls.objects.create(quiz=quiz, user=user, score=score)
+
+            for solution in solutions:
+                solution.taken_quiz = taken_quiz
+
+            QuestionSolution.objects.bulk_create(solutions)
+            QuestionStats.record(solutions)
+            ScoreBucket.record([taken_quiz])
+            transaction.on_commit(lambda: bump_quiz_version(quiz.id))
+
+        return taken_quiz
+
+    @classmethod
+    def retract(cls, attempts : QuerySet) -> None:
+        """
+            Take attempts about to be deleted out of the score buckets &
+            the question stats, has to be called inside the transaction
+            deleting them. Deleting a quiz or a question drops the
+            counters along with the attempts & answers they cascade to,
+            the attempts of a deleted user are retracted on `pre_delete`
+        """
+        buckets = attempts.order_by().values('quiz_id', 'score').annotate(total=Count('id'))
+        quiz_ids = set()
+
+        for bucket in buckets:
+            ScoreBucket.objects.filter(quiz_id=bucket['quiz_id'], score=bucket['score']).update(
+                total=F('total') - bucket['total']
+            )
+            quiz_ids.add(bucket['quiz_id'])
+
+        if not quiz_ids:
+            return
 
-        self.save()
+        QuestionStats.retract(QuestionSolution.objects.filter(taken_quiz__in=attempts))
+
+        for quiz_id in quiz_ids:
+            transaction.on_commit(lambda quiz_id=quiz_id: bump_quiz_version(quiz_id))
+
+    @classmethod
+    def leaderboard(cls, quiz : Quiz, limit : int) -> List['TakenQuiz']:
+        """
+            Top `limit` attempts of a quiz with their rank, ties share
+            a rank & the earlier submission is listed first
+        """
+        attempts = list(
+            cls.objects.filter(quiz=quiz).select_related('user')
+            .order_by(*cls.LEADERBOARD_ORDERING)[:limit]
+        )
+
+        for position, attempt in enumerate(attempts):
+            previous = attempts[position - 1] if position else None
+            attempt.rank = previous.rank if previous and previous.score == attempt.score else position + 1
+
+        return attempts
+
+    @property
+    def rank(self) -> int:
+        if (rank := self.__dict__.get('_rank')) is None:
+            rank = self._rank = ScoreBucket.rank_of(self.quiz_id, self.score)
+        return rank
+
+    @rank.setter
+    def rank(self, value : int) -> None:
+        self._rank = value
 
     @property
     def answers(self) -> QuerySet:
-        return QuestionSolution.objects.filter(taken_quiz=self)
+        return QuestionSolution.objects.filter(taken_quiz=self).select_related('question')
 
     def __str__(self) -> str:
         return '< %s by %s>' % (self.quiz.name, self.user.username)
 
 class QuestionSolution(models.Model):
-    taken_quiz = models.ForeignKey(TakenQuiz, on_delete=models.CASCADE)
-    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    # both foreign keys are the prefix of a covering index below
+    taken_quiz = models.ForeignKey(TakenQuiz, on_delete=models.CASCADE, db_index=False)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, db_index=False)
     is_correct = models.BooleanField(_('is_correct'), default=False)
     answer = models.CharField(
         _('answer'), max_length=250, 
         null=True, default=None
     )
 
+    class Meta:
+        indexes = [
+            # covers the per question stats & analytics aggregates
+            models.Index(fields=['question', 'is_correct', 'answer']),
+            # covers the answers of an attempt in `user_answers`
+            models.Index(fields=['taken_quiz', 'question', 'is_correct', 'answer']),
+        ]
+
     @property
     def question_slug(self) -> str:
         return self.question.slug
+
+    @classmethod
+    def grade(cls, question : Question, answer : str) -> 'QuestionSolution':
+        """
+            Build an unsaved solution graded against the answer key
+        """
+        answer = answer.lower()
+        return cls(question=question, answer=answer, is_correct=question.answer == answer)
+
+
+class QuestionStats(models.Model):
+    """
+        Materialized answer counters of a question, kept in sync
+        with `QuestionSolution` by `QuestionStats.record` on every
+        submission & `QuestionStats.retract` when answers are deleted,
+        rebuilt by the `rebuild_question_stats` command
+    """
+    MCQ_OPTIONS = ['a', 'b', 'c']
+
+    question = models.OneToOneField(
+        Question, on_delete=models.CASCADE,
+        primary_key=True, related_name='answer_stats'
+    )
+    total_attempt = models.PositiveIntegerField(_('total_attempt'), default=0)
+    total_correct = models.PositiveIntegerField(_('total_correct'), default=0)
+    total_a = models.PositiveIntegerField(_('total_a'), default=0)
+    total_b = models.PositiveIntegerField(_('total_b'), default=0)
+    total_c = models.PositiveIntegerField(_('total_c'), default=0)
+
+    COUNTER_FIELDS = ['total_attempt', 'total_correct', 'total_a', 'total_b', 'total_c']
+
+    # `INSERT ... ON CONFLICT DO UPDATE`, sqlite 3.24+ & postgres,
+    # the batches stay under the 999 parameters of older sqlite builds
+    UPSERT_VENDORS = ['sqlite', 'postgresql']
+    UPSERT_BATCH_SIZE = 150
+
+    def __str__(self) -> str:
+        return '<QuestionStats of Question {}>'.format(self.question_id)
+
+    def as_dict(self, question_type : str) -> dict:
+        data = {
+            'total_correct': self.total_correct,
+            'total_attempt' : self.total_attempt
+        }
+
+        if question_type == 'mcq':
+            data.update({
+                'mcq': {
+                    'total_a' : self.total_a,
+                    'total_b' : self.total_b,
+                    'total_c' : self.total_c,
+                }
+            })
+
+        return data
+
+    @classmethod
+    def tally(cls, solutions : Iterable['QuestionSolution']) -> Dict[int, Dict[str, int]]:
+        """
+            Fold graded solutions into per question counter deltas
+        """
+        deltas : Dict[int, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(cls.COUNTER_FIELDS, 0))
+
+        for solution in solutions:
+            delta = deltas[solution.question_id]
+            delta['total_attempt'] += 1
+            delta['total_correct'] += int(solution.is_correct)
+
+            if solution.answer in cls.MCQ_OPTIONS:
+                delta['total_%s' % solution.answer] += 1
+
+        return deltas
+
+    @classmethod
+    def record(cls, solutions : Iterable['QuestionSolution']) -> None:
+        """
+            Apply the answers of a submission to the counters, has to
+            be called inside the transaction that saves the solutions.
+            The deltas of every question are applied by one upsert
+        """
+        deltas = cls.tally(solutions)
+
+        if not deltas:
+            return
+
+        connection = connections[router.db_for_write(cls)]
+
+        if connection.vendor not in cls.UPSERT_VENDORS:
+            cls.objects.bulk_create(
+                [cls(question_id=question_id) for question_id in deltas.keys()],
+                ignore_conflicts=True
+            )
+
+            for question_id, delta in deltas.items():
+                cls.objects.filter(question_id=question_id).update(**{
+                    field: F(field) + value for field, value in delta.items() if value
+                })
+
+            return
+
+        quote = connection.ops.quote_name
+        table = quote(cls._meta.db_table)
+        columns = [cls._meta.get_field('question').column, *cls.COUNTER_FIELDS]
+        rows = [
+            [question_id, *(delta[field] for field in cls.COUNTER_FIELDS)]
+            for question_id, delta in deltas.items()
+        ]
+
+        for start in range(0, len(rows), cls.UPSERT_BATCH_SIZE):
+            batch = rows[start:start + cls.UPSERT_BATCH_SIZE]
+            sql = 'INSERT INTO %s (%s) VALUES %s ON CONFLICT (%s) DO UPDATE SET %s' % (
+                table, ', '.join(quote(column) for column in columns),
+                ', '.join(['(%s)' % ', '.join(['%s'] * len(columns))] * len(batch)),
+                quote(columns[0]),
+                ', '.join(
+                    '{0} = {1}.{0} + EXCLUDED.{0}'.format(quote(field), table)
+                    for field in cls.COUNTER_FIELDS
+                ),
+            )
+
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [value for row in batch for value in row])
+
+    @classmethod
+    def retract(cls, solutions : QuerySet) -> None:
+        """
+            Take answers about to be deleted out of the counters, one
+            aggregate & an update per question they answer
+        """
+        deltas = solutions.order_by().values('question_id').annotate(
+            total_attempt=Count('id'),
+            total_correct=Count('id', filter=Q(is_correct=True)),
+            **{
+                'total_%s' % option: Count('id', filter=Q(answer=option))
+                for option in cls.MCQ_OPTIONS
+            }
+        )
+
+        for delta in deltas:
+            cls.objects.filter(question_id=delta.pop('question_id')).update(**{
+                field: F(field) - value for field, value in delta.items() if value
+            })
+
+class PendingSubmission(models.Model):
+    """
+        Durable write-behind queue of quiz submissions, in `queue`
+        submission mode `user_submit` only appends the raw answers
+        here & the `drain_submissions` worker grades them in batches
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSED = 'processed'
+    STATUS_FAILED = 'failed'
+
+    STATUS_ENUM = (
+        (STATUS_PENDING, STATUS_PENDING),
+        (STATUS_PROCESSED, STATUS_PROCESSED),
+        (STATUS_FAILED, STATUS_FAILED),
+    )
+
+    receipt = models.UUIDField(_('receipt'), default=uuid4, editable=False, unique=True)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    answers = models.JSONField(_('answers'))
+    status = models.CharField(
+        _('status'), max_length=15,
+        choices=STATUS_ENUM, default=STATUS_PENDING
+    )
+    error = models.TextField(_('error'), null=True, default=None)
+    created_at = models.DateTimeField(_('created_at'), auto_now_add=True)
+    processed_at = models.DateTimeField(_('processed_at'), null=True, default=None)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['user', 'quiz']),
+        ]
+
+    def __str__(self) -> str:
+        return '<PendingSubmission {} {}>'.format(self.receipt, self.status)
+
+    def grade(self, questions : Dict[str, Question]) -> List[QuestionSolution]:
+        """
+            Grade the queued answers against the questions of the
+            batch, keyed by slug. Raises `ValueError` when the payload
+            can not be accepted as a submission of this quiz.
+        """
+        slugs = [answer['question'] for answer in self.answers]
+
+        if len(set(slugs)) != len(slugs):
+            raise ValueError('a question can only be answered once.')
+
+        solutions = []
+        for answer in self.answers:
+            question = questions.get(answer['question'])
+
+            if question is None or question.quiz_id != self.quiz_id:
+                raise ValueError('question %s does not belong to this quiz.' % answer['question'])
+
+            solutions.append(QuestionSolution.grade(question, answer['answer']))
+
+        return solutions
+
+    @classmethod
+    @retry_on_locked
+    def drain(cls, batch_size : int) -> Dict[str, int]:
+        """
+            Grade & store the oldest `batch_size` pending submissions
+            in one transaction, questions of the whole batch are
+            resolved with a single query & every answer is written
+            with one `bulk_create`. Meant to be run by a single worker.
+        """
+        with transaction.atomic():
+            batch = list(cls.objects.filter(status=cls.STATUS_PENDING).order_by('id')[:batch_size])
+
+            if not batch:
+                return {cls.STATUS_PROCESSED: 0, cls.STATUS_FAILED: 0}
+
+            slugs = {answer['question'] for pending in batch for answer in pending.answers}
+            questions : Dict[str, Question] = {
+                question.slug: question for question in
+                Question.objects.filter(slug__in=slugs).only('id', 'slug', 'answer', 'quiz_id')
+            }
+
+            taken = set(TakenQuiz.objects.filter(
+                quiz_id__in={pending.quiz_id for pending in batch},
+                user_id__in={pending.user_id for pending in batch},
+            ).values_list('quiz_id', 'user_id'))
+
+            processed, failed, solutions, attempts = [], [], [], []
+            for pending in batch:
+                try:
+                    if (pending.quiz_id, pending.user_id) in taken:
+                        raise ValueError('User Has already taken this quiz, cannot retake it.')
+
+                    graded = pending.grade(questions)
+
+                    # a synchronous submission may have raced this one
+                    with transaction.atomic():
+                        taken_quiz = TakenQuiz.objects.create(
+                            quiz_id=pending.quiz_id, user_id=pending.user_id,
+                            score=sum(1 for solution in graded if solution.is_correct)
+                        )
+                except IntegrityError:
+                    pending.error = 'User Has already taken this quiz, cannot retake it.'
+                    failed.append(pending)
+                    continue
+                except ValueError as error:
+                    pending.error = str(error)
+                    failed.append(pending)
+                    continue
+
+                for solution in graded:
+                    solution.taken_quiz = taken_quiz
+
+                taken.add((pending.quiz_id, pending.user_id))
+                solutions.extend(graded)
+                attempts.append(taken_quiz)
+                processed.append(pending)
+
+            QuestionSolution.objects.bulk_create(solutions, batch_size=1000)
+            QuestionStats.record(solutions)
+            ScoreBucket.record(attempts)
+
+            now = timezone.now()
+            cls.objects.filter(id__in=[pending.id for pending in processed]).update(
+                status=cls.STATUS_PROCESSED, processed_at=now
+            )
+
+            for pending in failed:
+                pending.status, pending.processed_at = cls.STATUS_FAILED, now
+
+            cls.objects.bulk_update(failed, ['status', 'error', 'processed_at'])
+
+            for quiz_id in {pending.quiz_id for pending in processed}:
+                transaction.on_commit(lambda quiz_id=quiz_id: bump_quiz_version(quiz_id))
+
+        return {cls.STATUS_PROCESSED: len(processed), cls.STATUS_FAILED: len(failed)}
+
+class QuizSnapshot(models.Model):
+    """
+        Pre-rendered participant view of a published quiz, stored as
+        ready to send JSON bytes along with a gzip compressed copy
+    """
+    quiz = models.OneToOneField(
+        Quiz, on_delete=models.CASCADE,
+        primary_key=True, related_name='snapshot'
+    )
+    body = models.BinaryField(_('body'))
+    body_gzip = models.BinaryField(_('body_gzip'))
+    published_at = models.DateTimeField(_('published_at'), auto_now=True)
+
+    def __str__(self) -> str:
+        return '<QuizSnapshot of Quiz {}>'.format(self.quiz_id)
+
+    @classmethod
+    def invalidate(cls, quiz_id : int) -> None:
+        """
+            The content of a quiz changed, drop its snapshot &
+            every cached payload
+        """
+        cls.objects.filter(quiz_id=quiz_id).delete()
+        bump_quiz_content_version(quiz_id)
+
+class ScoreBucket(models.Model):
+    """
+        Number of attempts of a quiz per score, maintained on every
+        submission & by `TakenQuiz.retract`. The rank of a score is
+        one more than the attempts with a higher score, so it is a sum
+        over at most one bucket per distinct score instead of a sort
+        of every attempt.
+    """
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, db_index=False)
+    score = models.FloatField(_('score'))
+    total = models.PositiveIntegerField(_('total'), default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['quiz', 'score'], name='unique_score_bucket'),
+        ]
+
+    def __str__(self) -> str:
+        return '<ScoreBucket {} of Quiz {}>'.format(self.score, self.quiz_id)
+
+    @classmethod
+    def record(cls, attempts : Iterable[TakenQuiz]) -> None:
+        """
+            Count new attempts in, has to be called inside the
+            transaction that saves them
+        """
+        totals = Counter((attempt.quiz_id, attempt.score) for attempt in attempts)
+
+        if not totals:
+            return
+
+        cls.objects.bulk_create([
+            cls(quiz_id=quiz_id, score=score) for quiz_id, score in totals.keys()
+        ], ignore_conflicts=True)
+
+        for (quiz_id, score), total in totals.items():
+            cls.objects.filter(quiz_id=quiz_id, score=score).update(total=F('total') + total)
+
+    @classmethod
+    def rank_of(cls, quiz_id : int, score : float) -> int:
+        higher = cls.objects.filter(quiz_id=quiz_id, score__gt=score).aggregate(
+            total=Sum('total')
+        )['total']
+        return (higher or 0) + 1
+
+    @classmethod
+    def attempts_of(cls, quiz_id : int) -> int:
+        return cls.objects.filter(quiz_id=quiz_id).aggregate(total=Sum('total'))['total'] or 0
+
+@receiver(pre_delete, sender=User)
+def retract_attempts_of_user(sender, instance : User, **kwargs) -> None:
+    TakenQuiz.retract(TakenQuiz.objects.filter(user=instance))
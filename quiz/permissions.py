@@ -1,4 +1,5 @@
-from quiz.models import Question, Quiz, TakenQuiz
+from django.conf import settings
+from quiz.models import PendingSubmission, Question, Quiz, TakenQuiz
 from rest_framework.permissions import BasePermission
 
 class HaveRole(BasePermission):
@@ -17,7 +18,17 @@ class IsQuizTaken(BasePermission):
     message = 'User Has already taken this quiz, cannot retake it.'
 
     def has_object_permission(self, request, view, quiz : Quiz):
-        return not TakenQuiz.objects.filter(user=request.user, quiz=quiz).exists()
+        if TakenQuiz.objects.filter(user=request.user, quiz=quiz).exists():
+            return False
+
+        # a queued submission that is not graded yet counts as taken
+        if settings.QUIZ_SUBMISSION_MODE == 'queue':
+            return not PendingSubmission.objects.filter(
+                user=request.user, quiz=quiz,
+                status=PendingSubmission.STATUS_PENDING
+            ).exists()
+
+        return True
 
 class IsQuizLive(BasePermission):
     message = 'Quiz is not live.'
@@ -2,12 +2,15 @@ from rest_framework.serializers import ValidationError
 from typing import Dict, List, OrderedDict
 
 from django.core.validators import MaxLengthValidator, MinLengthValidator
+from django.db import transaction
+from django.utils import timezone
 from django.forms.models import model_to_dict
+from helper.db import retry_on_locked
 from helper.validators import ExistValidator
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
-from quiz.models import Question, QuestionSolution, Quiz
+from quiz.models import PendingSubmission, Question, QuestionSolution, Quiz, TakenQuiz
 
 CollectedDict = List[OrderedDict]
 
@@ -23,7 +26,7 @@ class QuestionSerializer(serializers.ModelSerializer):
         ExistValidator(Quiz, field='slug')
     ])
 
-    def __init__(self, hide_quiz=False, *args, **kwargs) -> None:
+    def __init__(self, *args, hide_quiz=False, **kwargs) -> None:
         """
             While working using `QuestionSerializer` in `QuizSerializer`
             `quiz` field will be populated by `QuizSerilaizer` after the 
@@ -50,23 +53,64 @@ class QuestionSerializer(serializers.ModelSerializer):
         }
 
     def validate(self, attrs : OrderedDict) -> OrderedDict:
-        attrs['answer'] = attrs['answer'].lower()
+        if 'answer' in attrs:
+            attrs['answer'] = attrs['answer'].lower()
 
         if quiz_slug := attrs.pop('quiz_slug', False):
             attrs['quiz'] = Quiz.objects.get(slug=quiz_slug)
 
-        if attrs['question_type'] == 'mcq' and \
-                attrs['answer'] not in self.VALID_MCQ_OPTIONS:
+        if self.parent is not None:
+            # a nested question may leave out the fields it does not edit,
+            # `QuizSerializer` checks it once merged with the stored one
+            return attrs
 
-            raise ValidationError('answers not valid mcq option.')
+        # a partial update is checked against the stored fields it leaves out
+        instance = self.instance if isinstance(self.instance, Question) else None
+        self.check_answer(
+            attrs.get('question_type', getattr(instance, 'question_type', None)),
+            attrs.get('answer', getattr(instance, 'answer', None)),
+        )
 
         return attrs
 
+    @classmethod
+    def check_answer(cls, question_type : str, answer : str) -> None:
+        if question_type == 'mcq' and answer not in cls.VALID_MCQ_OPTIONS:
+            raise ValidationError('answers not valid mcq option.')
+
     def to_representation(self, instance : Question):
         data : OrderedDict = super().to_representation(instance)
         data['stats'] = instance.stats
         return data
 
+class ParticipantQuestionSerializer(serializers.ModelSerializer):
+    """
+        Question as seen by a participant, without the answer & stats
+    """
+    id = serializers.ReadOnlyField(source='slug')
+
+    class Meta:
+        model = Question
+        fields = ['id', 'question_text', 'question_img', 'question_type']
+        read_only_fields = fields
+
+class ParticipantQuizSerializer(serializers.ModelSerializer):
+    """
+        Quiz as seen by a participant, only the content which is frozen
+        once the quiz is scheduled, so it can be rendered into a snapshot
+    """
+    id = serializers.ReadOnlyField(source='slug')
+    questions = ParticipantQuestionSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Quiz
+        fields = [
+            'id', 'name', 'schedule_date',
+            'end_date', 'description',
+            'time_per_question', 'questions',
+        ]
+        read_only_fields = fields
+
 class QuizWithoutQuestionsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Quiz
@@ -84,7 +128,8 @@ class QuizWithoutQuestionsSerializer(serializers.ModelSerializer):
     def to_representation(self, instance : Quiz):
         data : OrderedDict = super().to_representation(instance)
         data['id'] = instance.slug
-        data['questions'] = instance.questions.values_list('slug', flat=True)
+        # served from the prefetch of the list queryset
+        data['questions'] = [question.slug for question in instance.question_set.all()]
         data['total_questions'] = instance.question_count
         return data
 
@@ -97,6 +142,8 @@ class QuizSerializer(serializers.ModelSerializer):
     ])
     questions = QuestionSerializer(many=True, hide_quiz=True)
 
+    REQUIRED_QUESTION_FIELDS = ['question_text', 'question_type', 'answer']
+
     class Meta:
         model = Quiz
         lookup_field = 'slug'
@@ -116,8 +163,26 @@ class QuizSerializer(serializers.ModelSerializer):
         data : OrderedDict = super().to_representation(instance)
         data['created_by'] = get_user(instance.created_by)
         data['updated_by'] = get_user(instance.updated_by)
+
+        if sync_report := getattr(self, 'sync_report', None):
+            data['questions_sync'] = sync_report
+
         return data
 
+    def validate_questions(self, questions : CollectedDict) -> CollectedDict:
+        # the edits of stored questions are checked in `sync_questions`
+        for data in questions:
+            if 'slug' not in data:
+                QuestionSerializer.check_answer(data.get('question_type'), data.get('answer'))
+
+        return questions
+
+    def check_question(self, question_type : str, answer : str) -> None:
+        try:
+            QuestionSerializer.check_answer(question_type, answer)
+        except ValidationError as error:
+            raise ValidationError({'questions': error.detail})
+
     def create(self, validated_data) -> Quiz:
         questions : CollectedDict = validated_data.pop('questions', [])
         quiz : Quiz = super().create(validated_data)
@@ -128,23 +193,90 @@ class QuizSerializer(serializers.ModelSerializer):
         return quiz
 
     def update(self, instance, validated_data) -> Quiz:
-        questions : CollectedDict = validated_data.pop('questions', [])
-        quiz : Quiz = super().update(instance, validated_data)
+        questions : CollectedDict = validated_data.pop('questions', None)
 
-        # get list of all the questions that needs to be created & questions that just needs to be updated
-        # check for the slugs, if they have slug then update question else create question with that data
-        create_question_data : CollectedDict = list(filter(lambda x: 'slug' not in dict(x).keys(), questions))
-        update_question_data : CollectedDict = list(filter(lambda x: 'slug' in dict(x).keys(), questions))
+        with transaction.atomic():
+            quiz : Quiz = super().update(instance, validated_data)
 
-        create_question_instance = list(map(lambda x: Question(quiz=quiz, **x), create_question_data))
+            if questions is not None:
+                # a full update describes every question of the quiz,
+                # the ones left out of it are removed
+                self.sync_report = self.sync_questions(quiz, questions, remove_missing=not self.partial)
 
-        # bulk create questions
-        Question.objects.bulk_create(create_question_instance)
+        return quiz
 
-        # update all the questions with slug
-        map(lambda q: Question.objects.filter(slug=q.pop('slug')).update(**q), update_question_data)
+    def sync_questions(self, quiz : Quiz, questions : CollectedDict, remove_missing : bool) -> Dict[str, List[str]]:
+        """
+            Diff the nested questions of the payload against the questions
+            of the quiz, loaded once, by slug. Questions without a slug are
+            created, changed ones are updated & with `remove_missing` the
+            ones absent from the payload are deleted, with one statement
+            each.
+        """
+        existing : Dict[str, Question] = {
+            str(question.slug): question for question in Question.objects.filter(quiz=quiz)
+        }
 
-        return quiz
+        slugs = [str(data['slug']) for data in questions if 'slug' in data]
+
+        if len(set(slugs)) != len(slugs):
+            raise ValidationError({'questions': ['a question can only be listed once.']})
+
+        if unknown := [slug for slug in slugs if slug not in existing]:
+            raise ValidationError({'questions': [
+                'questions %s do not belong to this quiz.' % ', '.join(unknown)
+            ]})
+
+        created, updated, changed_fields = [], [], set()
+        now = timezone.now()
+
+        for data in questions:
+            data = dict(data)
+
+            if 'slug' not in data:
+                # the fields of a nested question are optional in a partial update
+                if missing := [field for field in self.REQUIRED_QUESTION_FIELDS if field not in data]:
+                    raise ValidationError({'questions': [
+                        'a new question requires %s.' % ', '.join(missing)
+                    ]})
+
+                created.append(Question(quiz=quiz, **data))
+                continue
+
+            question = existing[str(data.pop('slug'))]
+            changes = {field: value for field, value in data.items() if getattr(question, field) != value}
+
+            # the edit is checked merged with the stored question
+            self.check_question(
+                changes.get('question_type', question.question_type),
+                changes.get('answer', question.answer),
+            )
+
+            if changes:
+                for field, value in changes.items():
+                    setattr(question, field, value)
+
+                # `auto_now` is not applied by `bulk_update`
+                question.updated_at = now
+                changed_fields.update(changes.keys())
+                updated.append(question)
+
+        deleted = set(existing.keys()) - set(slugs) if remove_missing else set()
+
+        Question.objects.bulk_create(created)
+
+        if updated:
+            Question.objects.bulk_update(updated, [*changed_fields, 'updated_at'])
+
+        if deleted:
+            # the quiz itself was just saved, its `updated_at` moved past the delete
+            Question.objects.filter(quiz=quiz, slug__in=deleted).delete()
+
+        return {
+            'created': [str(question.slug) for question in created],
+            'updated': [str(question.slug) for question in updated],
+            'deleted': sorted(deleted),
+        }
 
 class UserTakenQuizSolutionSerializer(serializers.ModelSerializer):
     question = serializers.SlugField(
@@ -157,9 +289,85 @@ class UserTakenQuizSolutionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'is_correct']
         fields = ['id', 'question', 'answer', 'is_correct']
 
-    def validate(self, attrs : OrderedDict) -> OrderedDict:
-        attrs['answer'] = attrs.get('answer').lower()
-        question = Question.objects.get(slug=attrs.pop('question_slug'))
-        attrs['is_correct'] = question.answer == attrs.get('answer')
-        attrs['question'] = question
-        return attrs
+class SubmittedAnswerSerializer(serializers.ModelSerializer):
+    question = serializers.SlugField(required=True, source='question_slug')
+    answer = serializers.CharField(max_length=250)
+
+    class Meta:
+        model = QuestionSolution
+        read_only_fields = ['is_correct']
+        fields = ['question', 'answer', 'is_correct']
+
+class QuizSubmissionSerializer(serializers.Serializer):
+    """
+        Validates a whole submission as a set, all the question slugs
+        are resolved with a single `IN` query against the quiz passed
+        in the context & the graded solutions are written with one
+        `bulk_create` inside a single transaction.
+    """
+    score = serializers.FloatField(read_only=True)
+    answers = SubmittedAnswerSerializer(many=True, allow_empty=False, source='graded_answers')
+
+    def validate_answers(self, answers : CollectedDict) -> List[QuestionSolution]:
+        quiz : Quiz = self.context['quiz']
+        slugs = [answer['question_slug'] for answer in answers]
+
+        if len(set(slugs)) != len(slugs):
+            raise ValidationError('a question can only be answered once.')
+
+        questions : Dict[str, Question] = {
+            question.slug: question for question in
+            Question.objects.filter(quiz=quiz, slug__in=slugs).only('id', 'slug', 'answer')
+        }
+
+        if missing := [slug for slug in slugs if slug not in questions]:
+            raise ValidationError(
+                'questions %s do not belong to this quiz.' % ', '.join(missing)
+            )
+
+        return [
+            QuestionSolution.grade(questions[answer['question_slug']], answer['answer'])
+            for answer in answers
+        ]
+
+    def create(self, validated_data : OrderedDict) -> TakenQuiz:
+        solutions : List[QuestionSolution] = validated_data['graded_answers']
+        taken_quiz = TakenQuiz.finalise(
+            self.context['quiz'], self.context['user'], solutions
+        )
+
+        taken_quiz.graded_answers = solutions
+        return taken_quiz
+
+class QueuedSubmissionSerializer(serializers.ModelSerializer):
+    """
+        Shape only validation of a submission for the write-behind
+        queue, nothing is looked up here, questions are resolved &
+        graded later on by `PendingSubmission.drain`
+    """
+    answers = SubmittedAnswerSerializer(many=True, allow_empty=False, write_only=True)
+
+    class Meta:
+        model = PendingSubmission
+        read_only_fields = ['receipt', 'status', 'error']
+        fields = ['receipt', 'status', 'error', 'answers']
+
+    @retry_on_locked
+    def create(self, validated_data : OrderedDict) -> PendingSubmission:
+        return PendingSubmission.objects.create(
+            quiz=self.context['quiz'], user=self.context['user'],
+            answers=[
+                {'question': answer['question_slug'], 'answer': answer['answer']}
+                for answer in validated_data['answers']
+            ]
+        )
+
+class LeaderboardEntrySerializer(serializers.ModelSerializer):
+    rank = serializers.ReadOnlyField()
+    user = serializers.ReadOnlyField(source='user.username')
+
+    class Meta:
+        model = TakenQuiz
+        fields = ['rank', 'user', 'score', 'taken_on']
+        read_only_fields = fields
+
@@ -0,0 +1,36 @@
+import gzip
+
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from quiz.models import Quiz, QuizSnapshot
+from quiz.serializers import ParticipantQuizSerializer
+
+def publish_quiz(quiz : Quiz) -> QuizSnapshot:
+    """
+        Render the participant view of a quiz once into JSON bytes &
+        a gzip copy, `retrieve` sends them as is to participants
+    """
+    body = JSONRenderer().render(ParticipantQuizSerializer(instance=quiz).data)
+
+    snapshot, _ = QuizSnapshot.objects.update_or_create(quiz=quiz, defaults={
+        'body': body,
+        # fixed mtime, the same content always compresses to the same bytes
+        'body_gzip': gzip.compress(body, compresslevel=9, mtime=0),
+    })
+
+    return snapshot
+
+def snapshot_response(request, snapshot : QuizSnapshot) -> HttpResponse:
+    accepts_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    response = HttpResponse(
+        bytes(snapshot.body_gzip if accepts_gzip else snapshot.body),
+        content_type='application/json'
+    )
+
+    if accepts_gzip:
+        response['Content-Encoding'] = 'gzip'
+
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
@@ -1,10 +1,28 @@
+import gzip
+from datetime import timedelta
+import json
+import tempfile
+from io import StringIO
+from helper.pagination import KeysetPagination
 from helper.utils import TestEssentials
-from quiz.models import Question, Quiz, TakenQuiz
+from quiz.cache import bump_quiz_version, cached_quiz_payload
+from quiz.views import QuizViewSet
+from quiz.models import (
+    PendingSubmission, Question, QuestionSolution,
+    QuestionStats, Quiz, QuizSnapshot, ScoreBucket, TakenQuiz
+)
 from accounts.models import User
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, TestCase, override_settings
+from django.utils import timezone
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.test import APIClient
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
 
 # Create your tests here.
 class QuizTest(TestCase, TestEssentials):
@@ -16,8 +34,8 @@ class QuizTest(TestCase, TestEssentials):
     def get_quiz_data(self) -> dict:
         return {
             'name': 'First Test Quiz',
-            'schedule_date': '2020-02-23 11:15:23',
-            'end_date': '2020-02-28 23:59:59',
+            'schedule_date': timezone.now() - timedelta(days=1),
+            'end_date': timezone.now() + timedelta(days=1),
             'description': 'This is the first quiz',
             'time_per_question': 10,
             'questions': [
@@ -73,6 +91,325 @@ class QuizTest(TestCase, TestEssentials):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(quiz.questions.count(), 3)
 
+    def test_quiz_update_syncs_questions(self) -> None:
+        self.make_user_admin(self.jwt_login)
+
+        response : Response = self.client.post(
+            '/api/v1/quizzes/', self.get_quiz_data,
+            format='json'
+        )
+
+        url = '/api/v1/quizzes/%s/' % response.data.get('id')
+        first, second = response.data['questions']
+
+        response : Response = self.client.patch(url, {
+            'questions': [
+                {'id': first['id'], 'question_text': 'Edited', 'question_type': 'mcq', 'answer': 'c'},
+                {'id': second['id'], 'question_text': second['question_text'], 'question_type': 'open_text', 'answer': 'final'},
+                {'question_text': 'Third', 'question_type': 'mcq', 'answer': 'a'},
+            ]
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['questions_sync']['updated'], [first['id']])
+        self.assertEqual(len(response.data['questions_sync']['created']), 1)
+        self.assertEqual(response.data['questions_sync']['deleted'], [])
+        self.assertEqual(Question.objects.get(slug=first['id']).question_text, 'Edited')
+
+        data = self.get_quiz_data
+        data['questions'] = [
+            {'id': first['id'], 'question_text': 'Edited', 'question_type': 'mcq', 'answer': 'c'},
+        ]
+        response : Response = self.client.put(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['questions_sync']['updated'], [])
+        self.assertEqual(len(response.data['questions_sync']['deleted']), 2)
+        self.assertEqual([question['id'] for question in response.data['questions']], [first['id']])
+
+        data['questions'] = [
+            {'id': 'not-a-question', 'question_text': 'Edited', 'question_type': 'mcq', 'answer': 'c'},
+        ]
+        response : Response = self.client.put(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Question.objects.filter(slug=first['id']).count(), 1)
+
+        # partial edits are checked merged with the stored question
+        response : Response = self.client.patch(url, {'questions': [{'id': first['id'], 'answer': 'zzz'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Question.objects.get(slug=first['id']).answer, 'c')
+
+        response : Response = self.client.patch(url, {'questions': [{'question_text': 'No type'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # nested edits leaving out the answer are merged with the stored one
+        response : Response = self.client.patch(url, {'questions': [{'id': first['id'], 'question_type': 'mcq'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response : Response = self.client.patch(url, {'questions': [{'question_text': 'Bad', 'question_type': 'mcq', 'answer': 'z'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response : Response = self.client.patch(
+            '/api/v1/questions/%s/' % first['id'], {'question_text': 'Renamed'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response : Response = self.client.patch(
+            '/api/v1/questions/%s/' % first['id'], {'answer': 'zzz'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_quiz_import_questions(self) -> None:
+        self.make_user_admin(self.jwt_login)
+
+        quiz_slug = self.client.post(
+            '/api/v1/quizzes/', self.get_quiz_data,
+            format='json'
+        ).data.get('id')
+
+        upload = SimpleUploadedFile('bank.csv', (
+            'question_text,question_type,answer\n'
+            'Imported MCQ,mcq,B\n'
+            'Bad option,mcq,z\n'
+            'Imported Text,open_text,hello\n'
+        ).encode())
+
+        response : Response = self.client.post(
+            '/api/v1/quizzes/%s/import_questions/' % quiz_slug,
+            {'file': upload}, format='multipart'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 1))
+        self.assertEqual(response.data['errors'][0]['row'], 3)
+        self.assertEqual(Question.objects.get(question_text='Imported MCQ').answer, 'b')
+
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as bank:
+            bank.write('{"question_text": "Line", "question_type": "mcq", "answer": "a"}\n')
+            bank.write('not json\n')
+            bank.write('{"question_text": "Line", "question_type": "essay", "answer": "a"}\n')
+            bank.flush()
+
+            out = StringIO()
+            call_command('import_questions', quiz_slug, bank.name, chunk_size=1, stdout=out)
+
+        self.assertIn('Imported 1 questions, 2 rows failed!', out.getvalue())
+        self.assertEqual(Quiz.objects.get(slug=quiz_slug).questions.count(), 5)
+
+        # an existing slug is not reused & bad bytes fail their row only
+        existing = Question.objects.get(question_text='Imported MCQ').slug
+        uploads = [
+            SimpleUploadedFile('bank.jsonl', (
+                '{"id": "%s", "question_text": "Copy", "question_type": "mcq", "answer": "a"}\n' % existing
+            ).encode()),
+            SimpleUploadedFile('bank.csv', (
+                b'question_text,question_type,answer\n'
+                b'Broken \xff,mcq,a\n'
+                b'Fine,mcq,a\n'
+            )),
+        ]
+
+        for upload, failed in zip(uploads, [0, 1]):
+            response = self.client.post(
+                '/api/v1/quizzes/%s/import_questions/' % quiz_slug,
+                {'file': upload}, format='multipart'
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual((response.data['created'], response.data['failed']), (1, failed))
+
+        self.assertEqual(Quiz.objects.get(slug=quiz_slug).questions.count(), 7)
+
+    def test_quiz_retrieve_cached(self) -> None:
+        self.make_user_admin(self.jwt_login)
+
+        quiz_slug = self.client.post(
+            '/api/v1/quizzes/', self.get_quiz_data,
+            format='json'
+        ).data.get('id')
+
+        url = '/api/v1/quizzes/%s/' % quiz_slug
+        first : Response = self.client.get(url)
+
+        # the user is cached by the token authentication, only the
+        # quiz is looked up & the payload comes from the cache
+        with self.assertNumQueries(1):
+            second : Response = self.client.get(url)
+
+        self.assertEqual(first.data, second.data)
+
+        self.client.patch(url, {'description': 'updated'}, format='json')
+        response : Response = self.client.get(url)
+        self.assertEqual(response.data['description'], 'updated')
+
+        question_slug = response.data['questions'][0]['id']
+        self.client.delete('/api/v1/questions/%s/' % question_slug)
+        response : Response = self.client.get(url)
+        self.assertEqual(len(response.data['questions']), 1)
+
+    def test_participant_payload_outlives_submissions(self) -> None:
+        self.make_user_admin(self.jwt_login)
+        quiz = Quiz.objects.get(slug=self.client.post(
+            '/api/v1/quizzes/', self.get_quiz_data, format='json'
+        ).data.get('id'))
+
+        builds = []
+        build = lambda: builds.append(1) or {}
+        fetch = lambda: [cached_quiz_payload(quiz, audience, build) for audience in ['participant', 'admin']]
+
+        fetch()
+        # a submission only moves the stats, only the admin payload has them
+        bump_quiz_version(quiz.id)
+        fetch()
+        self.assertEqual(len(builds), 3)
+
+        QuizSnapshot.invalidate(quiz.id)
+        fetch()
+        self.assertEqual(len(builds), 5)
+
+    def test_quiz_publish(self) -> None:
+        self.make_user_admin(self.jwt_login)
+
+        quiz_slug = self.client.post(
+            '/api/v1/quizzes/', self.get_quiz_data,
+            format='json'
+        ).data.get('id')
+
+        response : Response = self.client.post('/api/v1/quizzes/%s/publish/' % quiz_slug)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(QuizSnapshot.objects.filter(quiz__slug=quiz_slug).exists())
+
+        participant = APIClient()
+        participant.force_authenticate(User.objects.create_user(
+            username='participant', password='password'
+        ))
+
+        response = participant.get('/api/v1/quizzes/%s/' % quiz_slug)
+        data = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(data['questions']), 2)
+        self.assertNotIn('answer', data['questions'][0])
+
+        response = participant.get('/api/v1/quizzes/%s/' % quiz_slug, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), data)
+
+        # any edit of the content drops the snapshot
+        self.client.patch('/api/v1/quizzes/%s/' % quiz_slug, {'description': 'updated'}, format='json')
+        self.assertFalse(QuizSnapshot.objects.filter(quiz__slug=quiz_slug).exists())
+
+        response = participant.get('/api/v1/quizzes/%s/' % quiz_slug)
+        self.assertEqual(response.data['description'], 'updated')
+        self.assertNotIn('answer', response.data['questions'][0])
+
+    def test_quiz_conditional_retrieve(self) -> None:
+        self.make_user_admin(self.jwt_login)
+
+        quiz_slug = self.client.post(
+            '/api/v1/quizzes/', self.get_quiz_data,
+            format='json'
+        ).data.get('id')
+
+        url = '/api/v1/quizzes/%s/' % quiz_slug
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):
+            response : Response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        question = Question.objects.filter(quiz__slug=quiz_slug).first()
+        self.client.patch(
+            '/api/v1/questions/%s/' % question.slug, {
+                'question_text': 'Edited', 'question_type': 'mcq', 'answer': 'a'
+            }, format='json'
+        )
+
+        response : Response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        participant = APIClient()
+        participant.force_authenticate(User.objects.create_user(
+            username='participant', password='password'
+        ))
+
+        response : Response = participant.get(url)
+        response : Response = participant.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        question_url = '/api/v1/questions/%s/' % question.slug
+        etag = participant.get(question_url)['ETag']
+        response : Response = participant.get(question_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        participant.post(
+            '/api/v1/quizzes/%s/user_submit/' % quiz_slug, {
+                'answers': [{'question': question.slug, 'answer': 'a'}]
+            }, format='json'
+        )
+
+        # the stats of the question changed
+        response : Response = participant.get(question_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # a deleted question leaves no newer timestamp, the quiz is touched
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Quiz.objects.filter(slug=quiz_slug).update(updated_at=an_hour_ago)
+        Question.objects.filter(quiz__slug=quiz_slug).update(updated_at=an_hour_ago)
+        last_modified = participant.get(url)['Last-Modified']
+
+        with self.assertNumQueries(1):
+            response : Response = participant.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.delete(question_url)
+        response : Response = participant.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_quiz_list_schedule_filters(self) -> None:
+        self.make_user_admin(self.jwt_login)
+        today = timezone.now()
+
+        for name, offset in [('Live Quiz', 0), ('Upcoming Quiz', 10), ('Ended Quiz', -10)]:
+            data = self.get_quiz_data
+            data.update({
+                'name': name,
+                'schedule_date': today + timedelta(days=offset - 1),
+                'end_date': today + timedelta(days=offset + 1),
+            })
+            self.client.post('/api/v1/quizzes/', data, format='json')
+
+        def names(query : str) -> list:
+            response : Response = self.client.get('/api/v1/quizzes/?%s' % query)
+            return sorted(quiz['name'] for quiz in response.data['results'])
+
+        self.assertEqual(names('status=live'), ['Live Quiz'])
+        self.assertEqual(names('status=upcoming'), ['Upcoming Quiz'])
+        self.assertEqual(names('status=ended'), ['Ended Quiz'])
+        self.assertEqual(
+            names('from=%s' % (today + timedelta(days=5)).date()),
+            ['Upcoming Quiz']
+        )
+        self.assertEqual(
+            names('from=%s&to=%s' % ((today - timedelta(days=10)).date(), today.date())),
+            ['Ended Quiz', 'Live Quiz']
+        )
+
+        response : Response = self.client.get('/api/v1/quizzes/')
+        self.assertEqual(
+            {quiz['name']: quiz['is_live'] for quiz in response.data['results']},
+            {'Live Quiz': True, 'Upcoming Quiz': False, 'Ended Quiz': False}
+        )
+
+        response : Response = self.client.get('/api/v1/quizzes/?status=soon')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # well formed but impossible dates
+        for query in ['from=2021-02-30', 'to=2021-01-01T25:00:00', 'from=garbage']:
+            response = self.client.get('/api/v1/quizzes/?%s' % query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 class QuizTakenTest(TestCase, TestEssentials):
 
     def setUp(self) -> None:
@@ -82,8 +419,8 @@ class QuizTakenTest(TestCase, TestEssentials):
     def get_quiz_data(self) -> dict:
         return {
             'name': 'First Test Quiz',
-            'schedule_date': '2020-02-23 11:15:23',
-            'end_date': '2020-02-28 23:59:59',
+            'schedule_date': timezone.now() - timedelta(days=1),
+            'end_date': timezone.now() + timedelta(days=1),
             'description': 'This is the first quiz',
             'time_per_question': 10,
             'questions': [
@@ -132,4 +469,324 @@ class QuizTakenTest(TestCase, TestEssentials):
         taken_quiz = TakenQuiz.objects.get(user=user, quiz=quiz)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(taken_quiz.score, 1) # since one answer is incorrect
+        self.assertEqual(response.data['score'], 1)
+        self.assertEqual(
+            [answer['is_correct'] for answer in response.data['answers']],
+            [False, True]
+        )
+
+    @override_settings(ASYNC_DB_WORKERS=0)
+    async def test_take_quiz_async(self) -> None:
+        user = await sync_to_async(self.make_user_admin)(self.jwt_login)
+        response = await sync_to_async(self.client.post)(
+            '/api/v1/quizzes/', self.get_quiz_data, format='json'
+        )
+
+        quiz_slug = response.data.get('id')
+        question_slug = response.data['questions'][1]['id']
+        client = AsyncClient()
+        auth = {'authorization': 'Bearer %s' % RefreshToken.for_user(user).access_token}
+
+        response = await client.get('/api/v1/async/quizzes/%s/' % quiz_slug, **auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', response)
+        self.assertEqual(len(response.json()['questions']), 2)
+
+        response = await client.get('/api/v1/async/questions/%s/' % question_slug, **auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = await client.post(
+            '/api/v1/async/quizzes/%s/user_submit/' % quiz_slug,
+            {'answers': [{'question': question_slug, 'answer': 'final'}]},
+            content_type='application/json', **auth
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['score'], 1)
+
+        response = await client.get('/api/v1/async/quizzes/%s/user_answers/' % quiz_slug, **auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]['is_correct'], True)
+
+        # errors are rendered like the ones of the sync views
+        response = await client.get('/api/v1/async/quizzes/%s/user_answers/' % quiz_slug)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = await client.get('/api/v1/async/quizzes/%s/user_submit/' % quiz_slug, **auth)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+        response = await client.get('/api/v1/async/quizzes/missing/', **auth)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_take_quiz_updates_stats(self) -> None:
+        self.make_user_admin(self.jwt_login)
+
+        response = self.client.post(
+            '/api/v1/quizzes/', self.get_quiz_data,
+            format='json'
+        )
+
+        quiz_slug = response.data.get('id')
+        mcq_question = Question.objects.get(question_text__startswith='First')
+        text_question = Question.objects.get(question_text__startswith='Second')
+
+        self.client.post(
+            '/api/v1/quizzes/%s/user_submit/' % quiz_slug, {
+                'answers': [
+                    {'question': mcq_question.slug, 'answer': 'C'},
+                    {'question': text_question.slug, 'answer': 'wrong'},
+                ]
+            }, format='json'
+        )
+
+        response : Response = self.client.get('/api/v1/questions/%s/' % mcq_question.slug)
+        self.assertEqual(response.data['stats'], {
+            'total_correct': 1, 'total_attempt': 1,
+            'mcq': {'total_a': 0, 'total_b': 0, 'total_c': 1},
+        })
+
+        # the counters of every question are moved by a single upsert
+        with self.assertNumQueries(1):
+            QuestionStats.record([
+                QuestionSolution.grade(mcq_question, 'a'),
+                QuestionSolution.grade(text_question, 'wrong'),
+            ])
+
+        stats = QuestionStats.objects.get(question=mcq_question)
+        self.assertEqual((stats.total_attempt, stats.total_correct, stats.total_a, stats.total_c), (2, 1, 1, 1))
+
+        QuestionStats.objects.all().delete()
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_question_stats', verify=True, stdout=StringIO())
+
+        call_command('rebuild_question_stats', stdout=StringIO())
+        self.assertEqual(QuestionStats.objects.get(question=text_question).total_attempt, 1)
+        self.assertEqual(QuestionStats.objects.get(question=text_question).total_correct, 0)
+
+    def test_take_quiz_rejects_foreign_question(self) -> None:
+        self.make_user_admin(self.jwt_login)
+
+        quiz_slug = self.client.post(
+            '/api/v1/quizzes/', self.get_quiz_data,
+            format='json'
+        ).data.get('id')
+
+        other_quiz_data = self.get_quiz_data
+        other_quiz_data['name'] = 'Second Test Quiz'
+        other_quiz_slug = self.client.post(
+            '/api/v1/quizzes/', other_quiz_data,
+            format='json'
+        ).data.get('id')
+
+        foreign_question = Question.objects.filter(quiz__slug=other_quiz_slug).first()
+
+        response : Response = self.client.post(
+            '/api/v1/quizzes/%s/user_submit/' % quiz_slug, {
+                'answers': [{'question': foreign_question.slug, 'answer': 'c'}]
+            }, format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(TakenQuiz.objects.exists())
+        self.assertFalse(QuestionSolution.objects.exists())
+
+    @override_settings(QUIZ_SUBMISSION_MODE='queue')
+    def test_take_quiz_queued(self) -> None:
+        user = self.make_user_admin(self.jwt_login)
+
+        quiz_slug = self.client.post(
+            '/api/v1/quizzes/', self.get_quiz_data,
+            format='json'
+        ).data.get('id')
+
+        submit_url = '/api/v1/quizzes/%s/user_submit/' % quiz_slug
+        data = {
+            'answers': [
+                {'question': question.slug, 'answer': 'c'}
+                for question in Question.objects.filter(quiz__slug=quiz_slug)
+            ]
+        }
+
+        response : Response = self.client.post(submit_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], PendingSubmission.STATUS_PENDING)
+        self.assertFalse(TakenQuiz.objects.exists())
+
+        # a queued attempt already counts as taken
+        response : Response = self.client.post(submit_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response : Response = self.client.get('/api/v1/quizzes/%s/user_answers/' % quiz_slug)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        call_command('drain_submissions', stdout=StringIO())
+
+        response : Response = self.client.get('/api/v1/quizzes/%s/user_answers/' % quiz_slug)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(TakenQuiz.objects.get(user=user).score, 1)
+        self.assertEqual(QuestionStats.objects.get(
+            question__question_text__startswith='First'
+        ).total_c, 1)
+
+    def test_leaderboard(self) -> None:
+        self.make_user_admin(self.jwt_login)
+
+        quiz_slug = self.client.post(
+            '/api/v1/quizzes/', self.get_quiz_data,
+            format='json'
+        ).data.get('id')
+
+        first = Question.objects.get(quiz__slug=quiz_slug, question_text__startswith='First')
+        second = Question.objects.get(quiz__slug=quiz_slug, question_text__startswith='Second')
+
+        clients = {}
+        for username, answers in [('both', ['c', 'final']), ('one', ['c', 'x']), ('tie', ['a', 'final']), ('none', ['a', 'x'])]:
+            clients[username] = APIClient()
+            clients[username].force_authenticate(User.objects.create_user(username=username, password='password'))
+            clients[username].post(
+                '/api/v1/quizzes/%s/user_submit/' % quiz_slug, {
+                    'answers': [
+                        {'question': first.slug, 'answer': answers[0]},
+                        {'question': second.slug, 'answer': answers[1]},
+                    ]
+                }, format='json'
+            )
+
+        response : Response = self.client.get('/api/v1/quizzes/%s/leaderboard/?limit=3' % quiz_slug)
+        self.assertEqual(response.data['total'], 4)
+        self.assertEqual(
+            [(entry['rank'], entry['user']) for entry in response.data['results']],
+            [(1, 'both'), (2, 'one'), (2, 'tie')]
+        )
+
+        response : Response = clients['none'].get('/api/v1/quizzes/%s/my_rank/' % quiz_slug)
+        self.assertEqual((response.data['rank'], response.data['score'], response.data['total']), (4, 0, 4))
+
+        response : Response = self.client.get('/api/v1/quizzes/%s/my_rank/' % quiz_slug)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        ScoreBucket.objects.all().delete()
+        call_command('rebuild_leaderboards', stdout=StringIO())
+        response : Response = clients['tie'].get('/api/v1/quizzes/%s/my_rank/' % quiz_slug)
+        self.assertEqual(response.data['rank'], 2)
+
+        # the attempts of a deleted user are taken out of the counters
+        User.objects.get(username='both').delete()
+        response : Response = clients['tie'].get('/api/v1/quizzes/%s/my_rank/' % quiz_slug)
+        self.assertEqual((response.data['rank'], response.data['total']), (1, 3))
+
+        response : Response = self.client.get('/api/v1/quizzes/%s/leaderboard/' % quiz_slug)
+        self.assertEqual(response.data['total'], 3)
+
+        stats = QuestionStats.objects.get(question=first)
+        self.assertEqual((stats.total_attempt, stats.total_correct, stats.total_a, stats.total_c), (3, 1, 2, 1))
+
+    def test_analytics(self) -> None:
+        admin = self.make_user_admin(self.jwt_login)
+
+        quiz_slug = self.client.post(
+            '/api/v1/quizzes/', self.get_quiz_data,
+            format='json'
+        ).data.get('id')
+
+        quiz = Quiz.objects.get(slug=quiz_slug)
+        first = Question.objects.get(quiz=quiz, question_text__startswith='First')
+        second = Question.objects.get(quiz=quiz, question_text__startswith='Second')
+
+        for index, answers in enumerate([('c', 'final'), ('c', 'x'), ('a', 'x'), ('b', 'x')]):
+            TakenQuiz.finalise(quiz, User.objects.create_user(username='user_%d' % index), [
+                QuestionSolution.grade(first, answers[0]),
+                QuestionSolution.grade(second, answers[1]),
+            ])
+
+        response : Response = self.client.get('/api/v1/quizzes/%s/analytics/' % quiz_slug)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_attempts'], 4)
+        self.assertEqual(response.data['scores']['max'], 2)
+        self.assertEqual(response.data['scores']['p50'], 0.5)
+        self.assertEqual(
+            response.data['score_histogram'],
+            [{'score': 0, 'total': 2}, {'score': 1, 'total': 1}, {'score': 2, 'total': 1}]
+        )
+
+        mcq, open_text = response.data['questions']
+        self.assertEqual(mcq['difficulty'], 0.5)
+        self.assertEqual(mcq['discrimination'], 1.0)
+        self.assertEqual(mcq['options']['b'], {'total': 1, 'share': 0.25})
+        self.assertNotIn('options', open_text)
+
+        participant = APIClient()
+        participant.force_authenticate(User.objects.get(username='user_0'))
+        response : Response = participant.get('/api/v1/quizzes/%s/analytics/' % quiz_slug)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+class QueryPlanTest(TestCase, TestEssentials):
+    """
+        Every hot query of the api has to be answered by an index,
+        a plan regressing to a full table scan fails here
+    """
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username='test_user', password='password')
+        self.quiz = Quiz.objects.create(
+            name='Plan Quiz', created_by=self.user, updated_by=self.user,
+            schedule_date=timezone.now(), end_date=timezone.now()
+        )
+        self.question = Question.objects.create(
+            quiz=self.quiz, question_text='Plan', question_type='mcq', answer='a'
+        )
+        self.taken_quiz = TakenQuiz.objects.create(quiz=self.quiz, user=self.user)
+
+    def test_quiz_lookups(self) -> None:
+        self.assertUsesIndex(Quiz.objects.filter(slug=self.quiz.slug))
+        self.assertUsesIndex(
+            Quiz.objects.filter(slug=self.quiz.slug).annotate(
+                **Question.content_version_annotations()
+            ).select_related('snapshot')
+        )
+
+    def test_question_lookups(self) -> None:
+        self.assertUsesIndex(
+            Question.objects.select_related('quiz', 'answer_stats').filter(slug=self.question.slug)
+        )
+        self.assertUsesIndex(
+            Question.objects.filter(quiz=self.quiz, slug__in=[self.question.slug, 'other'])
+        )
+        self.assertUsesIndex(self.quiz.questions)
+
+    def test_taken_quiz_lookups(self) -> None:
+        self.assertUsesIndex(TakenQuiz.objects.filter(user=self.user, quiz=self.quiz))
+        self.assertUsesIndex(self.taken_quiz.answers)
+
+    def test_solution_stats_lookups(self) -> None:
+        solutions = QuestionSolution.objects.filter(question=self.question)
+        self.assertUsesIndex(solutions.filter(is_correct=True))
+        self.assertUsesIndex(solutions.filter(answer='a'))
+
+    def test_keyset_seek(self) -> None:
+        seek = KeysetPagination().get_seek_filter([self.quiz.created_at, self.quiz.id], reverse=False)
+        self.assertUsesIndex(Quiz.objects.filter(seek).order_by('created_at', 'id')[:10])
+
+        # the page of the list endpoint is read in index order, nothing
+        # past the cursor is joined or sorted before the limit
+        view = QuizViewSet(action='list', request=Request(APIRequestFactory().get('/')))
+        self.assertUsesIndex(view.get_queryset().filter(seek).order_by('created_at', 'id')[:10], ordered=True)
+
+    def test_schedule_filters(self) -> None:
+        today = timezone.now()
+        self.assertUsesIndex(Quiz.objects.filter(schedule_date__lte=today, end_date__gte=today))
+        self.assertUsesIndex(Quiz.objects.filter(schedule_date__gt=today))
+        self.assertUsesIndex(Quiz.objects.filter(schedule_date__lt=today, end_date__lt=today))
+
+    def test_leaderboard_lookups(self) -> None:
+        self.assertUsesIndex(
+            TakenQuiz.objects.filter(quiz=self.quiz).order_by(*TakenQuiz.LEADERBOARD_ORDERING)[:10]
+        )
+        self.assertUsesIndex(ScoreBucket.objects.filter(quiz=self.quiz, score__gt=1))
+
+    def test_submission_queue_head(self) -> None:
+        self.assertUsesIndex(
+            PendingSubmission.objects.filter(status=PendingSubmission.STATUS_PENDING).order_by('id')[:10]
+        )
+        self.assertUsesIndex(PendingSubmission.objects.filter(user=self.user, quiz=self.quiz))
 
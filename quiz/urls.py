@@ -10,4 +10,8 @@ router.register(r'quizzes', views.QuizViewSet, basename='quizzes')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('async/questions/<slug>/', views.async_question_retrieve, name='async-question-detail'),
+    path('async/quizzes/<slug>/', views.async_quiz_retrieve, name='async-quizzes-detail'),
+    path('async/quizzes/<slug>/user_submit/', views.async_quiz_user_submit, name='async-quizzes-user-submit'),
+    path('async/quizzes/<slug>/user_answers/', views.async_quiz_user_answers, name='async-quizzes-user-answers'),
 ]
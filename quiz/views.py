@@ -1,32 +1,61 @@
-from typing import List
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple, Union
 
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Prefetch, QuerySet
+from django.http import HttpResponse
 from rest_framework import status
 from rest_framework import permissions
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.serializers import Serializer
-from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.parsers import MultiPartParser
 
-from helper.viewsets import ModelViewSetWithoutList
+from helper.viewsets import (
+    ConditionalRetrieveMixin, KeysetPaginationMixin,
+    ModelViewSetWithoutList
+)
+from helper.executor import async_action, database_executor
 from helper.permissions import AdminUserOnly
 
-from quiz.exceptions import QuizNotTakenException
-from quiz.models import Question, Quiz, TakenQuiz
+from quiz.analytics import build_quiz_analytics
+from quiz.cache import bump_quiz_content_version, cached_quiz_payload, get_quiz_version
+from quiz.snapshots import publish_quiz, snapshot_response
+from quiz.exceptions import QuizAlreadyTakenException, QuizNotTakenException
+from quiz.filters import QuizScheduleFilter
+from quiz.imports import QuestionImporter
+from quiz.models import (
+    PendingSubmission, Question, Quiz,
+    QuizSnapshot, ScoreBucket, TakenQuiz
+)
 from quiz.permissions import IsQuizLive, IsQuizTaken
 from quiz.serializers import (
+    LeaderboardEntrySerializer,
+    ParticipantQuizSerializer,
     QuestionSerializer, QuizSerializer, 
+    QueuedSubmissionSerializer,
+    QuizSubmissionSerializer,
     QuizWithoutQuestionsSerializer, 
     UserTakenQuizSolutionSerializer
 )
 
 # Create your views here.
-class QuestionViewSet(ModelViewSetWithoutList):
+class QuestionViewSet(ConditionalRetrieveMixin, ModelViewSetWithoutList):
     lookup_field = 'slug'
-    queryset = Question.objects.all()
+    queryset = Question.objects.select_related('quiz', 'answer_stats')
     serializer_class = QuestionSerializer
 
+    def get_etag_parts(self, question : Question) -> List:
+        # the stats are part of the payload & already joined in
+        return [
+            question.slug, question.updated_at, question.quiz.slug,
+            *question.stats_counters,
+        ]
+
     def get_permissions(self) -> List:
         permission_classes = []
 
@@ -38,10 +67,49 @@ class QuestionViewSet(ModelViewSetWithoutList):
 
         return [permission() for permission in permission_classes]
 
-class QuizViewSet(ModelViewSet):
+    def perform_create(self, serializer) -> None:
+        question : Question = serializer.save()
+        QuizSnapshot.invalidate(question.quiz_id)
+
+    def perform_update(self, serializer) -> None:
+        question : Question = serializer.save()
+        QuizSnapshot.invalidate(question.quiz_id)
+
+    def perform_destroy(self, instance : Question) -> None:
+        instance.delete()
+        Quiz.touch(instance.quiz_id)
+        QuizSnapshot.invalidate(instance.quiz_id)
+
+class QuizViewSet(ConditionalRetrieveMixin, KeysetPaginationMixin, ModelViewSet):
     lookup_field = 'slug'
     queryset = Quiz.objects.all()
     pagination_class = LimitOffsetPagination
+    filter_backends = [QuizScheduleFilter]
+    keyset_fields = ('created_at', 'id')
+    max_leaderboard_size = 100
+
+    def get_queryset(self) -> QuerySet:
+        queryset = super().get_queryset()
+
+        if self.action == 'list':
+            # the questions are counted from the prefetch, a count joined
+            # in would group & sort every row past the keyset seek
+            queryset = queryset.annotate(**Quiz.live_annotation()).prefetch_related(
+                Prefetch('question_set', Question.objects.only('quiz_id', 'slug'))
+            )
+
+        if self.action == 'retrieve':
+            # everything needed to answer a conditional request
+            # is fetched along with the quiz in a single query
+            queryset = queryset.annotate(**Question.content_version_annotations())
+
+            if not self.request.user.is_superuser:
+                # the bodies are only loaded once the request is not a 304
+                queryset = queryset.select_related('snapshot').defer(
+                    'snapshot__body', 'snapshot__body_gzip'
+                )
+
+        return queryset
 
     def get_serializer_class(self) -> Serializer:
         if self.action == 'list':
@@ -51,6 +119,9 @@ class QuizViewSet(ModelViewSet):
             """
             return QuizWithoutQuestionsSerializer
 
+        if self.action == 'retrieve' and not self.request.user.is_superuser:
+            return ParticipantQuizSerializer
+
         if self.action in ['retrieve', 'create', 'update', 'partial_update', 'destroy']:
             return QuizSerializer
 
@@ -60,7 +131,7 @@ class QuizViewSet(ModelViewSet):
         if self.action == 'list':
             permission_classes = [IsAuthenticated]
         
-        if self.action == 'user_answers':
+        if self.action in ['user_answers', 'leaderboard', 'my_rank']:
             permission_classes = [IsAuthenticated]
 
         if self.action == 'user_submit':
@@ -69,9 +140,9 @@ class QuizViewSet(ModelViewSet):
         if self.action == 'retrieve':
             # a non admin user can only view the quiz 
             # questions when it's live
-            permission_classes = [IsQuizLive] if not self.request.user.is_superuser else [IsAdminUser]
+            permission_classes = [IsQuizLive] if not self.request.user.is_superuser else [AdminUserOnly]
 
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'publish', 'analytics', 'import_questions']:
             permission_classes = [AdminUserOnly]
 
         return [permission() for permission in permission_classes]
@@ -81,37 +152,238 @@ class QuizViewSet(ModelViewSet):
         serializer.save(created_by=user, updated_by=user)
 
     def perform_update(self, serializer) -> None:
-        serializer.save(updated_by=self.request.user)
+        quiz : Quiz = serializer.save(updated_by=self.request.user)
+        QuizSnapshot.invalidate(quiz.id)
+
+    def perform_destroy(self, instance : Quiz) -> None:
+        quiz_id = instance.id
+        instance.delete()
+        bump_quiz_content_version(quiz_id)
+
+    def get_etag_parts(self, quiz : Quiz) -> List:
+        parts = [
+            quiz.slug, quiz.updated_at,
+            quiz.questions_updated_at, quiz.questions_total,
+        ]
+
+        if self.request.user.is_superuser:
+            # admins get the stats & the live status as well
+            return ['admin', *parts, quiz.is_live, get_quiz_version(quiz.id)]
+
+        accepts_gzip = 'gzip' in self.request.META.get('HTTP_ACCEPT_ENCODING', '')
+        return ['participant', *parts, accepts_gzip and hasattr(quiz, 'snapshot')]
+
+    def get_last_modified(self, quiz : Quiz) -> Optional[datetime]:
+        # the participant view only changes along with the timestamps,
+        # the admin view also carries stats which have no timestamp
+        if self.request.user.is_superuser:
+            return None
+
+        return max(filter(None, [quiz.updated_at, quiz.questions_updated_at]))
+
+    def retrieve_response(self, request, quiz : Quiz) -> Response:
+        payload = self.retrieve_payload(request, quiz)
+        return payload if isinstance(payload, HttpResponse) else Response(payload)
+
+    def retrieve_payload(self, request, quiz : Quiz) -> Union[HttpResponse, dict]:
+        # the payload only changes with a new quiz version, concurrent
+        # requests of a live quiz are served from one cached copy
+        audience = 'admin' if request.user.is_superuser else 'participant'
+
+        if audience == 'participant':
+            try:
+                # published quizzes are sent as pre-rendered bytes
+                return snapshot_response(request, quiz.snapshot)
+            except QuizSnapshot.DoesNotExist:
+                pass
+
+        return cached_quiz_payload(
+            quiz, audience, lambda: self.get_serializer(quiz).data
+        )
+
+    @action(detail=True, methods=['post'])
+    def publish(self, request, slug) -> Response:
+        quiz : Quiz = self.get_object()
+        snapshot = publish_quiz(quiz)
+
+        return Response({
+            'id': quiz.slug,
+            'published_at': snapshot.published_at,
+            'size': len(snapshot.body),
+            'gzip_size': len(snapshot.body_gzip),
+        }, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'])
     def user_submit(self, request, slug) -> Response:
-        answers = request.data.get('answers', False)
+        if (errors := self.check_answers_present(request.data)) is not None:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
 
-        if not answers:
-            return Response(
-                {'expected_field' : ['expected field `answers` not present']}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        quiz : Quiz = self.get_object()
+        return Response(*self.submit(request, quiz))
+
+    def check_answers_present(self, data) -> Optional[dict]:
+        if not data.get('answers', False):
+            return {'expected_field' : ['expected field `answers` not present']}
+
+        return None
+
+    def submit(self, request, quiz : Quiz) -> Tuple[dict, int]:
+        """
+            Grade or queue the submission, the payload & status of
+            the response
+        """
+        context = {'quiz': quiz, 'user': request.user}
 
-        serializer = UserTakenQuizSolutionSerializer(data=answers, many=True)
+        if settings.QUIZ_SUBMISSION_MODE == 'queue':
+            # write-behind mode, only the shape of the payload is checked
+            # here, grading is done by the `drain_submissions` worker
+            serializer = QueuedSubmissionSerializer(data=request.data, context=context)
+            response_status = status.HTTP_202_ACCEPTED
+        else:
+            serializer = QuizSubmissionSerializer(data=request.data, context=context)
+            response_status = status.HTTP_200_OK
 
         if not serializer.is_valid():
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            return serializer.errors, status.HTTP_400_BAD_REQUEST
 
-        quiz : Quiz = self.get_object()
-        taken_quiz = TakenQuiz.objects.create(quiz=quiz, user=self.request.user)
-        serializer.save(taken_quiz=taken_quiz)
-        taken_quiz.save_total_score()
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        try:
+            serializer.save()
+        except IntegrityError:
+            # a concurrent submission of the same user won the race
+            raise QuizAlreadyTakenException
+
+        return serializer.data, response_status
 
     @action(detail=True, methods=['get'])
     def user_answers(self, request, slug) -> Response:
         quiz : Quiz = self.get_object()
+        return Response(*self.answers(request, quiz))
 
+    def answers(self, request, quiz : Quiz) -> Tuple[list, int]:
         try:
             taken_quiz = TakenQuiz.objects.get(quiz=quiz, user=request.user)
         except TakenQuiz.DoesNotExist:
-            raise QuizNotTakenException
+            return self.pending_answers(quiz)
 
         serializer = UserTakenQuizSolutionSerializer(instance=taken_quiz.answers, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return serializer.data, status.HTTP_200_OK
+
+    @action(detail=True, methods=['get'])
+    def leaderboard(self, request, slug) -> Response:
+        quiz : Quiz = self.get_object()
+
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), self.max_leaderboard_size))
+        except ValueError:
+            limit = 10
+
+        serializer = LeaderboardEntrySerializer(
+            instance=TakenQuiz.leaderboard(quiz, limit), many=True
+        )
+
+        return Response({
+            'total': ScoreBucket.attempts_of(quiz.id),
+            'results': serializer.data,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def my_rank(self, request, slug) -> Response:
+        quiz : Quiz = self.get_object()
+
+        try:
+            taken_quiz = TakenQuiz.objects.select_related('user').get(quiz=quiz, user=request.user)
+        except TakenQuiz.DoesNotExist:
+            raise QuizNotTakenException
+
+        data = LeaderboardEntrySerializer(instance=taken_quiz).data
+        data['total'] = ScoreBucket.attempts_of(quiz.id)
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def analytics(self, request, slug) -> Response:
+        # cached until the next submission or edit bumps the quiz version
+        quiz : Quiz = self.get_object()
+        data = cached_quiz_payload(quiz, 'analytics', lambda: build_quiz_analytics(quiz))
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], parser_classes=[MultiPartParser])
+    def import_questions(self, request, slug) -> Response:
+        quiz : Quiz = self.get_object()
+        upload = request.FILES.get('file', False)
+
+        if not upload:
+            return Response(
+                {'expected_field' : ['expected field `file` not present']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        format = request.data.get('format') or QuestionImporter.guess_format(upload.name)
+
+        if format not in QuestionImporter.FORMATS:
+            return Response(
+                {'format': ['valid values are : %s' % ', '.join(QuestionImporter.FORMATS)]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # large uploads are spooled to disk by django, the file
+        # is streamed from there one row at a time
+        upload.seek(0)
+        report = QuestionImporter(quiz).run(upload.file, format)
+        return Response(report, status=status.HTTP_200_OK)
+
+    def pending_answers(self, quiz : Quiz) -> Tuple[dict, int]:
+        """
+            Report the state of a queued submission which has not been
+            graded yet, or has been rejected by the worker
+        """
+        pending = PendingSubmission.objects.filter(
+            quiz=quiz, user=self.request.user
+        ).exclude(status=PendingSubmission.STATUS_PROCESSED).order_by('-id').first()
+
+        if pending is None:
+            raise QuizNotTakenException
+
+        serializer = QueuedSubmissionSerializer(instance=pending)
+
+        if pending.status == PendingSubmission.STATUS_PENDING:
+            return serializer.data, status.HTTP_202_ACCEPTED
+
+        return serializer.data, status.HTTP_422_UNPROCESSABLE_ENTITY
+
+# Async entry points of the participant hot path, mounted under `async/`
+# next to the sync routes so both can be benchmarked against each other.
+# Only the queries are run on the database executor
+
+async def conditional_retrieve(view : ConditionalRetrieveMixin, request, get_payload : Callable) -> HttpResponse:
+    instance = await database_executor.run(view.get_object)
+    response, etag, timestamp = view.conditional_response(request, instance)
+
+    if response is None:
+        payload = await database_executor.run(get_payload, request, instance)
+        response = payload if isinstance(payload, HttpResponse) else Response(payload)
+
+    return view.set_validators(response, etag, timestamp)
+
+@async_action(QuestionViewSet, 'get', 'retrieve')
+async def async_question_retrieve(view : QuestionViewSet, request, slug) -> HttpResponse:
+    # the stats are joined in by the lookup, serializing needs no query
+    return await conditional_retrieve(
+        view, request, lambda request, question: view.get_serializer(question).data
+    )
+
+@async_action(QuizViewSet, 'get', 'retrieve')
+async def async_quiz_retrieve(view : QuizViewSet, request, slug) -> HttpResponse:
+    return await conditional_retrieve(view, request, view.retrieve_payload)
+
+@async_action(QuizViewSet, 'post', 'user_submit')
+async def async_quiz_user_submit(view : QuizViewSet, request, slug) -> Response:
+    if (errors := view.check_answers_present(request.data)) is not None:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    quiz : Quiz = await database_executor.run(view.get_object)
+    return Response(*await database_executor.run(view.submit, request, quiz))
+
+@async_action(QuizViewSet, 'get', 'user_answers')
+async def async_quiz_user_answers(view : QuizViewSet, request, slug) -> Response:
+    quiz : Quiz = await database_executor.run(view.get_object)
+    return Response(*await database_executor.run(view.answers, request, quiz))
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 
 import environ
 import os
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 
@@ -65,17 +66,21 @@ INSTALLED_APPS = [
 
     'rest_framework',
 
-    'helper',
+    'helper.apps.HelperConfig',
     'accounts',
     'quiz',
 ]
 
 MIDDLEWARE = [
+    'helper.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'helper.db.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'accounts.middleware.JWTCookieApply',
+    'helper.profiling.ProfilingMiddleware',
+    'helper.instrumentation.QueryInstrumentationMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -106,7 +111,7 @@ AUTH_USER_MODEL = 'accounts.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -115,16 +120,104 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Auth config
+
+# users resolved from a token are kept in a per process LRU, bounded
+# in size & age, a save of the user drops its entry in every process
+# sharing the `default` cache. With `locmemcache` other processes keep
+# their entry until it ages out, set a shared `CACHE_URL` to run several
+AUTH_USER_CACHE_SIZE = env('AUTH_USER_CACHE_SIZE', int, default=1024)
+AUTH_USER_CACHE_TIMEOUT = env('AUTH_USER_CACHE_TIMEOUT', int, default=60)
+
+# the async login hashes passwords in a bounded pool off the event loop,
+# logins beyond the queue depth are answered with a 503
+AUTH_HASHING_WORKERS = env('AUTH_HASHING_WORKERS', int, default=4)
+AUTH_HASHING_QUEUE_DEPTH = env('AUTH_HASHING_QUEUE_DEPTH', int, default=64)
+
+# ids of the tokens revoked on logout, shared by the workers of a host
+TOKEN_REVOCATION_FILE = env(
+    'TOKEN_REVOCATION_FILE', str,
+    default=os.path.join(tempfile.gettempdir(), 'summachar-revoked-tokens.bin')
+)
+
+# Quiz config
+
+# upper bound in seconds of how long a rendered quiz payload is cached
+QUIZ_CACHE_TIMEOUT = env('QUIZ_CACHE_TIMEOUT', int, default=300)
+
+# `sync` grades & stores every submission within the request, `queue`
+# appends it to the write-behind queue drained by `drain_submissions`
+QUIZ_SUBMISSION_MODE = env('QUIZ_SUBMISSION_MODE', str, default='sync')
+
+# threads running the database work of the async views under ASGI,
+# 0 runs it on the thread shared with the sync views
+ASYNC_DB_WORKERS = env('ASYNC_DB_WORKERS', int, default=16)
+
+# every worker process writes its metrics to a file of `METRICS_DIR`,
+# summed by `/metrics`, the files of exited workers are folded into one.
+# Unset, the endpoint only reports its own process
+METRICS_DIR = env('METRICS_DIR', str, default='')
+METRICS_FLUSH_INTERVAL = env('METRICS_FLUSH_INTERVAL', float, default=5)
+
+# requests profiled on demand with the `X-Profile` header of a superuser,
+# or sampled at the rate of their route, e.g. {"quizzes-user-submit": 0.01},
+# the last `PROFILE_RING_SIZE` profiles are kept in `PROFILE_DIR`
+PROFILE_ROUTES = env.json('PROFILE_ROUTES', default={})
+PROFILE_DIR = env(
+    'PROFILE_DIR', str,
+    default=os.path.join(tempfile.gettempdir(), 'summachar-profiles')
+)
+PROFILE_RING_SIZE = env('PROFILE_RING_SIZE', int, default=50)
+PROFILE_SAMPLE_INTERVAL = env('PROFILE_SAMPLE_INTERVAL', float, default=0.005)
+
+# queries & database time of every request are sent back in a
+# `Server-Timing` header, statements run `SQL_REPEATED_QUERY_THRESHOLD`
+# times in a request & the ones slower than `SQL_SLOW_QUERY_MS` are
+# logged to `summachar.sql`, the slow ones with their query plan
+SQL_INSTRUMENTATION = env('SQL_INSTRUMENTATION', bool, default=True)
+SQL_SLOW_QUERY_MS = env('SQL_SLOW_QUERY_MS', float, default=100)
+SQL_REPEATED_QUERY_THRESHOLD = env('SQL_REPEATED_QUERY_THRESHOLD', int, default=5)
+
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# `helper.sqlite3` is sqlite in WAL mode with write transactions taking
+# the lock upfront, see `helper/sqlite3/base.py` for the pragmas
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': env('DATABASE_ENGINE', str, default='helper.sqlite3'),
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
 
+# write transactions failing on a locked sqlite database are retried
+# after a random backoff, doubling from `DATABASE_LOCK_RETRY_DELAY` seconds
+DATABASE_LOCK_RETRIES = env('DATABASE_LOCK_RETRIES', int, default=5)
+DATABASE_LOCK_RETRY_DELAY = env('DATABASE_LOCK_RETRY_DELAY', float, default=0.05)
+
+# read replicas, a comma separated list of database urls. Reads of the
+# safe requests go to one of them, tests mirror them onto `default`
+DATABASE_REPLICAS = []
+
+for index, url in enumerate(env.list('REPLICA_DATABASE_URLS', default=[])):
+    DATABASE_REPLICAS.append('replica_%d' % index)
+    DATABASES['replica_%d' % index] = {
+        **env.db_url_config(url), 'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['helper.db.ReplicaRouter']
+
+# seconds a user keeps reading from the primary after a write,
+# so the replication lag never hides the user's own writes
+REPLICA_STICKY_SECONDS = env('REPLICA_STICKY_SECONDS', int, default=10)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -16,7 +16,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from django.urls.conf import include
-from helper.views import ping
+from helper.views import metrics, ping, profile_detail, profiles
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -26,6 +26,9 @@ urlpatterns = [
         path('', include('quiz.urls')),
         path('admin/', admin.site.urls),
         path('ping/', ping, name='ping'),
+        path('metrics/', metrics, name='metrics'),
+        path('profiles/', profiles, name='profiles'),
+        path('profiles/<slug:profile_id>/', profile_detail, name='profile-detail'),
     ], 'api'), namespace='api')),
 ]
 